@@ -1,24 +1,42 @@
 
-from wxauto import WeChat
 import threading
 import time
+import clock
 import index
-from datetime import datetime
-import win32gui
-import win32con
-import win32process
-import psutil
+from poll_scheduler import AdaptivePollScheduler
+from session_probe import SessionChangeDetector
+from bot_logging import get_logger, setup_logging
+from tracing import tracer
 import os
 
+try:
+    import win32gui
+    import win32con
+    import win32process
+    import psutil
+    HAS_WIN32 = True
+except ImportError:
+    # 非Windows环境（例如使用模拟微信测试）没有窗口可激活
+    HAS_WIN32 = False
+
+logger = get_logger(__name__)
+
 class BackgroundWeChatMonitor:
     def __init__(self):
-        self.wx = WeChat()
+        # 与index共用同一个自动化执行线程，所有微信操作串行执行
+        self.automation = index.automation
         self.running = True
+        # 停止时设置，监控循环的休眠立即结束
+        self._stop_event = threading.Event()
         self.last_active_window = None
         self.wechat_hwnd = None
-        self.last_check_time = time.time()
-        self.last_summary_dates = {group_name: None for group_name in index.GROUP_NAMES}
+        self.last_check_time = clock.time()
         self.last_msg_ids = {}
+        # 按消息活跃度自适应调整轮询间隔
+        self.poll_scheduler = AdaptivePollScheduler(min_interval=index.POLL_MIN_INTERVAL,
+                                                    max_interval=index.POLL_MAX_INTERVAL)
+        # 根据会话列表的未读数和预览判断哪些群聊有变化
+        self.session_detector = SessionChangeDetector()
 
     def find_wechat_window(self):
         """查找微信窗口句柄"""
@@ -35,6 +53,8 @@ class BackgroundWeChatMonitor:
 
     def activate_wechat(self):
         """激活微信窗口"""
+        if not HAS_WIN32:
+            return True
         if not self.wechat_hwnd:
             self.wechat_hwnd = self.find_wechat_window()
         
@@ -50,7 +70,7 @@ class BackgroundWeChatMonitor:
 
     def restore_previous_window(self):
         """恢复之前的活动窗口"""
-        if self.last_active_window:
+        if HAS_WIN32 and self.last_active_window:
             try:
                 win32gui.SetForegroundWindow(self.last_active_window)
             except:
@@ -58,32 +78,54 @@ class BackgroundWeChatMonitor:
 
     def check_messages(self):
         """检查新消息并处理"""
+        # 读取一次会话列表，有变化的群聊立即检查
+        if self.automation.execute("sessions", self.session_detector.probe):
+            for group_name in self.session_detector.changed_groups(index.GROUP_NAMES):
+                self.poll_scheduler.poll_soon(group_name)
+        
+        # 只检查到了轮询时间且会话列表有变化的群聊
+        due_groups = []
+        for group_name in self.poll_scheduler.due_groups(index.GROUP_NAMES):
+            if self.session_detector.has_changed(group_name):
+                due_groups.append(group_name)
+            else:
+                self.session_detector.mark_skipped(group_name)
+                self.poll_scheduler.record(group_name, 0)
+        summary_due = index.summary_scheduler.next_delay() == 0
+        if not due_groups and self.last_msg_ids and not summary_due:
+            return
+        
         try:
             # 激活微信窗口
             if not self.activate_wechat():
-                print("无法找到或激活微信窗口")
+                logger.warning("无法找到或激活微信窗口")
                 return
             
             # 初始化last_msg_ids（如果为空）
             if not self.last_msg_ids:
                 for group_name in index.GROUP_NAMES:
-                    if not self.wx.ChatWith(who=group_name):
-                        print(f"找不到群聊: {group_name}")
+                    last_msgs = self.automation.fetch(group_name)
+                    if last_msgs is None:
+                        logger.warning("找不到群聊: %s", group_name)
                         continue
                     
-                    last_msgs = self.wx.GetAllMessage()
                     if last_msgs and len(last_msgs) > 0 and hasattr(last_msgs[-1], 'id'):
                         self.last_msg_ids[group_name] = last_msgs[-1].id
-                        print(f"设置 {group_name} 初始最后消息ID: {self.last_msg_ids[group_name]}")
+                        logger.debug("设置 %s 初始最后消息ID: %s", group_name, self.last_msg_ids[group_name])
             
             # 检查每个群的新消息
-            for group_name in index.GROUP_NAMES:
-                if not self.wx.ChatWith(who=group_name):
-                    print(f"找不到群聊: {group_name}")
+            for group_name in due_groups:
+                fetch_start = tracer.now()
+                with tracer.span("抓取", 群聊=group_name):
+                    current_msgs = self.automation.fetch(group_name)
+                if current_msgs is None:
+                    logger.warning("找不到群聊: %s", group_name)
+                    self.poll_scheduler.record(group_name, 0)
                     continue
                 
-                current_msgs = self.wx.GetAllMessage()
+                self.session_detector.mark_fetched(group_name)
                 if not current_msgs:
+                    self.poll_scheduler.record(group_name, 0)
                     continue
                 
                 # 检查是否有新消息
@@ -106,9 +148,17 @@ class BackgroundWeChatMonitor:
                     if current_msgs and len(current_msgs) > 0 and hasattr(current_msgs[-1], 'id'):
                         self.last_msg_ids[group_name] = current_msgs[-1].id
                     
+                    # 每条新消息分配追踪ID
+                    trace_ids = tracer.start_messages(group_name, new_msgs, fetch_start)
+                    
                     # 处理新消息
-                    for msg in new_msgs:
+                    order_msgs = []
+                    order_trace_ids = []
+                    mention_msgs = []
+                    for i, msg in enumerate(new_msgs):
+                        trace_id = trace_ids[i] if trace_ids else None
                         if not hasattr(msg, 'content'):
+                            tracer.message_span(trace_id, "跳过", tracer.now(), 原因="没有content属性")
                             continue
                         
                         msg_content = msg.content
@@ -116,26 +166,36 @@ class BackgroundWeChatMonitor:
                         
                         # 跳过机器人自己发送的消息
                         if msg_sender == 'self':
+                            tracer.message_span(trace_id, "跳过", tracer.now(), 原因="机器人自己发送")
                             continue
                         
-                        # 检查是否有人@机器人
+                        # 检查是否有人@机器人，订单入账后再回复
                         if index.is_bot_mentioned(msg_content):
-                            index.handle_mention(msg, group_name)
+                            mention_msgs.append((msg, clock.time(), trace_id))
                         
-                        # 检查是否有新订餐
-                        order_content, order_count = index.parse_order_message(msg_content)
-                        if order_content and order_count:
-                            # 实时保存订单
-                            orders = index.collect_orders(group_name)
-                            index.save_to_excel(orders, group_name)
+                        order_msgs.append(msg)
+                        order_trace_ids.append(trace_id)
+                    
+                    # 检查是否有新订餐，只将新消息增量加入台账
+                    order_traces = {}
+                    new_orders = index.ingest_new_messages(group_name, order_msgs,
+                                                           order_trace_ids if trace_ids else None, order_traces)
+                    if new_orders:
+                        # 写入订单日志，Excel由后台合并导出
+                        index.record_orders(new_orders, group_name, order_traces=order_traces)
+                    
+                    # 回复@消息
+                    for msg, detected_at, trace_id in mention_msgs:
+                        index.handle_mention(msg, group_name, detected_at, trace_id)
+                    
+                    self.poll_scheduler.record(group_name, len(new_msgs))
+                else:
+                    self.poll_scheduler.record(group_name, 0)
             
-            # 检查是否需要发送汇总
-            today = datetime.now().date()
-            for group_name in index.GROUP_NAMES:
-                if index.check_time_for_summary() and self.last_summary_dates.get(group_name) != today:
-                    if self.wx.ChatWith(who=group_name):
-                        index.send_summary(group_name)
-                        self.last_summary_dates[group_name] = today
+            # 发送到时间的定时汇总
+            # 每个群聊每天只发送一次，记录在检查点中，重启后不会重复发送
+            index.sync_summary_jobs(index.summary_scheduler)
+            index.summary_scheduler.run_pending()
         
         finally:
             # 恢复之前的窗口
@@ -143,29 +203,41 @@ class BackgroundWeChatMonitor:
 
     def run(self):
         """运行监控线程"""
-        print("后台微信监控已启动...")
+        setup_logging()
+        self._stop_event.clear()
+        logger.info("后台微信监控已启动...")
+        index.start_metrics_export()
         
         while self.running:
             try:
-                current_time = time.time()
+                current_time = clock.time()
                 # 每隔一段时间打印一次心跳信息
                 if current_time - self.last_check_time > 60:  # 每分钟打印一次
-                    print(f"监控心跳 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                    logger.info("监控心跳 - %s", clock.now().strftime('%Y-%m-%d %H:%M:%S'))
                     self.last_check_time = current_time
                 
                 # 检查新消息
                 self.check_messages()
                 
-                # 短暂休眠，避免过度占用CPU
-                time.sleep(10)  # 每10秒检查一次
+                # 休眠到下一个群聊需要轮询或下一个定时汇总的时间
+                sleep_time = self.poll_scheduler.sleep_time(index.GROUP_NAMES)
+                if self.session_detector.supported:
+                    sleep_time = min(sleep_time, index.SESSION_PROBE_INTERVAL)
+                next_summary = index.summary_scheduler.next_delay()
+                if next_summary is not None:
+                    sleep_time = min(sleep_time, next_summary)
+                clock.wait(self._stop_event, sleep_time)
                 
             except Exception as e:
-                print(f"监控过程中出错: {e}")
-                time.sleep(30)  # 出错后等待较长时间再重试
+                logger.error("监控过程中出错: %s", e)
+                clock.wait(self._stop_event, 30)  # 出错后等待较长时间再重试
 
     def stop(self):
         """停止监控"""
         self.running = False
+        self._stop_event.set()
+        # 写入等待中的订单
+        index.excel_writer.flush()
 
 # 创建GUI界面
 def create_gui():
@@ -213,8 +285,7 @@ def create_gui():
         try:
             if monitor.activate_wechat():
                 for group_name in index.GROUP_NAMES:
-                    if monitor.wx.ChatWith(who=group_name):
-                        index.send_summary(group_name)
+                    index.send_summary(group_name)
                 messagebox.showinfo("提示", "已手动发送汇总")
                 monitor.restore_previous_window()
         except Exception as e:
@@ -0,0 +1,301 @@
+"""订单热点路径基准测试
+
+使用模拟微信后端，在临时目录中运行，不会影响真实的订餐统计文件。
+覆盖：
+    parse_order_message / parse_orders_batch / is_bot_mentioned   每条消息的解析耗时
+    normalize_time                           消息时间换算（冷缓存和热缓存）
+    collect_orders                           1k/10k/50k条消息的聊天窗口
+    save_to_excel                            已有1/15/31个日期工作表的Excel
+    generate_summary                         内存统计和 from_excel=True
+
+结果写入JSON文件，可以用 --compare 和之前版本的结果对比：
+    python benchmarks/bench_hot_paths.py --output before.json
+    python benchmarks/bench_hot_paths.py --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GROUP_NAME = "英明中、晚饭订餐群"
+BOT_NAME = '良行上厨®快餐店订餐机器人'
+DISHES = ["红烧肉饭", "鱼香肉丝饭", "宫保鸡丁饭", "番茄炒蛋饭", "麻婆豆腐饭"]
+NAMES = ["张三", "李四", "王五", "赵六", "钱七", "孙八"]
+CHATTER = ["收到", "今天吃什么", "好的，谢谢", "我晚点再订", "老板今天有汤吗"]
+
+# 保存Excel基准使用的历史月份，避免和当天的数据混在一起
+EXCEL_MONTH = "2025-01"
+
+
+def _quiet():
+    """被测函数会打印大量日志，计时期间丢弃标准输出"""
+    return contextlib.redirect_stdout(open(os.devnull, "w", encoding="utf-8"))
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def make_contents(count, rng):
+    """生成订单、人员名单、@机器人和闲聊混合的消息内容"""
+    contents = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.4:
+            contents.append(f"{rng.choice(DISHES)}，共{rng.randint(1, 3)}份")
+        elif roll < 0.55:
+            people = rng.sample(NAMES, rng.randint(1, 4))
+            contents.append(f"{' '.join(people)}，共{len(people)}人")
+        elif roll < 0.65:
+            contents.append(f"@{BOT_NAME} 统计一下")
+        else:
+            contents.append(rng.choice(CHATTER))
+    return contents
+
+
+def make_times(count, rng):
+    """生成消息时间，和微信一样同一个时间标题在多条消息上重复"""
+    now = datetime.now()
+    headers = []
+    for _ in range(50):
+        hour, minute = rng.randint(0, 23), rng.randint(0, 59)
+        headers.append(rng.choice([
+            f"{now:%Y-%m-%d} {hour:02d}:{minute:02d}:00",
+            f"{now:%m-%d} {hour:02d}:{minute:02d}:00",
+            f"{now:%Y年%m月%d日} {hour}:{minute:02d}",
+            f"{hour}:{minute:02d}",
+            f"昨天 {hour}:{minute:02d}",
+            f"星期{rng.choice('一二三四五六日')} {hour}:{minute:02d}",
+        ]))
+    return [rng.choice(headers) for _ in range(count)]
+
+
+def make_orders(count, rng, prefix="同事", date=None):
+    """生成订单字典，发送人各不相同，不会被去重"""
+    send_time = f"{date} 11:30:00" if date else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    orders = []
+    for i in range(count):
+        if rng.random() < 0.2:
+            people = rng.sample(NAMES, rng.randint(1, 4))
+            content, portions, is_people = " ".join(people), len(people), True
+        else:
+            content, portions, is_people = rng.choice(DISHES), rng.randint(1, 3), False
+        orders.append({"发送人": f"{prefix}{i}", "订餐内容": content, "订餐份数": portions,
+                       "发送时间": send_time, "是否人员名单": is_people})
+    return orders
+
+
+def measure(name, params, func, rounds, setup=None, per_call=1):
+    """运行 rounds 次并统计耗时
+
+    Args:
+        func: 被测函数，setup 不为None时以 setup() 的返回值为参数
+        per_call: 每次调用处理的条目数，用于换算单条耗时
+    """
+    samples = []
+    with _quiet():
+        for _ in range(rounds):
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            func(arg) if setup else func()
+            samples.append(time.perf_counter() - start)
+    mean = statistics.mean(samples)
+    result = {
+        "name": name,
+        "params": params,
+        "rounds": rounds,
+        "per_call": per_call,
+        "mean_ms": round(mean * 1000, 4),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "min_ms": round(min(samples) * 1000, 4),
+        "max_ms": round(max(samples) * 1000, 4),
+        "stdev_ms": round(statistics.stdev(samples) * 1000, 4) if len(samples) > 1 else 0.0,
+        "ops_per_sec": round(per_call / mean, 2) if mean > 0 else None,
+    }
+    label = ", ".join(f"{key}={value}" for key, value in params.items())
+    print(f"{name}[{label}]: 中位数 {result['median_ms']:.3f}ms, "
+          f"最小 {result['min_ms']:.3f}ms, {result['ops_per_sec']}/s")
+    return result
+
+
+def bench_parsing(index, rounds, rng):
+    import message_time
+    from order_parser import parse_orders_batch
+
+    contents = make_contents(1000, rng)
+    times = make_times(1000, rng)
+    now = datetime.now()
+    return [
+        measure("normalize_time", {"messages": len(times), "cache": "cold"},
+                lambda _: [message_time.normalize_time(text, now) for text in times],
+                rounds, setup=message_time.clear_cache, per_call=len(times)),
+        measure("normalize_time", {"messages": len(times), "cache": "warm"},
+                lambda: [message_time.normalize_time(text, now) for text in times],
+                rounds, per_call=len(times)),
+        measure("parse_order_message", {"messages": len(contents)},
+                lambda: [index.parse_order_message(content) for content in contents],
+                rounds, per_call=len(contents)),
+        measure("parse_orders_batch", {"messages": len(contents)},
+                lambda: parse_orders_batch(contents), rounds, per_call=len(contents)),
+        measure("is_bot_mentioned", {"messages": len(contents)},
+                lambda: [index.is_bot_mentioned(content) for content in contents],
+                rounds, per_call=len(contents)),
+    ]
+
+
+def bench_collect_orders(index, sizes, rounds, rng):
+    from fake_wechat import FakeWeChat
+    from order_ledger import OrderLedger
+
+    results = []
+    for size in sizes:
+        fake = FakeWeChat(window_size=size, groups=[GROUP_NAME])
+        for i, content in enumerate(make_contents(size, rng)):
+            fake.add_message(GROUP_NAME, f"同事{i % 300}", content)
+        index.app.use_wechat(fake)
+
+        def fresh_ledger():
+            # 每轮从空台账开始，测的是完整重建
+            index.ledger = OrderLedger()
+
+        results.append(measure("collect_orders", {"messages": size},
+                               lambda _: index.collect_orders(GROUP_NAME), rounds,
+                               setup=fresh_ledger, per_call=size))
+    return results
+
+
+def bench_save_to_excel(index, sheet_counts, rounds, rng):
+    results = []
+    for sheets in sheet_counts:
+        group_name = f"基准测试群{sheets}"
+        with _quiet():
+            for day in range(1, sheets + 1):
+                date = f"{EXCEL_MONTH}-{day:02d}"
+                index.save_to_excel(make_orders(20, rng, date=date), group_name, date)
+        target = f"{EXCEL_MONTH}-{sheets:02d}"
+        batches = iter(range(1000000))
+
+        def new_orders():
+            # 每轮都是新的订单，保证确实会写入
+            return make_orders(5, rng, prefix=f"新同事{next(batches)}-", date=target)
+
+        results.append(measure("save_to_excel", {"sheets": sheets},
+                               lambda orders: index.save_to_excel(orders, group_name, target),
+                               rounds, setup=new_orders))
+    return results
+
+
+def bench_generate_summary(index, rounds, rng):
+    group_name = "基准测试汇总群"
+    orders = make_orders(1000, rng)
+    with _quiet():
+        index.journal.append(group_name, orders, index.get_today_date())
+    return [
+        measure("generate_summary", {"orders": len(orders), "from_excel": False},
+                lambda: index.generate_summary(orders, group_name), rounds),
+        measure("generate_summary", {"orders": len(orders), "from_excel": True},
+                lambda: index.generate_summary(orders, group_name, from_excel=True), rounds),
+    ]
+
+
+def compare(results, baseline_path):
+    """与之前保存的结果对比中位数"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def key(result):
+        return result["name"], json.dumps(result["params"], sort_keys=True, ensure_ascii=False)
+
+    previous = {key(result): result for result in baseline.get("results", [])}
+    print(f"\n与 {baseline_path}（{baseline.get('meta', {}).get('git_revision')}）对比：")
+    for result in results:
+        old = previous.get(key(result))
+        if not old or not old["median_ms"]:
+            continue
+        ratio = result["median_ms"] / old["median_ms"]
+        print(f"  {result['name']}{result['params']}: {old['median_ms']:.3f}ms -> "
+              f"{result['median_ms']:.3f}ms ({ratio:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="订单热点路径基准测试")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON结果文件")
+    parser.add_argument("--compare", metavar="JSON", help="与之前的结果文件对比")
+    parser.add_argument("--rounds", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--quick", action="store_true", help="只跑小规模数据，用于快速检查")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    rng = random.Random(args.seed)
+    collect_sizes = [1000] if args.quick else [1000, 10000, 50000]
+    sheet_counts = [1, 15] if args.quick else [1, 15, 31]
+
+    workdir = tempfile.mkdtemp(prefix="wxbot_bench_")
+    os.chdir(workdir)
+    os.environ["WXBOT_BACKEND"] = "fake"
+    os.environ.pop("WXBOT_TIMELINE", None)
+    sys.path.insert(0, REPO_DIR)
+
+    import_start = time.perf_counter()
+    with _quiet():
+        import index
+    # 机器人的日志由后台线程输出，计时结束后才打印会混进结果里
+    import bot_logging
+    bot_logging.set_console(False)
+    print(f"导入index耗时 {(time.perf_counter() - import_start) * 1000:.1f}ms，工作目录: {workdir}")
+
+    results = []
+    results += bench_parsing(index, args.rounds, rng)
+    results += bench_collect_orders(index, collect_sizes, args.rounds, rng)
+    results += bench_save_to_excel(index, sheet_counts, args.rounds, rng)
+    results += bench_generate_summary(index, args.rounds, rng)
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rounds": args.rounds,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+    with _quiet():
+        index.excel_writer.stop()
+        index.automation.stop()
+        index.journal.close()
+        bot_logging.shutdown_logging()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(workdir, ignore_errors=True)
+    sys.stdout.flush()
+    # index 的退出处理（保存检查点等）使用相对路径，离开临时目录后再执行会写入真实的订餐统计目录，直接退出
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""冷启动基准测试
+
+在新的Python进程中导入 index 和 gui_app，统计导入耗时和整个进程的耗时（取中位数），
+并检查导入没有副作用：不连接微信、不创建订餐统计目录和日志目录、不启动后台线程、
+不导入pandas、不创建定时汇总的调度。
+使用模拟微信后端，在临时目录中运行。
+
+    python benchmarks/cold_start.py --rounds 7 --target-ms 500
+
+超过 --target-ms（默认500ms）或发现导入副作用时以非零状态退出。
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子进程中执行：导入模块并报告耗时和副作用
+CHILD_CODE = r"""
+import json, os, sys, threading, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import index
+import bot_logging
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "pandas": "pandas" in sys.modules,
+    "save_dir": os.path.exists(index.SAVE_DIR),
+    "log_dir": os.path.exists(bot_logging.LOG_DIR),
+    "threads": [t.name for t in threading.enumerate() if t is not threading.main_thread()],
+    "created": [name for name in index._APP_ATTRIBUTES if index.app.created(name)],
+}}))
+"""
+
+
+def measure(module, workdir):
+    """在新进程中导入一次 module，返回子进程的报告和进程总耗时（毫秒）"""
+    env = dict(os.environ, WXBOT_BACKEND="fake", PYTHONPATH=REPO_DIR, PYTHONDONTWRITEBYTECODE="")
+    env.pop("WXBOT_TIMELINE", None)
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", CHILD_CODE.format(module=module)],
+                                     cwd=workdir, env=env, text=True, encoding="utf-8")
+    total_ms = (time.perf_counter() - start) * 1000
+    report = json.loads(output.strip().splitlines()[-1])
+    report["process_ms"] = total_ms
+    return report
+
+
+def side_effects(report):
+    problems = []
+    if report["pandas"]:
+        problems.append("导入了pandas")
+    if report["save_dir"]:
+        problems.append("创建了订餐统计目录")
+    if report["log_dir"]:
+        problems.append("创建了日志目录")
+    if report["threads"]:
+        problems.append(f"启动了线程 {', '.join(report['threads'])}")
+    if report["created"]:
+        problems.append(f"创建了 {', '.join(report['created'])}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准测试")
+    parser.add_argument("--rounds", type=int, default=5, help="每个模块启动的次数")
+    parser.add_argument("--target-ms", type=float, default=500, help="gui_app 进程耗时中位数上限（毫秒），0表示不检查")
+    parser.add_argument("--output", help="保存JSON结果的文件")
+    args = parser.parse_args()
+
+    failures = []
+    results = []
+    for module in ("index", "gui_app"):
+        reports = []
+        for _ in range(args.rounds):
+            # 每次使用新的工作目录，检查是否创建了目录
+            workdir = tempfile.mkdtemp(prefix="wxbot_cold_")
+            try:
+                reports.append(measure(module, workdir))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+        result = {
+            "module": module,
+            "import_median_ms": round(statistics.median(r["import_ms"] for r in reports), 1),
+            "process_median_ms": round(statistics.median(r["process_ms"] for r in reports), 1),
+            "side_effects": side_effects(reports[-1]),
+        }
+        results.append(result)
+        print(f"{module}: 导入 {result['import_median_ms']:.1f}ms，进程 {result['process_median_ms']:.1f}ms"
+              f"（{args.rounds}次中位数）")
+        for problem in result["side_effects"]:
+            failures.append(f"导入{module}时{problem}")
+
+    gui = results[-1]
+    if args.target_ms and gui["process_median_ms"] > args.target_ms:
+        failures.append(f"gui_app 启动耗时 {gui['process_median_ms']:.1f}ms > {args.target_ms:g}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "failures": failures}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+    if failures:
+        print("未达标:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("冷启动检查通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""午饭高峰负载模拟
+
+用模拟微信和加速时钟驱动 index.monitor_group，模拟多个群聊在短时间内
+收到大量订单和@机器人的消息，统计：
+    订单从发出到写入Excel的延迟分位数
+    @机器人从发出到收到回复的延迟分位数
+    Excel中缺失或重复的订单、没有回复的@消息
+任何一项超过 SLO 时以非零状态退出，可以放进发布前的检查。
+
+延迟都按模拟时间计算。真实的处理耗时会按倍速放大，倍速越高结果越保守；
+后台合并写Excel的窗口按倍速缩小，与真实运行时的模拟时长一致。
+
+    python benchmarks/load_simulation.py --groups 20 --orders 200 --mentions 30 --duration 600
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_NAME = '良行上厨®快餐店订餐机器人'
+DISHES = ["红烧肉饭", "鱼香肉丝饭", "宫保鸡丁饭", "番茄炒蛋饭", "麻婆豆腐饭"]
+
+
+def percentile(samples, p):
+    """按最近秩法计算分位数，没有样本时返回None"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def latency_stats(samples):
+    return {
+        "count": len(samples),
+        "p50": _round(percentile(samples, 50)),
+        "p95": _round(percentile(samples, 95)),
+        "p99": _round(percentile(samples, 99)),
+        "max": _round(max(samples) if samples else None),
+    }
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def build_timeline(groups, orders, mentions, duration, rng):
+    """生成负载时间线，每条订单的(发送人, 内容)唯一，便于核对缺失和重复"""
+    timeline = []
+    for group in groups:
+        for i in range(orders):
+            timeline.append({"at": round(rng.uniform(0, duration), 3), "group": group,
+                             "sender": f"{group}-同事{i}",
+                             "content": f"{rng.choice(DISHES)}，共{rng.randint(1, 3)}份",
+                             "kind": "order"})
+        for i in range(mentions):
+            timeline.append({"at": round(rng.uniform(0, duration), 3), "group": group,
+                             "sender": f"{group}-询问{i}",
+                             "content": f"@{BOT_NAME} 统计一下",
+                             "kind": "mention"})
+    timeline.sort(key=lambda entry: entry["at"])
+    return timeline
+
+
+class LoadSimulation:
+    """运行一次负载模拟
+
+    Args:
+        groups: 群聊数量
+        orders: 每个群聊的订单数
+        mentions: 每个群聊的@机器人消息数
+        duration: 消息分布在多少模拟秒内
+        speed: 时钟倍速
+        drain: 最后一条消息之后再等待多少模拟秒
+        window_size: 模拟微信聊天窗口可见的消息条数
+        op_latency: 每次界面操作的真实耗时（秒）
+    """
+
+    def __init__(self, groups=20, orders=200, mentions=30, duration=600, speed=20.0,
+                 drain=120, window_size=50, op_latency=0.0, seed=1, verbose=False):
+        self.group_names = [f"负载测试群{i + 1:02d}" for i in range(groups)]
+        self.orders = orders
+        self.mentions = mentions
+        self.duration = duration
+        self.speed = speed
+        self.drain = drain
+        self.window_size = window_size
+        self.op_latency = op_latency
+        self.rng = random.Random(seed)
+        self.verbose = verbose
+        self.out = sys.stdout
+        # 订单键 -> 写入Excel的模拟时间
+        self._exported_at = {}
+        self._lock = threading.Lock()
+
+    def _silence(self):
+        """丢弃机器人的日志输出
+
+        sys.stdout 是全进程共享的，监控线程结束前一直在打印，所以不再恢复；
+        模拟自身的输出写到创建模拟时的标准输出 self.out。
+        """
+        if not self.verbose:
+            sys.stdout = open(os.devnull, "w", encoding="utf-8")
+
+    def _track_exports(self, index, clock):
+        """包装后台写入函数，记录每条订单写入Excel的时间"""
+        write_func = index.excel_writer.write_func
+
+        def tracked(orders, group_name, date):
+            ok = write_func(orders, group_name, date)
+            if ok is not False:
+                now = clock.time()
+                with self._lock:
+                    for order in orders:
+                        self._exported_at.setdefault((group_name, order["发送人"], order["订餐内容"]), now)
+            return ok
+
+        index.excel_writer.write_func = tracked
+
+    def run(self):
+        workdir = tempfile.mkdtemp(prefix="wxbot_load_")
+        os.chdir(workdir)
+        os.environ["WXBOT_BACKEND"] = "fake"
+        os.environ.pop("WXBOT_TIMELINE", None)
+        os.environ.pop("WXBOT_SPEED", None)
+        sys.path.insert(0, REPO_DIR)
+        try:
+            return self._run(workdir)
+        finally:
+            os.chdir(REPO_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _run(self, workdir):
+        import clock
+
+        # 从今天11:00开始，整个模拟都在订餐时段内，也不会碰到16:00的定时汇总
+        start = datetime.now().replace(hour=11, minute=0, second=0, microsecond=0)
+        sim_clock = clock.AcceleratedClock(self.speed, start)
+        clock.set_clock(sim_clock)
+
+        self._silence()
+        import index
+        if not self.verbose:
+            import bot_logging
+            bot_logging.set_console(False)
+        return self._simulate(index, clock, sim_clock, workdir)
+
+    def _simulate(self, index, clock, sim_clock, workdir):
+        from fake_wechat import FakeWeChat
+
+        timeline = build_timeline(self.group_names, self.orders, self.mentions, self.duration, self.rng)
+        fake = FakeWeChat(timeline, window_size=self.window_size, op_latency=self.op_latency)
+        sim_start = fake._start
+        index.app.use_wechat(fake)
+        index.GROUP_NAMES = list(self.group_names)
+        index.excel_writer.window = sim_clock.to_real(index.EXCEL_FLUSH_WINDOW)
+        self._track_exports(index, clock)
+
+        print(f"开始模拟: {len(self.group_names)}个群聊，每群{self.orders}条订单、{self.mentions}条@消息，"
+              f"{self.duration}秒内发出，{self.speed:g}倍速，工作目录: {workdir}", file=self.out)
+        real_start = time.time()
+        monitor = threading.Thread(target=self._monitor, args=(index,), name="LoadMonitor")
+        monitor.daemon = True
+        monitor.start()
+
+        end_at = sim_start + self.duration + self.drain
+        while clock.time() < end_at:
+            time.sleep(0.2)
+            if not monitor.is_alive():
+                print("监控线程意外退出", file=self.out)
+                break
+        index.excel_writer.flush()
+        real_elapsed = time.time() - real_start
+
+        report = self._evaluate(index, fake, timeline, sim_start)
+        report["real_seconds"] = round(real_elapsed, 2)
+        report["config"] = {
+            "groups": len(self.group_names), "orders": self.orders, "mentions": self.mentions,
+            "duration": self.duration, "speed": self.speed, "drain": self.drain,
+            "window_size": self.window_size, "op_latency": self.op_latency,
+        }
+        report["fake_wechat_calls"] = dict(fake.calls)
+        return report
+
+    def _monitor(self, index):
+        index.monitor_group()
+
+    def _excel_orders(self, index, group_name, date):
+        import pandas as pd
+
+        path = index.get_excel_path(group_name, date)
+        if not os.path.exists(path):
+            return []
+        try:
+            df = pd.read_excel(path, sheet_name=date)
+        except ValueError:
+            return []
+        return list(zip(df["发送人"].astype(str), df["订餐内容"].astype(str)))
+
+    def _evaluate(self, index, fake, timeline, sim_start):
+        date = index.get_today_date()
+        expected = {}
+        mentions = {}
+        for entry in timeline:
+            key = (entry["group"], entry["sender"], entry["content"].split("，共")[0])
+            if entry["kind"] == "order":
+                expected[key] = sim_start + entry["at"]
+            else:
+                mentions[(entry["group"], entry["sender"])] = sim_start + entry["at"]
+
+        # Excel中的订单：缺失和重复
+        missing = 0
+        duplicated = 0
+        for group_name in self.group_names:
+            rows = self._excel_orders(index, group_name, date)
+            seen = {}
+            for sender, content in rows:
+                seen[(group_name, sender, content)] = seen.get((group_name, sender, content), 0) + 1
+            duplicated += sum(count - 1 for count in seen.values() if count > 1)
+            missing += sum(1 for key in expected if key[0] == group_name and key not in seen)
+
+        # 订单到Excel的延迟
+        order_latency = []
+        with self._lock:
+            for key, sent_at in expected.items():
+                exported_at = self._exported_at.get(key)
+                if exported_at is not None:
+                    order_latency.append(exported_at - sent_at)
+
+        # @消息到回复的延迟，回复以 "@发送人 " 开头
+        mention_latency = []
+        replied = set()
+        for group_name, msg, sent_at in fake.sent:
+            if not msg.startswith("@"):
+                continue
+            sender = msg[1:].split(" ", 1)[0]
+            key = (group_name, sender)
+            if key in mentions and key not in replied:
+                replied.add(key)
+                mention_latency.append(sent_at - mentions[key])
+        unanswered = len(mentions) - len(replied)
+
+        return {
+            "order_to_excel": latency_stats(order_latency),
+            "mention_to_reply": latency_stats(mention_latency),
+            "expected_orders": len(expected),
+            "missing_orders": missing,
+            "duplicated_orders": duplicated,
+            "mentions": len(mentions),
+            "unanswered_mentions": unanswered,
+            "replies_sent": len(fake.sent),
+        }
+
+
+def check_slo(report, args):
+    """返回违反的SLO列表"""
+    failures = []
+
+    def check_latency(name, value, limit):
+        if limit is None:
+            return
+        if value is None:
+            failures.append(f"{name}: 没有样本")
+        elif value > limit:
+            failures.append(f"{name}: {value:.3f}秒 > {limit}秒")
+
+    check_latency("订单写入Excel p95", report["order_to_excel"]["p95"], args.slo_order_p95)
+    check_latency("订单写入Excel p99", report["order_to_excel"]["p99"], args.slo_order_p99)
+    check_latency("@回复 p95", report["mention_to_reply"]["p95"], args.slo_mention_p95)
+    check_latency("@回复 p99", report["mention_to_reply"]["p99"], args.slo_mention_p99)
+    if report["missing_orders"] > args.max_missing:
+        failures.append(f"缺失订单: {report['missing_orders']} > {args.max_missing}")
+    if report["duplicated_orders"] > args.max_duplicated:
+        failures.append(f"重复订单: {report['duplicated_orders']} > {args.max_duplicated}")
+    if report["unanswered_mentions"] > args.max_unanswered:
+        failures.append(f"未回复的@消息: {report['unanswered_mentions']} > {args.max_unanswered}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="午饭高峰负载模拟")
+    parser.add_argument("--groups", type=int, default=20, help="群聊数量")
+    parser.add_argument("--orders", type=int, default=200, help="每个群聊的订单数")
+    parser.add_argument("--mentions", type=int, default=30, help="每个群聊的@机器人消息数")
+    parser.add_argument("--duration", type=float, default=600, help="消息在多少模拟秒内发出")
+    parser.add_argument("--speed", type=float, default=20.0, help="时钟倍速")
+    parser.add_argument("--drain", type=float, default=120, help="最后一条消息后继续运行的模拟秒数")
+    parser.add_argument("--window-size", type=int, default=50, help="聊天窗口可见消息条数")
+    parser.add_argument("--op-latency", type=float, default=0.0, help="每次界面操作的真实耗时（秒）")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", help="保存JSON报告的文件")
+    parser.add_argument("--verbose", action="store_true", help="显示机器人的日志输出")
+    parser.add_argument("--slo-order-p95", type=float, default=60.0, help="订单写入Excel p95上限（秒）")
+    parser.add_argument("--slo-order-p99", type=float, default=None, help="订单写入Excel p99上限（秒）")
+    parser.add_argument("--slo-mention-p95", type=float, default=30.0, help="@回复 p95上限（秒）")
+    parser.add_argument("--slo-mention-p99", type=float, default=None, help="@回复 p99上限（秒）")
+    parser.add_argument("--max-missing", type=int, default=0, help="允许缺失的订单数")
+    parser.add_argument("--max-duplicated", type=int, default=0, help="允许重复的订单数")
+    parser.add_argument("--max-unanswered", type=int, default=0, help="允许未回复的@消息数")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    simulation = LoadSimulation(args.groups, args.orders, args.mentions, args.duration, args.speed,
+                                args.drain, args.window_size, args.op_latency, args.seed, args.verbose)
+    out = simulation.out
+    report = simulation.run()
+    failures = check_slo(report, args)
+    report["slo_failures"] = failures
+
+    print(json.dumps(report, ensure_ascii=False, indent=2), file=out)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到: {output}", file=out)
+
+    if failures:
+        print("未达到SLO:", file=out)
+        for failure in failures:
+            print(f"  {failure}", file=out)
+    else:
+        print("全部SLO达标", file=out)
+    out.flush()
+    # 监控线程一直在循环，不等待后台线程直接退出
+    os._exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""回归检查
+
+用模拟微信复现以前出过的问题，每项检查在单独的进程和临时目录中运行，不会影响真实的订餐统计文件。
+
+    python benchmarks/regression_checks.py            运行全部检查
+    python benchmarks/regression_checks.py --list     列出检查项
+
+有检查未通过时以非零状态退出。
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GROUP_NAME = "英明中、晚饭订餐群"
+
+CHECKS = {}
+
+
+def check(func):
+    """注册一项检查，函数出错或返回失败原因列表时视为未通过"""
+    CHECKS[func.__name__] = func
+    return func
+
+
+def _setup(fake):
+    """在当前进程中导入index并使用模拟微信"""
+    import bot_logging
+    import index
+    bot_logging.set_console(False)
+    index.app.use_wechat(fake)
+    return index
+
+
+def _journal_contents(index, group_name=GROUP_NAME):
+    return [order['订餐内容'] for order in index.journal.get_orders(group_name, index.get_today_date())]
+
+
+@check
+def gui_refresh_then_monitor(fake_wechat):
+    """界面刷新订餐数量（collect_orders）之后监控再读到同一条消息，订单仍要写入订单日志"""
+    fake = fake_wechat.FakeWeChat(groups=[GROUP_NAME])
+    index = _setup(fake)
+    msg = fake.add_message(GROUP_NAME, "张三", "红烧肉饭，共2份")
+    index.collect_orders(GROUP_NAME, index.PRIORITY_REFRESH)
+    index.persist_orders(GROUP_NAME, index.parse_messages([msg], GROUP_NAME))
+    index.excel_writer.flush()
+    failures = []
+    if _journal_contents(index) != ["红烧肉饭"]:
+        failures.append(f"订单日志中的订单: {_journal_contents(index)}")
+    if not os.path.exists(index.get_excel_path(GROUP_NAME)):
+        failures.append("没有导出Excel")
+    return failures
+
+
+@check
+def concurrent_excel_export(fake_wechat):
+    """Excel写入线程、发送汇总、界面打开Excel同时导出同一个文件，都要成功且文件完整"""
+    import threading
+    fake = fake_wechat.FakeWeChat(groups=[GROUP_NAME])
+    index = _setup(fake)
+    msgs = [fake.add_message(GROUP_NAME, f"用户{i}", f"红烧肉饭{i}，共1份") for i in range(20)]
+    index.persist_orders(GROUP_NAME, index.parse_messages(msgs, GROUP_NAME))
+    results = []
+
+    def export():
+        results.append(index.export_to_excel(GROUP_NAME))
+
+    threads = [threading.Thread(target=export) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    index.excel_writer.flush()
+    failures = []
+    if results != [True] * len(threads):
+        failures.append(f"导出结果: {results}")
+    import pandas as pd
+    df = pd.read_excel(index.get_excel_path(GROUP_NAME), sheet_name=index.get_today_date())
+    if len(df) != 20:
+        failures.append(f"Excel中的订单数: {len(df)}")
+    return failures
+
+
+@check
+def restore_backfills_new_group(fake_wechat):
+    """从检查点恢复时，检查点中没有的群聊也要补录今天的订单"""
+    fake = fake_wechat.FakeWeChat(groups=[GROUP_NAME])
+    index = _setup(fake)
+    msgs = [fake.add_message(GROUP_NAME, "张三", "红烧肉饭，共2份"),
+            fake.add_message(GROUP_NAME, "李四", "鸡腿饭，共1份")]
+    index.app.checkpoint.restored = True
+    index.app.checkpoint.last_msg_ids.pop(GROUP_NAME, None)
+    backfilled = index.backfill_since_checkpoint(GROUP_NAME, msgs, index.ProcessedMessageIds())
+    failures = []
+    if backfilled is None:
+        failures.append("没有补录")
+    if sorted(_journal_contents(index)) != sorted(["红烧肉饭", "鸡腿饭"]):
+        failures.append(f"订单日志中的订单: {_journal_contents(index)}")
+    return failures
+
+
+@check
+def checkpoint_waits_for_persist(fake_wechat):
+    """没有订单的批次不能先于前面还在保存的订单批次记录到检查点"""
+    import threading
+    import time
+    fake = fake_wechat.FakeWeChat(groups=[GROUP_NAME])
+    index = _setup(fake)
+    release = threading.Event()
+    persist_orders = index.persist_orders
+
+    def slow_persist(*args, **kwargs):
+        release.wait(10)
+        return persist_orders(*args, **kwargs)
+
+    index.persist_orders = slow_persist
+    pipeline = index.build_message_pipeline(index.ProcessedMessageIds())
+    pipeline.start()
+    order_msg = fake.add_message(GROUP_NAME, "张三", "红烧肉饭，共2份")
+    chat_msg = fake.add_message(GROUP_NAME, "李四", "今天天气不错")
+    pipeline.submit(index.MessageBatch(GROUP_NAME, [order_msg]))
+    pipeline.submit(index.MessageBatch(GROUP_NAME, [chat_msg]))
+    time.sleep(0.5)
+    failures = []
+    if index.app.checkpoint.last_msg_ids.get(GROUP_NAME) == chat_msg.id:
+        failures.append("订单还没有保存，检查点已经越过了订单消息")
+    release.set()
+    pipeline.stop()
+    if index.app.checkpoint.last_msg_ids.get(GROUP_NAME) != chat_msg.id:
+        failures.append(f"检查点最后消息: {index.app.checkpoint.last_msg_ids.get(GROUP_NAME)}")
+    if _journal_contents(index) != ["红烧肉饭"]:
+        failures.append(f"订单日志中的订单: {_journal_contents(index)}")
+    return failures
+
+
+@check
+def summary_follows_group_list(fake_wechat):
+    """界面中修改群聊配置后，新增的群聊也有每日汇总，删除的群聊不再发送，每个群聊每天只有一次汇总"""
+    fake = fake_wechat.FakeWeChat(groups=[GROUP_NAME, "新群聊"])
+    index = _setup(fake)
+    scheduler = index.app.summary_scheduler
+    failures = []
+    if scheduler.names() != {f"{GROUP_NAME}/每日汇总"}:
+        failures.append(f"初始的定时汇总: {scheduler.names()}")
+    index.GROUP_NAMES = ["新群聊"]
+    index.sync_summary_jobs(scheduler)
+    if scheduler.names() != {"新群聊/每日汇总"}:
+        failures.append(f"修改群聊后的定时汇总: {scheduler.names()}")
+    return failures
+
+
+def run_check(name):
+    """在当前进程中运行一项检查（由父进程在临时目录中调用）"""
+    sys.path.insert(0, REPO_DIR)
+    import fake_wechat
+    failures = CHECKS[name](fake_wechat) or []
+    for failure in failures:
+        print(f"  {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回归检查")
+    parser.add_argument("names", nargs="*", help="只运行这些检查")
+    parser.add_argument("--list", action="store_true", help="列出检查项")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        os._exit(run_check(args.run))
+    if args.list:
+        for name, func in CHECKS.items():
+            print(f"{name}: {func.__doc__}")
+        return
+
+    env = dict(os.environ, WXBOT_BACKEND="fake", WXBOT_METRICS_PORT="0")
+    env.pop("WXBOT_TIMELINE", None)
+    failed = []
+    for name in args.names or list(CHECKS):
+        workdir = tempfile.mkdtemp(prefix="wxbot_check_")
+        try:
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", name],
+                                    cwd=workdir, env=env, text=True, encoding="utf-8",
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        passed = result.returncode == 0
+        print(f"{'通过' if passed else '未通过'}: {name}")
+        if not passed:
+            print(result.stdout.rstrip())
+            failed.append(name)
+    if failed:
+        sys.exit(1)
+    print("全部检查通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""日志
+
+所有模块通过 get_logger() 获取日志器，日志记录先放入队列，由后台线程写入
+wxauto_logs/ 下按大小轮转的日志文件，并输出到控制台（GUI中为日志窗口）。
+调用日志的线程只做一次入队，不会被文件写入或界面刷新阻塞。
+
+用法：
+    logger = get_logger(__name__)
+    logger.debug("处理新消息: %s", content)   # 参数只在DEBUG开启时才格式化
+
+日志级别由环境变量 WXBOT_LOG_LEVEL 设置，默认INFO。
+同一行代码短时间内输出过多DEBUG日志时会被限流，恢复后输出被丢弃的条数；
+INFO及以上的日志（新增订单、警告、错误等）全部保留，用于事后核对漏单。
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_DIR = "wxauto_logs"
+LOG_FILE = "wxbot.log"
+LOG_FORMAT = "%(asctime)s [%(levelname)s] [%(name)s] %(message)s"
+CONSOLE_FORMAT = "%(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 单个日志文件的大小上限和保留的文件数
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# 每个调用位置在 RATE_LIMIT_PERIOD 秒内最多输出 RATE_LIMIT_BURST 条，只限制 RATE_LIMIT_LEVEL 及以下级别
+RATE_LIMIT_BURST = 20
+RATE_LIMIT_PERIOD = 10.0
+RATE_LIMIT_LEVEL = logging.DEBUG
+
+ROOT_LOGGER = "wxbot"
+
+_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+# set_console 设置的控制台输出开关，初始化日志之前设置也有效
+_console_enabled = True
+
+
+class RateLimitFilter(logging.Filter):
+    """按调用位置（文件+行号）限流
+
+    Args:
+        burst: 一个周期内每个调用位置允许的日志条数
+        period: 周期长度（秒）
+        max_level: 只限制这个级别及以下的日志，更高级别的日志全部保留
+    """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, period=RATE_LIMIT_PERIOD, max_level=RATE_LIMIT_LEVEL):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.max_level = max_level
+        self._lock = threading.Lock()
+        # (文件, 行号) -> [周期开始时间, 本周期条数, 被丢弃条数]
+        self._sites = {}
+
+    def filter(self, record):
+        if self.burst <= 0 or record.levelno > self.max_level:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None:
+                self._sites[site] = [now, 1, 0]
+                return True
+            if now - state[0] >= self.period:
+                dropped = state[2]
+                state[0], state[1], state[2] = now, 1, 0
+                if dropped:
+                    record.msg = f"{record.msg}（此处日志被限流，丢弃了{dropped}条）"
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """输出到当前的 sys.stdout，GUI重定向标准输出后也能看到日志"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    def emit(self, record):
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+def get_level():
+    """环境变量 WXBOT_LOG_LEVEL 指定的日志级别"""
+    name = os.environ.get("WXBOT_LOG_LEVEL", "INFO").strip().upper()
+    level = logging.getLevelName(name)
+    return level if isinstance(level, int) else logging.INFO
+
+
+def setup_logging(level=None, log_dir=LOG_DIR, console=True, max_bytes=MAX_BYTES,
+                  backup_count=BACKUP_COUNT, rate_limit=RATE_LIMIT_BURST):
+    """初始化日志，重复调用只会调整级别
+
+    Args:
+        level: 日志级别，为None时读取环境变量
+        log_dir: 日志文件目录，为None时不写文件
+        console: 是否输出到控制台
+        rate_limit: 每个调用位置每周期允许的日志条数，0表示不限流
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level if level is not None else get_level())
+    with _lock:
+        if _listener is not None:
+            return root
+
+        handlers = []
+        if log_dir:
+            try:
+                os.makedirs(log_dir, exist_ok=True)
+                file_handler = logging.handlers.RotatingFileHandler(
+                    os.path.join(log_dir, LOG_FILE), maxBytes=max_bytes,
+                    backupCount=backup_count, encoding="utf-8")
+                file_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+                handlers.append(file_handler)
+            except OSError as e:
+                sys.stderr.write(f"无法创建日志文件: {e}\n")
+        if console:
+            console_handler = _StdoutHandler()
+            console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            if not _console_enabled:
+                console_handler.setLevel(logging.CRITICAL + 1)
+            handlers.append(console_handler)
+
+        log_queue = queue.SimpleQueue()
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+        _queue_handler.addFilter(RateLimitFilter(rate_limit))
+        root.addHandler(_queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def add_handler(handler):
+    """给后台写入线程增加一个输出，例如GUI日志窗口"""
+    setup_logging()
+    with _lock:
+        _listener.handlers = _listener.handlers + (handler,)
+
+
+def remove_handler(handler):
+    """移除 add_handler 增加的输出"""
+    with _lock:
+        if _listener is not None:
+            _listener.handlers = tuple(h for h in _listener.handlers if h is not handler)
+
+
+def set_console(enabled):
+    """开启或关闭控制台输出"""
+    global _console_enabled
+    with _lock:
+        _console_enabled = enabled
+        if _listener is None:
+            return
+        for handler in _listener.handlers:
+            if isinstance(handler, _StdoutHandler):
+                handler.setLevel(logging.NOTSET if enabled else logging.CRITICAL + 1)
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener, _queue_handler
+    with _lock:
+        listener, handler = _listener, _queue_handler
+        _listener = _queue_handler = None
+    if listener is None:
+        return
+    logging.getLogger(ROOT_LOGGER).removeHandler(handler)
+    listener.stop()
+    for h in listener.handlers:
+        try:
+            h.flush()
+            if not isinstance(h, _StdoutHandler):
+                h.close()
+        except Exception:
+            pass
+
+
+def get_logger(name):
+    """获取模块的日志器，名称统一放在 wxbot 下"""
+    if name == "__main__":
+        name = "main"
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -0,0 +1,175 @@
+"""监控检查点
+
+把监控循环的进度保存到磁盘，重启后直接从上次的位置继续，不需要重新读取和处理当天的消息：
+- 每个群聊最后处理完的消息ID
+- 每个群聊最近处理过的 RECENT_IDS_PER_GROUP 条消息ID（按天分代，见 message_dedupe），
+  重启时聊天窗口和补录的历史中只会出现最近的消息，不保存完整的去重记录，每次写入的数据量有上限
+- 每个定时汇总（例如 群聊/每日汇总）最后一次发送的日期，重启后不会重复发送
+- 订单日志的位置（最新订单ID），用于确认台账可以从订单日志恢复
+
+消息进度只在当天有效。写入时先写临时文件并刷到磁盘，再替换原文件，中途断电也不会留下写了一半的文件。
+"""
+import json
+import os
+import threading
+import time
+
+from bot_logging import get_logger
+from message_dedupe import ProcessedMessageIds
+from order_ledger import get_date_key
+
+logger = get_logger(__name__)
+
+CHECKPOINT_VERSION = 2
+
+# 有变化时最短的写入间隔（秒）
+DEFAULT_SAVE_INTERVAL = 5.0
+# 每个群聊每天保存的最近处理过的消息ID数
+RECENT_IDS_PER_GROUP = 1000
+
+
+def _recent_ids():
+    return ProcessedMessageIds(max_per_group=RECENT_IDS_PER_GROUP)
+
+
+class MonitorCheckpoint:
+    """监控进度检查点
+
+    Args:
+        path: 检查点文件路径
+        save_interval: 有变化时最短的写入间隔（秒）
+    """
+
+    def __init__(self, path, save_interval=DEFAULT_SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        # 保证同一时间只有一个线程在写文件
+        self._save_lock = threading.Lock()
+        self.date_key = get_date_key()
+        # 群聊 -> 最后处理完的消息ID
+        self.last_msg_ids = {}
+        # 最近处理完（订单已写入订单日志）的消息ID
+        self.processed_ids = _recent_ids()
+        # 定时汇总名称 -> 最后一次发送的日期
+        self.summary_dates = {}
+        self.journal_id = 0
+        # 是否从文件恢复了当天的检查点
+        self.restored = False
+        self._dirty = False
+        self._last_save = 0.0
+
+    def load(self, date=None):
+        """读取检查点，文件不存在、损坏或不是当天的都视为没有检查点
+
+        Returns:
+            bool: 是否恢复了当天的检查点
+        """
+        date_key = get_date_key(date)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning("读取检查点失败，将重新初始化: %s", e)
+            return False
+        if data.get("version") != CHECKPOINT_VERSION:
+            logger.warning("检查点版本不匹配，将重新初始化")
+            return False
+        with self._lock:
+            # 汇总日期和已处理的消息ID跨天也要保留，其它进度只在当天有效
+            self.summary_dates = dict(data.get("summary_dates") or {})
+            self.processed_ids.load(data.get("processed_ids"))
+            if data.get("date") != date_key:
+                logger.info("检查点不是今天的（%s），将重新初始化", data.get("date"))
+                return False
+            self.date_key = date_key
+            self.last_msg_ids = dict(data.get("last_msg_ids") or {})
+            self.journal_id = int(data.get("journal_id") or 0)
+            self.restored = True
+        logger.info("已恢复检查点: %s个群聊, %s条已处理消息", len(self.last_msg_ids), len(self.processed_ids))
+        return True
+
+    def reset(self, date=None):
+        """丢弃当天的进度（汇总日期保留），用于检查点与实际状态不一致时"""
+        with self._lock:
+            self.date_key = get_date_key(date)
+            self.last_msg_ids = {}
+            self.processed_ids = _recent_ids()
+            self.journal_id = 0
+            self.restored = False
+            self._dirty = True
+
+    def commit(self, group_name, msg_ids, last_msg_id, journal_id=None):
+        """记录一批消息已经处理完（订单已写入订单日志）
+
+        Args:
+            group_name: 群聊名称
+            msg_ids: 这批消息的ID
+            last_msg_id: 这批消息中最后一条的ID
+            journal_id: 订单日志中最新的订单ID
+        """
+        with self._lock:
+            self.date_key = get_date_key()
+            self.processed_ids.update(group_name, msg_ids)
+            if last_msg_id is not None:
+                self.last_msg_ids[group_name] = last_msg_id
+            if journal_id is not None:
+                self.journal_id = journal_id
+            self._dirty = True
+
+    def summary_sent(self, name, date=None):
+        """定时汇总当天是否已经发送过
+
+        Args:
+            name: 定时汇总的名称
+            date: 日期，为None时为今天
+        """
+        with self._lock:
+            return self.summary_dates.get(name) == get_date_key(date)
+
+    def mark_summary_sent(self, name, date=None):
+        """记录定时汇总已发送并立即写入"""
+        with self._lock:
+            self.summary_dates[name] = get_date_key(date)
+            self._dirty = True
+        self.save()
+
+    def save(self):
+        """写入检查点文件"""
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        with self._lock:
+            data = {
+                "version": CHECKPOINT_VERSION,
+                "date": self.date_key,
+                "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "last_msg_ids": dict(self.last_msg_ids),
+                "processed_ids": self.processed_ids.export(),
+                "summary_dates": dict(self.summary_dates),
+                "journal_id": self.journal_id,
+            }
+            self._dirty = False
+            self._last_save = time.time()
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                # 消息ID不是JSON类型时按字符串保存
+                json.dump(data, f, ensure_ascii=False, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            with self._lock:
+                self._dirty = True
+            logger.warning("写入检查点失败: %s", e)
+
+    def save_if_due(self):
+        """有变化且距上次写入超过 save_interval 秒时写入"""
+        with self._lock:
+            due = self._dirty and time.time() - self._last_save >= self.save_interval
+        if due:
+            self.save()
@@ -0,0 +1,94 @@
+"""时钟
+
+监控循环、日期判断、轮询调度使用的当前时间都从这里获取。
+正常运行时就是系统时间；在Linux上用模拟微信回放消息时可以换成加速时钟，
+让一整天的订餐过程在几分钟内跑完。
+"""
+import time as _time
+from datetime import datetime
+
+
+class SystemClock:
+    """系统时间"""
+
+    def time(self):
+        return _time.time()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+    def wait(self, event, seconds):
+        return event.wait(seconds)
+
+
+class AcceleratedClock:
+    """按倍速流逝的模拟时间
+
+    Args:
+        speed: 倍速，例如60表示真实1秒等于模拟1分钟
+        start: 模拟开始时刻（datetime或时间戳），为None时从当前时间开始
+    """
+
+    def __init__(self, speed=60.0, start=None):
+        self.speed = float(speed)
+        self._real_start = _time.time()
+        if start is None:
+            self._sim_start = self._real_start
+        elif isinstance(start, datetime):
+            self._sim_start = start.timestamp()
+        else:
+            self._sim_start = float(start)
+
+    def time(self):
+        return self._sim_start + (_time.time() - self._real_start) * self.speed
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            _time.sleep(seconds / self.speed)
+
+    def wait(self, event, seconds):
+        return event.wait(max(seconds, 0) / self.speed)
+
+    def to_real(self, seconds):
+        """模拟时长换算为真实时长"""
+        return seconds / self.speed
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    """获取当前使用的时钟"""
+    return _clock
+
+
+def set_clock(new_clock):
+    """替换全局时钟，需在启动监控之前调用"""
+    global _clock
+    _clock = new_clock
+
+
+def time():
+    """当前时间戳"""
+    return _clock.time()
+
+
+def now():
+    """当前时间（datetime）"""
+    return _clock.now()
+
+
+def sleep(seconds):
+    """按当前时钟休眠"""
+    _clock.sleep(seconds)
+
+
+def wait(event, seconds):
+    """按当前时钟等待 threading.Event，最多 seconds 秒，返回事件是否已设置"""
+    return _clock.wait(event, seconds)
@@ -0,0 +1,168 @@
+"""定时任务调度
+
+所有任务按下一次触发时刻放在一个最小堆中，监控循环用 next_delay() 得到离最近一个任务还有多久，
+休眠到那个时刻再调用 run_pending()，不用每隔一段时间检查当前是几点。
+
+每天固定时刻的任务（例如各群聊的每日汇总）执行后自动排到第二天的同一时刻。
+某天的任务是否已经执行由调用方提供的 fired/mark_fired 记录（例如写入检查点），重启后不会重复执行。
+启动晚了或监控循环被耽搁时，超过触发时刻 grace 秒以内仍会补做，超过的当天不再执行。
+"""
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+import clock
+from bot_logging import get_logger
+from metrics import registry
+
+logger = get_logger(__name__)
+
+# 超过触发时刻多久以内仍补做（秒）
+DEFAULT_GRACE = 1800
+# 任务出错后重试的间隔（秒），只在 grace 以内重试
+RETRY_DELAY = 60
+
+
+def _parse_time(hhmm):
+    hour, minute = hhmm.split(":")
+    return int(hour), int(minute)
+
+
+class DailyJob:
+    """每天固定时刻执行的任务
+
+    Args:
+        name: 任务名称，用于记录每天是否已执行
+        at: 触发时刻，格式为 "HH:MM"
+        func: 执行的函数，不带参数，出错或返回False时视为失败，稍后重试
+        grace: 超过触发时刻多久以内仍补做（秒）
+    """
+
+    def __init__(self, name, at, func, grace=DEFAULT_GRACE):
+        self.name = name
+        self.at = at
+        self.hour, self.minute = _parse_time(at)
+        self.func = func
+        self.grace = grace
+
+    def due_on(self, day):
+        """某天的触发时刻（时间戳）"""
+        return datetime(day.year, day.month, day.day, self.hour, self.minute).timestamp()
+
+    def next_due(self, now, after=None):
+        """now 之后（含 grace 以内刚错过的）最近一次触发时刻，给出 after 时只取 after 之后的日期"""
+        day = datetime.fromtimestamp(now).date()
+        if after is not None:
+            day = max(day, after + timedelta(days=1))
+        due = self.due_on(day)
+        if due + self.grace < now:
+            due = self.due_on(day + timedelta(days=1))
+        return due
+
+
+class DeadlineScheduler:
+    """按截止时间排序的定时任务调度，多线程共用
+
+    Args:
+        fired: fired(name, date_key) 返回某天的任务是否已经执行过，为None时不检查
+        mark_fired: mark_fired(name, date_key) 记录任务已执行
+    """
+
+    def __init__(self, fired=None, mark_fired=None):
+        self.fired = fired
+        self.mark_fired = mark_fired
+        self._lock = threading.Lock()
+        # (执行时刻, 序号, 任务, 重试的原触发时刻或None)，序号保证同一时刻的任务按添加顺序执行
+        self._heap = []
+        self._seq = itertools.count()
+        self._runs = registry.counter("wxbot_scheduled_jobs_total", "定时任务的执行结果", "result")
+
+    def _push(self, run_at, job, retry_of=None):
+        heapq.heappush(self._heap, (run_at, next(self._seq), job, retry_of))
+
+    def add_daily(self, name, at, func, grace=DEFAULT_GRACE, now=None):
+        """添加每天 at 时刻执行的任务"""
+        now = now if now is not None else clock.time()
+        job = DailyJob(name, at, func, grace)
+        with self._lock:
+            self._push(job.next_due(now), job)
+        return job
+
+    def next_delay(self, now=None):
+        """距离最近一个任务还有多久（秒），没有任务时返回None"""
+        now = now if now is not None else clock.time()
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - now)
+
+    def names(self):
+        """已添加的任务名称"""
+        with self._lock:
+            return {job.name for _, _, job, _ in self._heap}
+
+    def remove(self, name):
+        """取消任务，包括等待中的重试，返回是否有这个任务"""
+        with self._lock:
+            heap = [entry for entry in self._heap if entry[2].name != name]
+            removed = len(heap) != len(self._heap)
+            heapq.heapify(heap)
+            self._heap = heap
+        return removed
+
+    def pending(self):
+        """排队中的任务：[(触发时间, 任务名称)]，按时间排序"""
+        with self._lock:
+            entries = sorted(self._heap)
+        return [(datetime.fromtimestamp(due), job.name) for due, _, job, _ in entries]
+
+    def run_pending(self, now=None):
+        """执行所有已到时间的任务
+
+        Returns:
+            int: 执行成功的任务数
+        """
+        now = now if now is not None else clock.time()
+        done = 0
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                due, _, job, retry_of = heapq.heappop(self._heap)
+                if retry_of is not None:
+                    # 重试按原来的触发时刻判断是否超过 grace，第二天的任务已经排好
+                    due = retry_of
+                day = datetime.fromtimestamp(due).date()
+                if retry_of is None:
+                    # 先排好下一天，任务执行出错也不会丢
+                    self._push(job.next_due(now, after=day), job)
+            done += self._run(job, due, day.strftime("%Y-%m-%d"), now)
+        return done
+
+    def _run(self, job, due, date_key, now):
+        late = now - due
+        if late > job.grace:
+            logger.warning("定时任务 %s（%s %s）已错过 %.0f秒，今天不再执行", job.name, date_key, job.at, late)
+            self._runs.inc(1, "missed")
+            return 0
+        if self.fired is not None and self.fired(job.name, date_key):
+            logger.debug("定时任务 %s 今天已经执行过", job.name)
+            self._runs.inc(1, "skipped")
+            return 0
+        try:
+            ok = job.func() is not False
+        except Exception as e:
+            logger.error("定时任务 %s 执行出错: %s", job.name, e)
+            ok = False
+        if not ok:
+            self._runs.inc(1, "failed")
+            if late + RETRY_DELAY <= job.grace:
+                with self._lock:
+                    self._push(now + RETRY_DELAY, job, retry_of=due)
+            return 0
+        if self.mark_fired is not None:
+            self.mark_fired(job.name, date_key)
+        logger.info("定时任务 %s 已执行，比预定时间晚 %.1f秒", job.name, late)
+        self._runs.inc(1, "done")
+        return 1
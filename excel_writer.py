@@ -0,0 +1,193 @@
+"""Excel 延迟合并写入
+
+监控线程只把新订单提交给后台写入线程，同一群聊同一天在合并窗口内收到的
+所有订单合并为一次工作簿写入，避免高峰期每来一单就重新读写整个月的文件。
+
+写入失败（例如工作簿正被Excel打开）时按指数退避重试，每个文件只在第一次失败时给出警告，
+连续失败 MAX_RETRIES 次后放弃这一批，订单已在订单日志中，下次导出这一天时会一并写入。
+"""
+import threading
+import time
+
+from bot_logging import get_logger
+from metrics import LatencyHistogram, registry
+from order_ledger import get_date_key, make_order_key
+from tracing import tracer
+
+logger = get_logger(__name__)
+
+# 默认合并窗口（秒）
+DEFAULT_FLUSH_WINDOW = 2.0
+# 写入失败后的重试间隔从合并窗口开始每次加倍，最长 RETRY_MAX_DELAY 秒
+RETRY_MAX_DELAY = 300.0
+# 连续失败的最多重试次数
+MAX_RETRIES = 20
+
+
+class _PendingBatch:
+    """等待写入的一批订单"""
+
+    def __init__(self, window):
+        self.orders = []
+        self.keys = set()
+        # 批次中订单来源消息的追踪ID
+        self.trace_ids = []
+        self.first_submit = time.time()
+        self.flush_after = self.first_submit + window
+        # 连续写入失败的次数
+        self.failures = 0
+
+    def add(self, orders, trace_ids=()):
+        self.trace_ids.extend(trace_ids)
+        for order in orders:
+            key = make_order_key(order)
+            if key not in self.keys:
+                self.keys.add(key)
+                self.orders.append(order)
+
+
+class ExcelWriteBehind:
+    """后台合并写入Excel
+
+    Args:
+        write_func: 实际写入函数，签名为 write_func(orders, group_name, date)
+        window: 合并窗口（秒），同一群聊同一天在窗口内提交的订单合并写入
+    """
+
+    def __init__(self, write_func, window=DEFAULT_FLUSH_WINDOW):
+        self.write_func = write_func
+        self.window = window
+        self._cond = threading.Condition()
+        # 保证同一时间只有一个线程在取出并写入批次
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._running = False
+        # 单次写入工作簿的耗时
+        self.flush_latency = registry.histogram("wxbot_excel_flush_seconds", "Excel合并写入耗时",
+                                                histogram=LatencyHistogram("Excel写入耗时"))
+        # 从首个订单提交到写入完成的耗时
+        self.order_latency = registry.histogram("wxbot_order_persist_delay_seconds", "订单提交到写入Excel的延迟",
+                                                histogram=LatencyHistogram("订单落盘延迟"))
+
+    def start(self):
+        """启动后台写入线程"""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="ExcelWriteBehind")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def submit(self, group_name, orders, date=None, trace_ids=()):
+        """提交一批订单，由后台线程在合并窗口结束后写入
+
+        Args:
+            trace_ids: 订单来源消息的追踪ID，写入时记录到消息追踪中
+        """
+        if not orders:
+            return
+        key = (group_name, get_date_key(date))
+        with self._cond:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = _PendingBatch(self.window)
+                self._pending[key] = batch
+            batch.add(orders, trace_ids)
+            self._cond.notify()
+        if not self._running:
+            self.start()
+
+    def pending_count(self):
+        """等待写入的订单数量"""
+        with self._cond:
+            return sum(len(batch.orders) for batch in self._pending.values())
+
+    def flush(self, group_name=None):
+        """立即写入等待中的订单
+
+        Args:
+            group_name: 只写入指定群聊，为None时写入全部
+        """
+        self._flush_where(lambda key, batch: group_name is None or key[0] == group_name)
+
+    def stop(self):
+        """停止后台线程并写入剩余订单"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                now = time.time()
+                due = min(batch.flush_after for batch in self._pending.values())
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+            try:
+                now = time.time()
+                self._flush_where(lambda key, batch: batch.flush_after <= now)
+            except Exception as e:
+                logger.error("后台写入Excel时出错: %s", e)
+
+    def _requeue(self, key, batch, error=None):
+        """写入失败的批次放回队列，按指数退避推迟重试"""
+        group_name, date_key = key
+        batch.failures += 1
+        if batch.failures > MAX_RETRIES:
+            logger.error("写入 %s %s 的Excel连续失败 %s 次，不再重试，订单已在订单日志中，下次导出时会一并写入: %s",
+                         group_name, date_key, MAX_RETRIES, error or "导出失败")
+            return
+        delay = min(self.window * 2 ** (batch.failures - 1), RETRY_MAX_DELAY)
+        if batch.failures == 1:
+            logger.warning("写入 %s %s 的Excel失败（文件可能正被Excel打开），稍后重试: %s",
+                           group_name, date_key, error or "导出失败")
+        else:
+            logger.debug("写入 %s %s 的Excel第 %s 次失败，%.0f秒后重试: %s",
+                         group_name, date_key, batch.failures, delay, error or "导出失败")
+        with self._cond:
+            newer = self._pending.get(key)
+            if newer is not None:
+                batch.add(newer.orders, newer.trace_ids)
+            batch.flush_after = time.time() + delay
+            self._pending[key] = batch
+            self._cond.notify()
+
+    def _flush_where(self, predicate):
+        with self._write_lock:
+            with self._cond:
+                keys = [key for key, batch in self._pending.items() if predicate(key, batch)]
+                batches = [(key, self._pending.pop(key)) for key in keys]
+            for (group_name, date_key), batch in batches:
+                start = time.time()
+                trace_start = tracer.now()
+                error = None
+                try:
+                    with tracer.span("Excel写入", 群聊=group_name, 日期=date_key, 订单数=len(batch.orders)):
+                        ok = self.write_func(batch.orders, group_name, date_key) is not False
+                except Exception as e:
+                    error = e
+                    ok = False
+                tracer.message_spans(batch.trace_ids, "Excel写入", trace_start,
+                                     结果="成功" if ok else "失败，稍后重试", 订单数=len(batch.orders))
+                if not ok:
+                    # 写入失败（例如文件正被Excel打开），放回队列等待下次重试
+                    self._requeue((group_name, date_key), batch, error)
+                    continue
+                if batch.failures:
+                    logger.info("%s %s 的Excel已恢复写入，之前失败了 %s 次", group_name, date_key, batch.failures)
+                end = time.time()
+                self.flush_latency.observe(end - start)
+                self.order_latency.observe(end - batch.first_submit)
+                logger.info("已合并写入 %s %s 的 %s 条订单，耗时 %.0fms",
+                            group_name, date_key, len(batch.orders), (end - start) * 1000)
@@ -0,0 +1,329 @@
+"""模拟微信
+
+实现 index 用到的 wxauto 接口（ChatWith、CurrentChat、GetAllMessage、SendMsg、GetWeChatTitle、
+GetSession、LoadMoreMessage），消息来自时间线文件，按时钟到点后出现在群聊中。
+机器人发送的消息记录在 sent 中，发送者为 self，和真实微信一样会出现在聊天记录里。
+
+时间线文件为JSONL，每行一条消息：
+    {"at": 30, "group": "英明中、晚饭订餐群", "sender": "张三", "content": "红烧肉饭，共2份"}
+at 可以是相对开始时间的秒数，也可以是 "HH:MM[:SS]"（当天）或 "YYYY-MM-DD HH:MM:SS"。
+
+直接运行本文件会以加速时钟回放时间线并无界面运行 index.monitor_group：
+    python fake_wechat.py timeline.jsonl --speed 60
+"""
+import json
+import random
+import threading
+import time
+from datetime import datetime
+
+import clock
+from bot_logging import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_NICKNAME = '良行上厨®快餐店订餐机器人'
+# GetAllMessage 返回的聊天窗口可见消息条数，LoadMoreMessage 每次多加载这么多
+DEFAULT_WINDOW_SIZE = 50
+
+
+class FakeMessage:
+    """模拟的消息对象，属性与wxauto的消息一致"""
+
+    def __init__(self, id, sender, content, time, attr="friend"):
+        self.id = id
+        self.sender = sender
+        self.content = content
+        self.time = time
+        self.attr = attr
+
+    def __repr__(self):
+        return f"FakeMessage({self.sender}: {self.content!r})"
+
+
+class FakeSession:
+    """模拟的会话列表元素"""
+
+    def __init__(self, name, content, time, new_count):
+        self.name = name
+        self.content = content
+        self.time = time
+        self.new_count = new_count
+        self.isnew = new_count > 0
+
+
+def _parse_at(at, start):
+    """把时间线中的 at 字段换算为时间戳"""
+    if isinstance(at, (int, float)):
+        return start + at
+    text = str(at).strip()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    base = datetime.fromtimestamp(start)
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            moment = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return base.replace(hour=moment.hour, minute=moment.minute, second=moment.second,
+                            microsecond=0).timestamp()
+    return start + float(text)
+
+
+def load_timeline(path):
+    """读取JSONL时间线文件，跳过空行和#开头的注释行"""
+    timeline = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                timeline.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                logger.warning("时间线第%s行格式错误，已跳过: %s", line_no, e)
+    return timeline
+
+
+def save_timeline(timeline, path):
+    """保存时间线为JSONL文件"""
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in timeline:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def generate_timeline(groups, orders_per_group=50, duration=3600, mention_every=20,
+                      bot_name=DEFAULT_NICKNAME, seed=None):
+    """生成一份随机的订餐时间线
+
+    Args:
+        groups: 群聊名称列表
+        orders_per_group: 每个群聊的订单消息数
+        duration: 消息分布在开始后多少秒内
+        mention_every: 每隔多少条订单插入一条@机器人的消息，0表示不插入
+        bot_name: 机器人名称
+        seed: 随机种子，相同种子生成相同的时间线
+    """
+    rng = random.Random(seed)
+    dishes = ["红烧肉饭", "鱼香肉丝饭", "宫保鸡丁饭", "番茄炒蛋饭", "麻婆豆腐饭", "青椒肉丝饭"]
+    names = ["张三", "李四", "王五", "赵六", "钱七", "孙八", "周九", "吴十"]
+    timeline = []
+    for group in groups:
+        for i in range(orders_per_group):
+            sender = f"同事{rng.randint(1, 200)}"
+            if rng.random() < 0.2:
+                people = rng.sample(names, rng.randint(1, 4))
+                content = f"{' '.join(people)}，共{len(people)}人"
+            else:
+                content = f"{rng.choice(dishes)}，共{rng.randint(1, 3)}份"
+            timeline.append({"at": round(rng.uniform(0, duration), 3), "group": group,
+                             "sender": sender, "content": content})
+            if mention_every and (i + 1) % mention_every == 0:
+                timeline.append({"at": round(rng.uniform(0, duration), 3), "group": group,
+                                 "sender": sender, "content": f"@{bot_name} 统计一下"})
+    timeline.sort(key=lambda entry: entry["at"])
+    return timeline
+
+
+class _Chat:
+    def __init__(self, name):
+        self.name = name
+        self.messages = []
+        self.unread = 0
+
+
+class FakeWeChat:
+    """按时间线回放消息的模拟微信
+
+    Args:
+        timeline: 时间线消息列表，格式见模块说明
+        nickname: 登录的微信昵称，GetWeChatTitle 返回它
+        window_size: GetAllMessage 返回最近多少条消息
+        op_latency: 每次界面操作额外耗费的真实时间（秒），用于模拟UI自动化的开销
+        groups: 额外存在但时间线中没有消息的群聊
+    """
+
+    def __init__(self, timeline=(), nickname=DEFAULT_NICKNAME, window_size=DEFAULT_WINDOW_SIZE,
+                 op_latency=0.0, groups=()):
+        self.nickname = nickname
+        self.window_size = window_size
+        self.op_latency = op_latency
+        self._lock = threading.RLock()
+        self._chats = {}
+        self._current = None
+        self._visible = window_size
+        self._ids = 0
+        self._start = clock.time()
+        self._pending = []
+        # 机器人发送的消息 [(群聊, 内容, 时间戳)]
+        self.sent = []
+        # 各接口调用次数
+        self.calls = {}
+        for group in groups:
+            self._chat(group)
+        for entry in timeline:
+            self._chat(entry["group"])
+            self._pending.append((_parse_at(entry.get("at", 0), self._start), entry))
+        self._pending.sort(key=lambda item: item[0])
+
+    def _chat(self, name):
+        chat = self._chats.get(name)
+        if chat is None:
+            chat = self._chats[name] = _Chat(name)
+        return chat
+
+    def _op(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.op_latency:
+            time.sleep(self.op_latency)
+
+    def _append(self, chat, sender, content, at, attr="friend"):
+        self._ids += 1
+        msg = FakeMessage(f"fake-{self._ids}", sender, content,
+                          datetime.fromtimestamp(at).strftime("%Y-%m-%d %H:%M:%S"), attr)
+        chat.messages.append(msg)
+        return msg
+
+    def _release(self):
+        """把已经到时间的时间线消息放进群聊"""
+        now = clock.time()
+        released = 0
+        while released < len(self._pending) and self._pending[released][0] <= now:
+            at, entry = self._pending[released]
+            chat = self._chat(entry["group"])
+            self._append(chat, entry.get("sender", "未知用户"), entry.get("content", ""), at)
+            if chat.name != self._current:
+                chat.unread += 1
+            released += 1
+        if released:
+            del self._pending[:released]
+
+    def remaining(self):
+        """时间线中还没有出现的消息数"""
+        with self._lock:
+            self._release()
+            return len(self._pending)
+
+    def add_message(self, group, sender, content, at=None):
+        """立即向群聊添加一条消息"""
+        with self._lock:
+            self._release()
+            chat = self._chat(group)
+            msg = self._append(chat, sender, content, at if at is not None else clock.time())
+            if chat.name != self._current:
+                chat.unread += 1
+            return msg
+
+    # wxauto 接口
+
+    def GetWeChatTitle(self):
+        self._op("GetWeChatTitle")
+        return self.nickname
+
+    def ChatWith(self, who):
+        self._op("ChatWith")
+        with self._lock:
+            self._release()
+            chat = self._chats.get(who)
+            if chat is None:
+                return False
+            if self._current != who:
+                self._current = who
+                self._visible = self.window_size
+            chat.unread = 0
+            return who
+
+    def CurrentChat(self):
+        """当前打开的聊天名称"""
+        self._op("CurrentChat")
+        with self._lock:
+            return self._current
+
+    def GetAllMessage(self):
+        self._op("GetAllMessage")
+        with self._lock:
+            self._release()
+            if self._current is None:
+                return []
+            chat = self._chats[self._current]
+            chat.unread = 0
+            return list(chat.messages[-self._visible:])
+
+    def LoadMoreMessage(self):
+        """向上加载更多历史消息，已经没有更多时返回False"""
+        self._op("LoadMoreMessage")
+        with self._lock:
+            if self._current is None:
+                return False
+            if self._visible >= len(self._chats[self._current].messages):
+                return False
+            self._visible += self.window_size
+            return True
+
+    def SendMsg(self, msg, who=None):
+        self._op("SendMsg")
+        with self._lock:
+            # 和wxauto一样，指定的接收人不是当前聊天时才切换
+            if who is not None and self._current != who and not self.ChatWith(who):
+                return False
+            if self._current is None:
+                return False
+            now = clock.time()
+            self._append(self._chats[self._current], "self", msg, now, attr="self")
+            self.sent.append((self._current, msg, now))
+            return True
+
+    def GetSession(self):
+        self._op("GetSession")
+        with self._lock:
+            self._release()
+            sessions = []
+            for chat in self._chats.values():
+                last = chat.messages[-1] if chat.messages else None
+                sessions.append(FakeSession(chat.name, last.content if last else None,
+                                            last.time if last else None, chat.unread))
+            return sessions
+
+
+def main():
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="用模拟微信回放时间线，无界面运行订餐机器人")
+    parser.add_argument("timeline", nargs="?", help="时间线JSONL文件，不指定时随机生成")
+    parser.add_argument("--speed", type=float, default=60.0, help="时钟倍速")
+    parser.add_argument("--generate", metavar="PATH", help="只生成随机时间线到指定文件")
+    parser.add_argument("--orders", type=int, default=50, help="随机时间线每个群聊的订单数")
+    parser.add_argument("--duration", type=float, default=3600, help="随机时间线的时长（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    args = parser.parse_args()
+
+    if args.generate or not args.timeline:
+        # 群聊名称与index保持一致，但生成时间线不需要导入index
+        groups = ["英明中、晚饭订餐群"]
+        path = args.generate or "fake_timeline.jsonl"
+        save_timeline(generate_timeline(groups, args.orders, args.duration, seed=args.seed), path)
+        print(f"已生成时间线: {path}")
+        if args.generate:
+            return
+        args.timeline = path
+
+    os.environ["WXBOT_BACKEND"] = "fake"
+    os.environ["WXBOT_TIMELINE"] = args.timeline
+    clock.set_clock(clock.AcceleratedClock(args.speed))
+
+    import index
+    try:
+        index.monitor_group()
+    except KeyboardInterrupt:
+        print("已停止")
+    finally:
+        index.excel_writer.stop()
+        print(f"共发送 {len(index.wx.sent)} 条消息")
+
+
+if __name__ == "__main__":
+    main()
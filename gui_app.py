@@ -1,49 +1,181 @@
 
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, simpledialog
 import threading
 import os
 import sys
 import time
-import re
 from datetime import datetime
 import json
+import logging
+import queue
+from collections import deque
+
+# 进程启动时间，用于统计界面启动耗时
+STARTUP_T0 = time.perf_counter()
 
 # 导入主程序模块
 try:
-    from index import WeChat, monitor_group, collect_orders, save_to_excel, BOT_NAME, generate_summary
+    import index
+    from index import collect_orders, BOT_NAME
 except ImportError:
     # 如果直接运行GUI，可能需要添加路径
     import sys
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from index import WeChat, monitor_group, collect_orders, save_to_excel, BOT_NAME, generate_summary
+    import index
+    from index import collect_orders, BOT_NAME
+
+import bot_logging
+import profiling
+from bot_logging import get_logger
+from metrics import registry
+
+logger = get_logger(__name__)
+
+# 日志窗口最多保留的行数，超出后删除最早的行
+LOG_MAX_LINES = 2000
+# 日志窗口刷新间隔（毫秒）
+LOG_PUMP_INTERVAL = 100
+# 每次刷新最多取出的日志条数，积压很多时分几次显示，避免界面卡顿
+LOG_PUMP_BATCH = 500
+# 订餐数量标签的刷新间隔（毫秒）
+ORDER_COUNT_PUMP_INTERVAL = 200
+# 运行指标面板的刷新间隔（毫秒）
+METRICS_PANEL_INTERVAL = 2000
+# 界面触发的性能分析时长（秒）和检查分析是否结束的间隔（毫秒）
+PROFILE_DURATION = 60
+PROFILE_POLL_INTERVAL = 1000
+# 日志级别筛选
+LOG_LEVELS = {"全部": logging.DEBUG, "信息": logging.INFO, "警告": logging.WARNING, "错误": logging.ERROR}
+
+class QueueLogHandler(logging.Handler):
+    """把日志放入队列，由界面线程定时取出显示"""
+    def __init__(self, log_queue):
+        super().__init__()
+        self.log_queue = log_queue
+        self.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%H:%M:%S"))
+    
+    def emit(self, record):
+        try:
+            self.log_queue.put((record.levelno, self.format(record)))
+        except Exception:
+            self.handleError(record)
 
 class RedirectText:
-    """重定向标准输出到文本控件"""
-    def __init__(self, text_widget):
-        self.text_widget = text_widget
+    """重定向标准输出，按行放入日志队列，不在打印的线程里操作控件"""
+    def __init__(self, log_queue):
+        self.log_queue = log_queue
         self.buffer = ""
+        self._lock = threading.Lock()
         
     def write(self, string):
-        self.buffer += string
-        # 如果包含换行符，则更新文本控件
-        if '\n' in self.buffer:
-            self.text_widget.config(state=tk.NORMAL)
+        with self._lock:
+            self.buffer += string
+            if '\n' not in self.buffer:
+                return
             lines = self.buffer.split('\n')
-            for i, line in enumerate(lines[:-1]):
-                if line.strip():  # 只添加非空行
-                    self.text_widget.insert(tk.END, line + '\n')
-            self.text_widget.see(tk.END)  # 自动滚动到底部
-            self.text_widget.config(state=tk.DISABLED)
             self.buffer = lines[-1]
+        for line in lines[:-1]:
+            if line.strip():  # 只添加非空行
+                self.log_queue.put((logging.INFO, line))
     
     def flush(self):
-        if self.buffer:
-            self.text_widget.config(state=tk.NORMAL)
-            self.text_widget.insert(tk.END, self.buffer)
-            self.text_widget.see(tk.END)
-            self.text_widget.config(state=tk.DISABLED)
-            self.buffer = ""
+        with self._lock:
+            line, self.buffer = self.buffer, ""
+        if line.strip():
+            self.log_queue.put((logging.INFO, line))
+
+class LogView:
+    """有界的日志窗口
+    
+    任何线程都只把日志放进队列，界面线程每 LOG_PUMP_INTERVAL 毫秒取出一批，
+    一次插入控件；控件和历史记录都最多保留 max_lines 行。
+    暂停时日志仍然记录，恢复后按当前筛选条件重新显示。
+    """
+    def __init__(self, root, text_widget, max_lines=LOG_MAX_LINES):
+        self.root = root
+        self.text_widget = text_widget
+        self.max_lines = max_lines
+        self.queue = queue.SimpleQueue()
+        self.history = deque(maxlen=max_lines)
+        self.paused = False
+        self.min_level = logging.DEBUG
+        self.keyword = ""
+        self.text_widget.tag_configure("warning", foreground="#b36b00")
+        self.text_widget.tag_configure("error", foreground="#c00000")
+    
+    def start(self):
+        self.root.after(LOG_PUMP_INTERVAL, self._pump)
+    
+    def _visible(self, item):
+        levelno, line = item
+        return levelno >= self.min_level and (not self.keyword or self.keyword in line)
+    
+    @staticmethod
+    def _tag(levelno):
+        if levelno >= logging.ERROR:
+            return ("error",)
+        if levelno >= logging.WARNING:
+            return ("warning",)
+        return ()
+    
+    def _pump(self):
+        items = []
+        for _ in range(LOG_PUMP_BATCH):
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.history.append(item)
+            if not self.paused and self._visible(item):
+                items.append(item)
+        if items:
+            self._insert(items)
+        try:
+            self.root.after(LOG_PUMP_INTERVAL, self._pump)
+        except tk.TclError:
+            pass  # 窗口已关闭
+    
+    def _insert(self, items):
+        """一次插入多行，删除超出上限的旧行，只滚动一次"""
+        args = []
+        for levelno, line in items:
+            args.extend((line + "\n", self._tag(levelno)))
+        self.text_widget.config(state=tk.NORMAL)
+        self.text_widget.insert(tk.END, *args)
+        line_count = int(self.text_widget.index("end-1c").split(".")[0]) - 1
+        if line_count > self.max_lines:
+            self.text_widget.delete("1.0", f"{line_count - self.max_lines + 1}.0")
+        self.text_widget.see(tk.END)
+        self.text_widget.config(state=tk.DISABLED)
+    
+    def rerender(self):
+        """按当前筛选条件重新显示历史记录"""
+        self.text_widget.config(state=tk.NORMAL)
+        self.text_widget.delete("1.0", tk.END)
+        self.text_widget.config(state=tk.DISABLED)
+        items = [item for item in self.history if self._visible(item)]
+        if items:
+            self._insert(items)
+    
+    def set_paused(self, paused):
+        self.paused = paused
+        if not paused:
+            self.rerender()
+    
+    def set_filter(self, min_level=None, keyword=None):
+        if min_level is not None:
+            self.min_level = min_level
+        if keyword is not None:
+            self.keyword = keyword.strip()
+        if not self.paused:
+            self.rerender()
+    
+    def clear(self):
+        self.history.clear()
+        self.text_widget.config(state=tk.NORMAL)
+        self.text_widget.delete("1.0", tk.END)
+        self.text_widget.config(state=tk.DISABLED)
 
 class WeChatBotApp:
     def __init__(self, root):
@@ -123,17 +255,58 @@ class WeChatBotApp:
         self.open_excel_btn = ttk.Button(control_frame, text="打开当天Excel", command=self.open_today_excel)
         self.open_excel_btn.pack(side=tk.LEFT, padx=5)
         
+        # 运行指标面板
+        ttk.Button(control_frame, text="运行指标", command=self.open_metrics_panel).pack(side=tk.RIGHT, padx=5)
+        self.metrics_window = None
+        
+        # 导出消息追踪
+        ttk.Button(control_frame, text="导出追踪", command=self.export_trace).pack(side=tk.RIGHT, padx=5)
+        
+        # 性能分析，进行中再次点击提前结束
+        self.profile_btn = ttk.Button(control_frame, text="性能分析", command=self.toggle_profiling)
+        self.profile_btn.pack(side=tk.RIGHT, padx=5)
+        self.profile_session = None
+        
         # 创建日志显示区域，减少其高度以腾出空间给状态栏
         log_frame = ttk.LabelFrame(self.main_frame, text="运行日志")
         log_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 5), padx=5)  # 减少底部padding
         
+        # 日志工具栏：暂停、级别筛选、关键字筛选、清空
+        log_toolbar = ttk.Frame(log_frame)
+        log_toolbar.pack(fill=tk.X, padx=5, pady=(5, 0))
+        
+        self.log_paused_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(log_toolbar, text="暂停", variable=self.log_paused_var,
+                        command=lambda: self.log_view.set_paused(self.log_paused_var.get())).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(log_toolbar, text="级别:").pack(side=tk.LEFT, padx=(10, 2))
+        self.log_level_var = tk.StringVar(value="全部")
+        level_box = ttk.Combobox(log_toolbar, textvariable=self.log_level_var, values=list(LOG_LEVELS),
+                                 state="readonly", width=6)
+        level_box.pack(side=tk.LEFT, padx=2)
+        level_box.bind("<<ComboboxSelected>>",
+                       lambda event: self.log_view.set_filter(min_level=LOG_LEVELS[self.log_level_var.get()]))
+        
+        ttk.Label(log_toolbar, text="过滤:").pack(side=tk.LEFT, padx=(10, 2))
+        self.log_keyword_var = tk.StringVar()
+        ttk.Entry(log_toolbar, textvariable=self.log_keyword_var, width=20).pack(side=tk.LEFT, padx=2)
+        self.log_keyword_var.trace_add("write",
+                                       lambda *args: self.log_view.set_filter(keyword=self.log_keyword_var.get()))
+        
+        ttk.Button(log_toolbar, text="清空", command=lambda: self.log_view.clear()).pack(side=tk.RIGHT, padx=5)
+        
         # 日志文本区域
         self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, state=tk.DISABLED)
         self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # 重定向标准输出到日志区域
-        self.redirect = RedirectText(self.log_text)
+        # 日志和标准输出都先放入队列，由界面线程定时批量显示
+        self.log_view = LogView(self.root, self.log_text)
+        self.log_handler = QueueLogHandler(self.log_view.queue)
+        bot_logging.add_handler(self.log_handler)
+        bot_logging.set_console(False)
+        self.redirect = RedirectText(self.log_view.queue)
         sys.stdout = self.redirect
+        self.log_view.start()
         
         # 机器人线程
         self.bot_thread = None
@@ -166,11 +339,16 @@ class WeChatBotApp:
         self.update_clock()
         
         # 打印初始信息
-        print(f"微信订餐机器人界面已启动")
-        print(f"当前机器人名称: {BOT_NAME}")
-        
-        # 初始化订餐数量
-        self.refresh_order_counts()
+        logger.info("微信订餐机器人界面已启动")
+        logger.info("当前机器人名称: %s", BOT_NAME)
+        
+        # 订餐数量标签由台账变化驱动，不在界面线程读取聊天记录
+        self.reconciling = False
+        self.count_updates = queue.SimpleQueue()
+        self.unsubscribe_ledger = index.ledger.subscribe(self.on_ledger_changed)
+        self.show_ledger_counts()
+        self.load_order_counts()
+        self.root.after(ORDER_COUNT_PUMP_INTERVAL, self._pump_order_counts)
     
     def update_clock(self):
         """更新时钟显示"""
@@ -221,45 +399,91 @@ class WeChatBotApp:
             self.at_entries.pop()
             self.order_count_labels.pop()
     
+    def on_ledger_changed(self, group_name, date_key, totals):
+        """台账有新订单时调用（在入账的线程中），只放入队列，由界面线程更新标签"""
+        self.count_updates.put((group_name, date_key, totals))
+    
+    def _pump_order_counts(self):
+        """定时取出台账变化，每个群聊只用最新的一条更新标签"""
+        latest = {}
+        while True:
+            try:
+                group_name, date_key, totals = self.count_updates.get_nowait()
+            except queue.Empty:
+                break
+            latest[(group_name, date_key)] = totals
+        if latest:
+            today = index.get_today_date()
+            for (group_name, date_key), totals in latest.items():
+                if date_key == today:
+                    self.set_order_count(group_name, totals)
+        try:
+            self.root.after(ORDER_COUNT_PUMP_INTERVAL, self._pump_order_counts)
+        except tk.TclError:
+            pass  # 窗口已关闭
+    
+    @staticmethod
+    def format_order_count(totals):
+        """标签文本：有人员名单时显示名单人数，否则显示订餐人数和份数"""
+        if totals["人员名单数"]:
+            return f"{totals['名单人数']}人"
+        return f"{totals['人数']}人/{totals['份数']}份"
+    
+    def set_order_count(self, group_name, totals):
+        """更新指定群聊的订餐数量标签（界面线程）"""
+        for entry, count_var in zip(self.group_entries, self.order_count_labels):
+            if entry.get().strip() == group_name:
+                count_var.set(self.format_order_count(totals))
+    
+    def show_ledger_counts(self):
+        """用台账中已有的累计数据显示所有群聊的订餐数量，不操作微信"""
+        for entry, count_var in zip(self.group_entries, self.order_count_labels):
+            group_name = entry.get().strip()
+            if group_name:
+                count_var.set(self.format_order_count(index.ledger.get_totals(group_name)))
+    
+    def load_order_counts(self):
+        """启动时在后台从订单日志加载当天已保存的订单，加载结果通过台账订阅更新标签"""
+        group_names = [entry.get().strip() for entry in self.group_entries if entry.get().strip()]
+        
+        def load():
+            for group_name in group_names:
+                index.ensure_ledger_day(group_name)
+        
+        threading.Thread(target=load, name="LoadOrderCounts", daemon=True).start()
+    
     def refresh_order_counts(self):
-        """刷新所有群聊的订餐数量"""
-        print("正在刷新订餐数量...")
+        """在后台重新读取聊天记录核对订单，界面线程不等待
         
-        for i, group_entry in enumerate(self.group_entries):
-            group_name = group_entry.get().strip()
-            if not group_name:
-                continue
-                
-            try:
-                # 获取订单
-                orders = collect_orders(group_name)
-                
-                if orders:
-                    # 计算总人数和总份数
-                    people_set = set()
-                    total_count = 0
-                    
-                    for order in orders:
-                        people_set.add(order['发送人'])
-                        try:
-                            count = int(order.get('订餐数量', 1))
-                            total_count += count
-                        except:
-                            total_count += 1
-                    
-                    people_count = len(people_set)
-                    
-                    # 更新显示
-                    self.order_count_labels[i].set(f"{people_count}人/{total_count}份")
-                    print(f"群聊 '{group_name}' 当前订餐: {people_count}人/{total_count}份")
-                else:
-                    self.order_count_labels[i].set("0人/0份")
-                    
-            except Exception as e:
-                print(f"刷新群聊 '{group_name}' 订餐数量时出错: {e}")
-                self.order_count_labels[i].set("错误")
+        核对出的新订单写入台账后，标签由台账订阅自动更新。
+        """
+        if self.reconciling:
+            return
+        group_names = [entry.get().strip() for entry in self.group_entries if entry.get().strip()]
+        if not group_names:
+            return
         
-        print("订餐数量刷新完成")
+        logger.info("正在刷新订餐数量...")
+        self.reconciling = True
+        self.refresh_btn.config(state=tk.DISABLED)
+        
+        def reconcile():
+            for group_name in group_names:
+                try:
+                    # 界面刷新的优先级低于回复和扫描
+                    collect_orders(group_name, index.PRIORITY_REFRESH)
+                except Exception as e:
+                    logger.error("刷新群聊 '%s' 订餐数量时出错: %s", group_name, e)
+            logger.info("订餐数量刷新完成")
+            self.root.after(0, self._reconcile_done)
+        
+        threading.Thread(target=reconcile, name="ReconcileOrders", daemon=True).start()
+    
+    def _reconcile_done(self):
+        self.reconciling = False
+        self.refresh_btn.config(state=tk.NORMAL)
+        # 没有新订单时台账不会通知，这里再按台账显示一次
+        self.show_ledger_counts()
     
     def load_config(self):
         """加载配置文件"""
@@ -268,7 +492,7 @@ class WeChatBotApp:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     return json.load(f)
             except Exception as e:
-                print(f"加载配置文件失败: {e}")
+                logger.error("加载配置文件失败: %s", e)
         
         # 返回默认配置
         return {
@@ -295,7 +519,7 @@ class WeChatBotApp:
                 json.dump(config, f, ensure_ascii=False, indent=2)
             
             messagebox.showinfo("保存成功", "配置已保存")
-            print("配置已保存")
+            logger.info("配置已保存")
             
             # 更新全局变量
             import index
@@ -304,7 +528,7 @@ class WeChatBotApp:
             
         except Exception as e:
             messagebox.showerror("保存失败", f"保存配置失败: {e}")
-            print(f"保存配置失败: {e}")
+            logger.error("保存配置失败: %s", e)
     
     def start_bot(self):
         """启动机器人"""
@@ -321,33 +545,29 @@ class WeChatBotApp:
         self.stop_btn.config(state=tk.NORMAL)
         
         # 清空日志
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.delete(1.0, tk.END)
-        self.log_text.config(state=tk.DISABLED)
+        self.log_view.clear()
         
         # 启动机器人线程
         self.bot_thread = threading.Thread(target=self.run_bot)
         self.bot_thread.daemon = True
         self.bot_thread.start()
         
-        print("机器人已启动")
+        logger.info("机器人已启动")
     
     def run_bot(self):
         """运行机器人的线程函数"""
         try:
-            print("订餐统计机器人已启动...")
-            print(f"机器人名称: {BOT_NAME}")
+            logger.info("订餐统计机器人已启动...")
+            logger.info("机器人名称: %s", BOT_NAME)
             
-            # 首次运行时收集并保存当前订单
-            for group_name in index.GROUP_NAMES:
-                orders = index.collect_orders(group_name)
-                index.save_to_excel(orders, group_name)
+            # 首次运行时收集并保存当前订单，有当天的检查点时直接从订单日志恢复
+            index.warm_start()
             
             # 调用原始的监控函数
             index.monitor_group()
             
         except Exception as e:
-            print(f"程序运行出错: {e}")
+            logger.error("程序运行出错: %s", e)
             self.stop_bot()
     
     def stop_bot(self):
@@ -363,32 +583,69 @@ class WeChatBotApp:
         if self.bot_thread and self.bot_thread.is_alive():
             self.bot_thread.join(timeout=2)
         
-        print("机器人已停止")
+        # 在后台写入等待中的订单，重写工作簿期间界面不会卡住
+        self.status_var.set("正在保存订单...")
+        
+        def flushed(result, error):
+            if error is not None:
+                logger.error("写入等待中的订单时出错: %s", error)
+            if not self.running:
+                self.status_var.set("已停止")
+            logger.info("机器人已停止")
+        
+        self._run_in_background("FlushOrders", index.excel_writer.flush, flushed)
+    
+    def _run_in_background(self, name, work, done=None):
+        """在后台线程中执行耗时的操作（例如写入Excel），完成后在界面线程中调用 done(结果, 异常)"""
+        def run():
+            result, error = None, None
+            try:
+                result = work()
+            except Exception as e:
+                error = e
+            if done is None:
+                return
+            try:
+                self.root.after(0, lambda: done(result, error))
+            except (RuntimeError, tk.TclError):
+                pass  # 窗口已经关闭
+        
+        threading.Thread(target=run, name=name, daemon=True).start()
     
     def open_group_excel(self, group_name=None):
-        """打开指定群聊的Excel文件"""
-        try:
-            # 如果没有指定群聊名称，则使用当前选中的群聊
-            if not group_name:
-                # 获取第一个有效的群聊名称
-                for entry in self.group_entries:
-                    group_name = entry.get().strip()
-                    if group_name:
-                        break
-                
-                if not group_name:
-                    messagebox.showwarning("提示", "请先配置群聊名称")
-                    return
-            
-            # 获取当前月份
-            current_month = datetime.now().strftime("%m月")
+        """打开指定群聊的Excel文件，打开前在后台从订单日志导出当天的最新数据"""
+        # 如果没有指定群聊名称，则使用当前选中的群聊
+        if not group_name:
+            # 获取第一个有效的群聊名称
+            for entry in self.group_entries:
+                group_name = entry.get().strip()
+                if group_name:
+                    break
             
+            if not group_name:
+                messagebox.showwarning("提示", "请先配置群聊名称")
+                return
+        
+        def export():
+            index.excel_writer.flush(group_name)
+            index.export_to_excel(group_name)
+        
+        def exported(result, error):
+            if error is not None:
+                logger.error("导出 %s 的Excel时出错: %s", group_name, error)
+            self._open_excel_file(group_name)
+        
+        logger.info("正在导出 %s 的最新订单...", group_name)
+        self._run_in_background("ExportExcel", export, exported)
+    
+    def _open_excel_file(self, group_name):
+        """用系统默认程序打开群聊的Excel文件，找不到当月文件时打开最新的一个"""
+        try:
             # 构建Excel文件路径: /订餐统计/月份_群聊名称_订餐统计表.xlsx
             excel_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "订餐统计")
-            excel_filename = f"{current_month}_{group_name}_订餐统计表.xlsx"
-            excel_path = os.path.join(excel_dir, excel_filename)
+            excel_path = os.path.abspath(index.get_excel_path(group_name))
             
-            print(f"尝试打开Excel文件: {excel_path}")
+            logger.info("尝试打开Excel文件: %s", excel_path)
             
             # 检查文件是否存在
             if os.path.exists(excel_path):
@@ -399,7 +656,7 @@ class WeChatBotApp:
                     import subprocess
                     subprocess.call(('open' if sys.platform == 'darwin' else 'xdg-open', excel_path))
                 
-                print(f"已打开Excel文件: {excel_path}")
+                logger.info("已打开Excel文件: %s", excel_path)
             else:
                 # 如果找不到指定月份的文件，尝试查找该群聊的任何Excel文件
                 found_files = []
@@ -419,15 +676,15 @@ class WeChatBotApp:
                         import subprocess
                         subprocess.call(('open' if sys.platform == 'darwin' else 'xdg-open', latest_file))
                     
-                    print(f"找不到当月文件，已打开最新的Excel文件: {latest_file}")
+                    logger.info("找不到当月文件，已打开最新的Excel文件: %s", latest_file)
                 else:
                     messagebox.showwarning("文件未找到", f"未找到群聊 '{group_name}' 的Excel文件")
-                    print(f"未找到群聊 '{group_name}' 的Excel文件")
+                    logger.warning("未找到群聊 '%s' 的Excel文件", group_name)
         
         except Exception as e:
             error_msg = f"打开Excel文件时出错: {e}"
             messagebox.showerror("错误", error_msg)
-            print(error_msg)
+            logger.error("%s", error_msg)
     
     def open_today_excel(self):
         """打开当天的Excel文件"""
@@ -439,25 +696,99 @@ class WeChatBotApp:
             
             if os.path.exists(excel_file):
                 os.startfile(excel_file)  # Windows系统
-                print(f"已打开Excel文件: {excel_file}")
+                logger.info("已打开Excel文件: %s", excel_file)
             else:
                 messagebox.showwarning("文件未找到", f"未找到当天的Excel文件: {excel_file}")
-                print(f"Excel文件不存在: {excel_file}")
+                logger.warning("Excel文件不存在: %s", excel_file)
                 
         except Exception as e:
             messagebox.showerror("打开失败", f"打开Excel文件失败: {e}")
-            print(f"打开Excel文件失败: {e}")
+            logger.error("打开Excel文件失败: %s", e)
+    
+    def open_metrics_panel(self):
+        """打开运行指标面板，每隔 METRICS_PANEL_INTERVAL 毫秒刷新一次"""
+        if self.metrics_window is not None and self.metrics_window.winfo_exists():
+            self.metrics_window.lift()
+            return
+        window = tk.Toplevel(self.root)
+        window.title("运行指标")
+        window.geometry("720x420")
+        text = scrolledtext.ScrolledText(window, wrap=tk.NONE, state=tk.DISABLED)
+        text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        ttk.Label(window, text=f"Prometheus文件: {os.path.abspath(index.METRICS_FILE)}").pack(anchor=tk.W, padx=5)
+        if index.metrics_http_port():
+            ttk.Label(window, text=f"HTTP: http://127.0.0.1:{index.metrics_http_port()}/metrics").pack(anchor=tk.W, padx=5)
+        self.metrics_window = window
+        
+        def refresh():
+            if not window.winfo_exists():
+                return
+            content = registry.summary() or "暂无指标"
+            text.config(state=tk.NORMAL)
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, content)
+            text.config(state=tk.DISABLED)
+            window.after(METRICS_PANEL_INTERVAL, refresh)
+        
+        refresh()
+    
+    def export_trace(self):
+        """导出消息追踪，可以只导出发送人或内容包含关键字的消息"""
+        keyword = simpledialog.askstring(
+            "导出追踪", "只导出发送人、内容或时间包含以下关键字的消息（留空导出全部）:", parent=self.root)
+        if keyword is None:
+            return
+        try:
+            path = index.export_trace(keyword=keyword.strip() or None)
+            messagebox.showinfo("导出追踪", f"已导出到 {os.path.abspath(path)}\n"
+                                "可在 chrome://tracing 或 https://ui.perfetto.dev 中打开")
+        except Exception as e:
+            messagebox.showerror("导出失败", f"导出消息追踪失败: {e}")
+            logger.error("导出消息追踪失败: %s", e)
+    
+    def toggle_profiling(self):
+        """开始一次 PROFILE_DURATION 秒的性能分析，进行中时提前结束"""
+        session = self.profile_session
+        if session is not None and session.running:
+            # 写入结果可能需要几秒，不在界面线程中执行
+            threading.Thread(target=session.stop, name="ProfileStop", daemon=True).start()
+            return
+        self.profile_session = profiling.start_profiling(PROFILE_DURATION)
+        if self.profile_session is None:
+            messagebox.showwarning("性能分析", "已有性能分析在进行中")
+            return
+        self.profile_btn.config(text="结束分析")
+        self.root.after(PROFILE_POLL_INTERVAL, self._check_profiling)
+    
+    def _check_profiling(self):
+        """分析结束后恢复按钮并显示结果文件"""
+        session = self.profile_session
+        if session is not None and session.running:
+            self.root.after(PROFILE_POLL_INTERVAL, self._check_profiling)
+            return
+        self.profile_btn.config(text="性能分析")
+        if session is None:
+            return
+        if session.files:
+            messagebox.showinfo("性能分析", "结果已写入:\n" + "\n".join(os.path.abspath(path) for path in session.files))
+        else:
+            messagebox.showwarning("性能分析", "没有采集到数据")
     
     def on_closing(self):
         """窗口关闭事件"""
         if self.running:
-            if messagebox.askokcancel("退出确认", "机器人正在运行中，确定要退出吗？"):
-                self.stop_bot()
-                self.root.destroy()
-        else:
-            self.root.destroy()
+            if not messagebox.askokcancel("退出确认", "机器人正在运行中，确定要退出吗？"):
+                return
+            self.stop_bot()
+        # 窗口销毁后日志和台账变化不再输出到界面
+        bot_logging.remove_handler(self.log_handler)
+        self.unsubscribe_ledger()
+        sys.stdout = sys.__stdout__
+        self.root.destroy()
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = WeChatBotApp(root)
+    # 窗口第一次空闲时界面已经显示出来
+    root.after_idle(lambda: logger.info("界面启动耗时 %.0fms", (time.perf_counter() - STARTUP_T0) * 1000))
     root.mainloop()
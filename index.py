@@ -1,35 +1,34 @@
 
-from wxauto import WeChat
 import re
 import os
-import time
-import pandas as pd
+import clock
+import atexit
+import logging
+import shutil
+import threading
 from datetime import datetime
+from order_ledger import OrderLedger, make_order_key, count_people, format_summary
+from order_parser import parse_order, parse_orders, parse_orders_batch
+from excel_writer import ExcelWriteBehind
+from order_journal import OrderJournal
+from metrics import LatencyHistogram, MetricsFileExporter, registry, start_http_server, timed
+from poll_scheduler import AdaptivePollScheduler
+from session_probe import SessionChangeDetector
+from wx_actor import WeChatActor, PRIORITY_REPLY, PRIORITY_SCAN, PRIORITY_REFRESH
+from order_pipeline import Pipeline, Stage, MessageBatch, ParsedBatch
+from wechat_backend import create_wechat
+from tracing import tracer
+from checkpoint import MonitorCheckpoint
+from deadline_scheduler import DeadlineScheduler
+from message_dedupe import ProcessedMessageIds
+from message_time import normalize_time, day_start, is_today
+from bot_logging import setup_logging, get_logger
 
-# 尝试导入schedule模块，如果不存在则使用自定义的定时功能
-
-try:
-    import schedule
-    HAS_SCHEDULE = True
-except ImportError:
-    HAS_SCHEDULE = False
-    print("警告: 未安装schedule模块，将使用简单的定时功能")
-
-# 初始化微信实例
-wx = WeChat()
-# 获取微信窗口标题 - 修复这部分代码
-try:
-    # 获取当前登录的微信名称
-    wx_window_name = wx.GetWeChatTitle()
-    print(f"初始化成功，获取到已登录窗口：{wx_window_name}")
-    # 更新BOT_NAME为实际的窗口名称
-    BOT_NAME = '良行上厨®快餐店订餐机器人'  # 直接使用实际的名称
-    print(f"设置机器人名称为：{BOT_NAME}")
-except Exception as e:
-    print(f"初始化微信窗口失败: {e}")
-    # 保持默认值
-    BOT_NAME = '良行上厨®快餐店订餐机器人'  # 使用实际名称作为默认值
-    print(f"使用默认机器人名称: {BOT_NAME}")
+# 日志在入口（monitor_group、界面）或第一次创建应用对象时才初始化，导入时不创建日志目录和写入线程
+logger = get_logger(__name__)
+
+# 机器人的微信名称（用于检测是否被@）
+BOT_NAME = '良行上厨®快餐店订餐机器人'
 
 # 修改群聊配置为列表
 # GROUP_NAMES = ["订餐测试群聊"]  #, "英明中、晚饭订餐群" 可以添加多个群聊名称
@@ -41,36 +40,224 @@ AT_PERSONS = {
 # 从AT_PERSONS中获取群聊名称列表，这样只监听设置了@人的群聊
 GROUP_NAMES = list(AT_PERSONS.keys())
 
+# 每天定时发送汇总的时刻："HH:MM"，汇总内容是当天的全部订单，每个群聊每天发送一次
+DEFAULT_SUMMARY_TIME = "16:00"
+# 单独设置汇总时刻的群聊：群聊 -> "HH:MM"
+SUMMARY_TIMES = {}
+# 启动晚了或监控被耽搁时，超过汇总时刻多久以内仍补发（秒）
+SUMMARY_GRACE = 1800
+
 # 统计文件保存路径
 SAVE_DIR = "订餐统计"
-# 机器人的微信名称（用于检测是否被@）
-# BOT_NAME = '订餐机器人'  #wx_window_name
-
-# 确保保存目录存在
-if not os.path.exists(SAVE_DIR):
-    os.makedirs(SAVE_DIR)
-
-# 解析订餐信息的正则表达式
-# 匹配格式如：人名xx xxx xxx xxx，共xx份
-ORDER_PATTERN = r'(.+?)，共(\d+)份'
-# 新增匹配格式如：龚建玲 陈可欣 柴奇 高菊玲 齐相霞 徐泽宇 李洋 宋孝营， 共8人
-# 支持中英文逗号，支持不同数量的空格
-ORDER_PATTERN_PEOPLE = r'(.+?)[,，]\s*共(\d+)人'
+
+# Excel统计表的列
+EXCEL_COLUMNS = ["发送人", "订餐内容", "订餐份数", "发送时间", "是否人员名单"]
+
+# 订单日志，所有订单先写入这里，Excel统计表由日志导出
+JOURNAL_FILE = os.path.join(SAVE_DIR, "orders.db")
+
+# 收集订单时最多向上加载历史消息的次数，启动晚了也能补上窗口外当天较早的订单
+HISTORY_MAX_LOADS = 10
+
+# 订餐消息的两种格式（xxx，共xx份 / 张三 李四， 共8人）由 order_parser 中预编译的正则识别
 # 检测@消息的正则表达式
 AT_PATTERN = r'@([^\s]+)'
 
+# 按群聊、按日期维护的订单台账，监控循环只向其中追加新消息
+ledger = OrderLedger()
+
+# @消息从检测到回复完成的延迟
+mention_latency = registry.histogram("wxbot_mention_reply_seconds", "@消息从检测到回复完成的延迟",
+                                     histogram=LatencyHistogram("@回复延迟"))
+
+# 解析和去重的计数
+messages_parsed = registry.counter("wxbot_messages_parsed_total", "解析的消息数")
+orders_parsed = registry.counter("wxbot_orders_parsed_total", "解析出的订单数")
+# 标签 source: collect（全量收集时重复）、ledger（台账中已有）、journal（订单日志中已有）
+duplicate_orders = registry.counter("wxbot_duplicate_orders_total", "去重过滤的订单数", "source")
+
+# 指标导出：Prometheus文本文件，以及本机HTTP端口
+# METRICS_PORT 为None时在开始导出时读取环境变量 WXBOT_METRICS_PORT（默认9108），0表示不开启
+METRICS_FILE = os.path.join(SAVE_DIR, "metrics.prom")
+METRICS_FILE_INTERVAL = 15
+METRICS_PORT = None
+DEFAULT_METRICS_PORT = 9108
+_metrics_exporter = None
+# 已开启的HTTP指标端口，0表示没有开启
+_metrics_http_port = 0
+
+# 消息追踪导出文件（Chrome trace-event JSON），在界面中点击"导出追踪"时写入
+TRACE_FILE = os.path.join(SAVE_DIR, "trace.json")
+
+# 监控进度检查点，重启后从上次处理到的消息继续
+CHECKPOINT_FILE = os.path.join(SAVE_DIR, "monitor_checkpoint.json")
+
+# 已处理消息的去重记录：按群聊、按天分代，保留最近 DEDUPE_KEEP_DAYS 天，
+# 每个群聊每天最多 DEDUPE_MAX_PER_GROUP 条；DEDUPE_COMPACT 为True时只保存消息ID的哈希
+DEDUPE_KEEP_DAYS = 2
+DEDUPE_MAX_PER_GROUP = 20000
+DEDUPE_COMPACT = False
+
+# 按消息活跃度自适应调整每个群聊的轮询间隔（秒）
+POLL_MIN_INTERVAL = 5
+POLL_MAX_INTERVAL = 300
+poll_scheduler = AdaptivePollScheduler(min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL)
+
+# 读取会话列表的间隔（秒），只有未读数或最后消息预览变化的群聊才切换进去读取
+SESSION_PROBE_INTERVAL = 10
+session_detector = SessionChangeDetector()
+
+# 消息处理流水线各阶段的队列容量
+PIPELINE_QUEUE_SIZE = 100
+
+# Excel合并写入的时间窗口（秒），窗口内同一群聊同一天的订单合并为一次写入
+EXCEL_FLUSH_WINDOW = 2.0
+
+# 每个Excel文件的导出锁：文件路径 -> Lock
+_excel_locks = {}
+_excel_locks_guard = threading.Lock()
+
+
+class _lazy:
+    """第一次访问时才调用被装饰的方法创建对象，多线程同时访问也只创建一次"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = factory.__name__
+        self.__doc__ = factory.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        # 创建后对象保存在实例字典中，之后的访问不再经过这里
+        with instance._lock:
+            if self.name not in instance.__dict__:
+                setup_logging()
+                instance.__dict__[self.name] = self.factory(instance)
+            return instance.__dict__[self.name]
+
+
+class AppContext:
+    """应用上下文：微信实例、自动化执行线程、订单日志、Excel写入线程和检查点都在第一次使用时创建
+    
+    导入index不会连接微信、创建目录、启动日志线程或导入pandas，界面可以先显示出来，
+    点击启动或需要读写订单时才真正初始化。
+    
+    Args:
+        backend: 微信后端名称，为None时读取环境变量 WXBOT_BACKEND
+    """
+    
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._lock = threading.RLock()
+    
+    def created(self, name):
+        """某个对象是否已经创建"""
+        return name in self.__dict__
+    
+    def use_wechat(self, wx):
+        """使用指定的WeChat实例（例如模拟微信），已创建的自动化执行线程也改用它"""
+        with self._lock:
+            self.__dict__["wx"] = wx
+            if self.created("automation"):
+                self.automation.wx = wx
+    
+    @_lazy
+    def wx(self):
+        """WeChat实例（设置环境变量 WXBOT_BACKEND=fake 时使用模拟微信）"""
+        return create_wechat(self.backend)
+    
+    @_lazy
+    def automation(self):
+        """自动化执行线程，所有微信操作都通过它串行执行，其它线程不要直接调用wx"""
+        automation = WeChatActor(self.wx)
+        try:
+            # 获取当前登录的微信名称
+            wx_window_name = automation.execute("title", lambda wx: wx.GetWeChatTitle())
+            logger.info("初始化成功，获取到已登录窗口：%s", wx_window_name)
+        except Exception as e:
+            logger.error("初始化微信窗口失败: %s", e)
+        logger.info("机器人名称：%s", BOT_NAME)
+        return automation
+    
+    @_lazy
+    def journal(self):
+        """订单日志"""
+        os.makedirs(SAVE_DIR, exist_ok=True)
+        return OrderJournal(JOURNAL_FILE)
+    
+    @_lazy
+    def excel_writer(self):
+        """后台合并导出Excel，同一群聊同一天窗口内的订单只导出一次"""
+        writer = ExcelWriteBehind(_export_batch, window=EXCEL_FLUSH_WINDOW)
+        # 退出时导出剩余订单
+        atexit.register(writer.stop)
+        return writer
+    
+    @_lazy
+    def checkpoint(self):
+        """监控进度检查点"""
+        os.makedirs(SAVE_DIR, exist_ok=True)
+        checkpoint = MonitorCheckpoint(CHECKPOINT_FILE)
+        checkpoint.load()
+        atexit.register(checkpoint.save)
+        return checkpoint
+    
+    @_lazy
+    def summary_scheduler(self):
+        """各群聊定时汇总的调度，每天是否已发送记录在检查点中，重启后不会重复发送"""
+        scheduler = DeadlineScheduler(fired=lambda name, date_key: self.checkpoint.summary_sent(name, date_key),
+                                      mark_fired=lambda name, date_key: self.checkpoint.mark_summary_sent(name, date_key))
+        sync_summary_jobs(scheduler)
+        return scheduler
+
+
+app = AppContext()
+
+# 兼容 index.wx、index.automation 等原来的模块属性，访问时才创建
+_APP_ATTRIBUTES = ("wx", "automation", "journal", "excel_writer", "checkpoint", "summary_scheduler")
+
+def __getattr__(name):
+    if name in _APP_ATTRIBUTES:
+        return getattr(app, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def summary_time(group_name):
+    """群聊每天定时发送汇总的时刻，格式为 HH:MM"""
+    return SUMMARY_TIMES.get(group_name, DEFAULT_SUMMARY_TIME)
+
+def sync_summary_jobs(scheduler):
+    """按当前的 GROUP_NAMES 增加或取消各群聊的定时汇总，界面中修改了群聊配置后也能生效"""
+    wanted = {f"{group_name}/每日汇总": group_name for group_name in GROUP_NAMES}
+    current = scheduler.names()
+    if current == wanted.keys():
+        return
+    for name in current - wanted.keys():
+        scheduler.remove(name)
+        logger.info("取消定时汇总: %s", name)
+    for name, group_name in wanted.items():
+        if name not in current:
+            scheduler.add_daily(name, summary_time(group_name),
+                                lambda group_name=group_name: send_summary(group_name), SUMMARY_GRACE)
+    for due, name in scheduler.pending():
+        logger.info("定时汇总: %s %s", name, due.strftime("%m-%d %H:%M"))
+
 def get_current_month_year():
     """获取当前月份和年份"""
-    now = datetime.now()
+    now = clock.now()
     return now.month, now.year
 
-def get_excel_path(group_name=None):
+def get_excel_path(group_name=None, date=None):
     """获取当前月份的Excel文件路径
     
     Args:
         group_name: 群聊名称，如果提供则生成特定群的文件名
+        date: 日期字符串（YYYY-MM-DD），为None时使用当前月份
     """
-    month, year = get_current_month_year()
+    if date:
+        month = datetime.strptime(date, "%Y-%m-%d").month
+    else:
+        month, year = get_current_month_year()
     
     # 如果提供了群聊名称，则在文件名中包含群聊名
     if group_name:
@@ -84,375 +271,604 @@ def get_excel_path(group_name=None):
 
 def get_today_date():
     """获取今天的日期字符串"""
-    return datetime.now().strftime("%Y-%m-%d")
+    return clock.now().strftime("%Y-%m-%d")
 
 def parse_order_message(content):
-    """解析订餐消息内容"""
-    print(f"尝试解析订餐消息: {content}")
-    
-    # 检查消息是否包含逗号（中英文/全角半角）
-    if not any(char in content for char in [',', '，']):
-        print("消息中不包含逗号，不符合订餐格式要求")
-        return None, None
-    
-    # 尝试匹配第一种格式：xxx，共xx份
-    match = re.search(ORDER_PATTERN, content)
-    if match:
-        order_content = match.group(1)  # 订餐内容
-        order_count = int(match.group(2))  # 订餐份数
-        print(f"成功解析订餐(份数格式): 内容={order_content}, 份数={order_count}")
-        return order_content, order_count
-    
-    # 尝试匹配第二种格式：xxx xxx xxx， 共xx人
-    match = re.search(ORDER_PATTERN_PEOPLE, content)
-    if match:
-        order_content = match.group(1).strip()  # 人员名单，去除首尾空格
-        order_count = int(match.group(2))  # 人数
-        print(f"成功解析订餐(人数格式): 内容={order_content}, 人数={order_count}")
-        return order_content, order_count
-    
-    # 不再尝试匹配没有逗号的格式，因为我们已经要求必须包含逗号
-    
-    print("未能匹配订餐格式")
-    return None, None
+    """解析订餐消息内容，返回第一条订单的 (订餐内容, 份数)"""
+    order_content, order_count = parse_order(content)
+    if order_content and order_count:
+        logger.debug("成功解析订餐: 内容=%s, 份数=%s", order_content, order_count)
+    return order_content, order_count
 
 def is_bot_mentioned(content):
     """检查消息中是否@了机器人"""
-    print(f"检查是否@机器人: {content}")
+    logger.debug("检查是否@机器人: %s", content)
     
     # 首先检查是否包含@符号
     if '@' not in content:
-        print("消息中不包含@符号")
+        logger.debug("消息中不包含@符号")
         return False
     
     # 使用正则表达式匹配@后面的名称
     at_matches = re.findall(AT_PATTERN, content)
-    print(f"@匹配结果: {at_matches}")
+    logger.debug("@匹配结果: %s", at_matches)
     
     # 检查是否有匹配结果
     if not at_matches:
-        print("没有找到@匹配")
+        logger.debug("没有找到@匹配")
         return False
     
     # 检查是否@了机器人（使用精确的名称）
     for name in at_matches:
         name = name.strip()
-        print(f"检查@名称: '{name}'")
+        logger.debug("检查@名称: '%s'", name)
         if name == BOT_NAME or name == '良行上厨®快餐店订餐机器人':
-            print(f"检测到@机器人: {name}")
+            logger.debug("检测到@机器人: %s", name)
             return True
     
-    print("未检测到@机器人")
+    logger.debug("未检测到@机器人")
     return False
 
-def save_to_excel(orders, group_name):
-    """保存订单到Excel"""
-    if not orders:
-        print("没有订单数据需要保存")
+def get_metrics_port():
+    """HTTP指标端口，环境变量不是有效的端口号时给出警告并返回0（不开启）"""
+    if METRICS_PORT is not None:
+        return METRICS_PORT
+    value = os.environ.get("WXBOT_METRICS_PORT", str(DEFAULT_METRICS_PORT)).strip()
+    if not value:
+        return 0
+    try:
+        port = int(value)
+    except ValueError:
+        port = -1
+    if not 0 <= port <= 65535:
+        logger.warning("WXBOT_METRICS_PORT=%r 不是有效的端口号，不开启指标端口", value)
+        return 0
+    return port
+
+def metrics_http_port():
+    """已开启的HTTP指标端口，没有开启时返回0"""
+    return _metrics_http_port
+
+def start_metrics_export():
+    """开始定时写入指标文件并开启HTTP端口，重复调用无效"""
+    global _metrics_exporter, _metrics_http_port
+    if _metrics_exporter is not None:
         return
+    os.makedirs(SAVE_DIR, exist_ok=True)
+    _metrics_exporter = MetricsFileExporter(METRICS_FILE, METRICS_FILE_INTERVAL)
+    _metrics_exporter.start()
+    atexit.register(_metrics_exporter.stop)
+    port = get_metrics_port()
+    if port:
+        try:
+            start_http_server(port)
+            _metrics_http_port = port
+            logger.info("指标地址: http://127.0.0.1:%s/metrics", port)
+        except OSError as e:
+            logger.warning("无法开启指标端口 %s: %s", port, e)
+
+def export_trace(path=TRACE_FILE, keyword=None):
+    """导出消息追踪，可在 chrome://tracing 或 https://ui.perfetto.dev 中打开
     
-    excel_path = get_excel_path(group_name)
-    today = get_today_date()
+    Args:
+        path: 输出文件路径
+        keyword: 只导出发送人、内容、消息时间或消息ID包含该关键字的消息
     
-    try:
-        # 检查文件是否存在
-        if os.path.exists(excel_path):
-            # 尝试读取现有文件
-            try:
-                # 读取现有Excel文件，检查是否有今天的sheet
-                import openpyxl
-                wb = openpyxl.load_workbook(excel_path)
-                
-                if today in wb.sheetnames:
-                    # 如果已存在今天的sheet，读取数据
-                    existing_data = pd.read_excel(excel_path, sheet_name=today, engine='openpyxl')
-                    print(f"成功读取现有数据")
-                    
-                    # 创建一个集合，存储现有数据中的 (发送人, 订餐内容) 组合
-                    existing_keys = set()
+    Returns:
+        str: 输出文件路径
+    """
+    trace_ids = tracer.find(keyword) if keyword else None
+    count = tracer.export_chrome_trace(path, trace_ids)
+    logger.info("已导出消息追踪: %s（%s条记录）", path, count)
+    return path
+
+def _trace_dedupe(name, orders, new_orders, order_traces, start):
+    """按来源消息记录去重结果：新订单和重复订单的数量"""
+    if not order_traces:
+        return
+    new_keys = {make_order_key(order) for order in new_orders}
+    results = {}
+    for order in orders:
+        key = make_order_key(order)
+        trace_id = order_traces.get(key)
+        if trace_id is None:
+            continue
+        counts = results.setdefault(trace_id, [0, 0])
+        counts[0 if key in new_keys else 1] += 1
+    end = tracer.now()
+    for trace_id, (new_count, duplicate_count) in results.items():
+        tracer.message_span(trace_id, name, start, end, 新订单=new_count, 重复订单=duplicate_count)
+
+def import_excel_day(group_name, date):
+    """将旧Excel统计表中某天的数据导入订单日志
+    
+    订单日志启用之前的数据只存在于Excel中，每个群聊每天只在第一次用到时导入一次。
+    
+    Returns:
+        bool: 导入成功或无需导入时返回True
+    """
+    if app.journal.is_imported(group_name, date):
+        return True
+    
+    excel_path = get_excel_path(group_name, date)
+    if os.path.exists(excel_path):
+        import pandas as pd  # 只在读写Excel时才导入，启动时不加载pandas
+        try:
+            with timed("wxbot_excel_read_seconds", "读取Excel耗时"), \
+                    pd.ExcelFile(excel_path, engine='openpyxl') as workbook:
+                if date in workbook.sheet_names:
+                    existing_data = workbook.parse(sheet_name=date)
+                    existing_orders = []
                     for _, row in existing_data.iterrows():
                         try:
-                            # 只使用发送人和订餐内容作为唯一键，不使用时间
-                            key = (row['发送人'], row['订餐内容'])
-                            existing_keys.add(key)
+                            existing_orders.append({
+                                "发送人": row['发送人'],
+                                "订餐内容": row['订餐内容'],
+                                "订餐份数": int(row['订餐份数']),
+                                "发送时间": row.get('发送时间', ''),
+                                "是否人员名单": bool(row.get('是否人员名单', False))
+                            })
                         except Exception as e:
-                            print(f"处理现有数据行时出错: {e}")
-                    
-                    # 过滤掉已存在的订单
-                    filtered_orders = []
-                    for order in orders:
-                        # 只使用发送人和订餐内容作为唯一键，不使用时间
-                        key = (order['发送人'], order['订餐内容'])
-                        if key not in existing_keys:
-                            filtered_orders.append(order)
-                    
-                    print(f"过滤后剩余新订单数量: {len(filtered_orders)}")
-                    
-                    # 如果没有新订单，直接返回
-                    if not filtered_orders:
-                        print("没有新订单需要添加")
-                        return
-                    
-                    # 创建新的DataFrame
-                    new_df = pd.DataFrame(filtered_orders)
-                    
-                    # 合并现有数据和新数据
-                    combined_df = pd.concat([existing_data, new_df], ignore_index=True)
-                    
-                    # 保存回Excel，使用mode='a'追加模式，如果sheet已存在则替换
-                    with pd.ExcelWriter(excel_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                        combined_df.to_excel(writer, sheet_name=today, index=False)
-                        print(f"已更新今天({today})的订餐数据到: {excel_path}")
-                else:
-                    # 如果不存在今天的sheet，直接创建新sheet
-                    new_df = pd.DataFrame(orders)
-                    with pd.ExcelWriter(excel_path, engine='openpyxl', mode='a') as writer:
-                        new_df.to_excel(writer, sheet_name=today, index=False)
-                        print(f"已创建今天({today})的新sheet并保存订餐数据到: {excel_path}")
-                
-            except Exception as e:
-                print(f"读取或更新Excel文件时出错: {e}")
-                # 如果读取失败，创建新文件
-                new_df = pd.DataFrame(orders)
-                new_df.to_excel(excel_path, sheet_name=today, index=False, engine='openpyxl')
-                print(f"由于错误，已创建新的Excel文件: {excel_path}")
+                            logger.warning("处理现有数据行时出错: %s", e)
+                    app.journal.append(group_name, existing_orders, date)
+                    logger.info("已从 %s 导入 %s 条 %s 的历史订单", excel_path, len(existing_orders), date)
+        except Exception as e:
+            logger.error("导入Excel历史订单时出错: %s", e)
+            return False
+    
+    app.journal.mark_imported(group_name, date)
+    return True
+
+@timed("wxbot_excel_export_seconds", "导出Excel耗时")
+def export_to_excel(group_name, date=None, raise_errors=False):
+    """从订单日志导出某天的数据到月度Excel统计表
+    
+    先写入临时文件再替换原文件，写入过程中断不会损坏已有的统计表。
+    
+    Args:
+        group_name: 群聊名称
+        date: 日期（YYYY-MM-DD），为None时导出今天
+        raise_errors: 写入出错时抛出异常而不是记录错误并返回False
+    """
+    today = date or get_today_date()
+    excel_path = get_excel_path(group_name, today)
+    # Excel写入线程、发送汇总和界面打开Excel都会导出，同一个文件（和它的临时文件）同时只由一个线程写入
+    with _excel_file_lock(excel_path):
+        return _export_to_excel(group_name, today, excel_path, raise_errors)
+
+
+def _excel_file_lock(excel_path):
+    """某个Excel文件的导出锁"""
+    with _excel_locks_guard:
+        return _excel_locks.setdefault(os.path.abspath(excel_path), threading.Lock())
+
+
+def _export_to_excel(group_name, today, excel_path, raise_errors):
+    # 旧数据导入失败时不覆盖Excel，避免丢失原有记录
+    if not import_excel_day(group_name, today):
+        return False
+    
+    orders = app.journal.get_orders(group_name, today)
+    if not orders:
+        logger.debug("%s %s 没有订单需要导出", group_name, today)
+        return True
+    
+    import pandas as pd  # 只在读写Excel时才导入，启动时不加载pandas
+    os.makedirs(SAVE_DIR, exist_ok=True)
+    tmp_path = os.path.splitext(excel_path)[0] + ".tmp.xlsx"
+    df = pd.DataFrame(orders, columns=EXCEL_COLUMNS)
+    
+    try:
+        if os.path.exists(excel_path):
+            # 在副本上替换当天的sheet，其它日期的sheet保持不变
+            shutil.copyfile(excel_path, tmp_path)
+            with pd.ExcelWriter(tmp_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+                df.to_excel(writer, sheet_name=today, index=False)
         else:
-            # 文件不存在，创建新文件
-            new_df = pd.DataFrame(orders)
-            new_df.to_excel(excel_path, sheet_name=today, index=False, engine='openpyxl')
-            print(f"已创建新的Excel文件: {excel_path}")
-        
+            with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
+                df.to_excel(writer, sheet_name=today, index=False)
+        os.replace(tmp_path, excel_path)
+        logger.info("已导出 %s 的 %s 条订单到: %s", today, len(orders), excel_path)
         return True
     except Exception as e:
-        print(f"保存Excel时出错: {e}")
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        if raise_errors:
+            raise
+        logger.error("导出Excel时出错: %s", e)
         return False
 
-def collect_orders(group_name):
-    """收集订单信息"""
-    print(f"开始收集 {group_name} 的订餐信息...")
+@timed("wxbot_save_to_excel_seconds", "保存订单到Excel耗时")
+def save_to_excel(orders, group_name, date=None):
+    """保存订单到订单日志，并立即导出到Excel
     
-    # 切换到目标群聊
-    if not wx.ChatWith(who=group_name):
-        print(f"找不到群聊: {group_name}")
+    Args:
+        orders: 订单列表
+        group_name: 群聊名称
+        date: 订单所属日期（YYYY-MM-DD），为None时使用今天
+    """
+    if not orders:
+        logger.debug("没有订单数据需要保存")
+        return
+    
+    today = date or get_today_date()
+    
+    try:
+        # 先导入旧数据，保证Excel中原有订单排在前面
+        import_excel_day(group_name, today)
+        
+        # 重复订单由订单日志的唯一索引过滤
+        new_orders = app.journal.append(group_name, orders, today)
+        duplicate_orders.inc(len(orders) - len(new_orders), "journal")
+        logger.debug("过滤后剩余新订单数量: %s", len(new_orders))
+        
+        if not new_orders and os.path.exists(get_excel_path(group_name, today)):
+            logger.debug("没有新订单需要添加")
+            return True
+        
+        return export_to_excel(group_name, today)
+    except Exception as e:
+        logger.error("保存Excel时出错: %s", e)
+        return False
+
+def record_orders(orders, group_name, date=None, order_traces=None):
+    """记录新订单：写入订单日志，Excel由后台合并导出
+    
+    Args:
+        order_traces: 订单去重键 -> 来源消息的追踪ID
+    
+    Returns:
+        list: 实际新写入的订单
+    """
+    today = date or get_today_date()
+    import_excel_day(group_name, today)
+    start = tracer.now()
+    new_orders = app.journal.append(group_name, orders, today)
+    duplicate_orders.inc(len(orders) - len(new_orders), "journal")
+    _trace_dedupe("写入订单日志", orders, new_orders, order_traces, start)
+    if new_orders:
+        trace_ids = []
+        if order_traces:
+            trace_ids = list(dict.fromkeys(order_traces.get(make_order_key(order)) for order in new_orders))
+        app.excel_writer.submit(group_name, new_orders, today, trace_ids)
+    return new_orders
+
+def _export_batch(orders, group_name, date):
+    """后台写入线程的导出函数，订单已在日志中，直接导出当天完整数据
+    
+    出错时抛出异常，由写入线程记录并退避重试，文件被占用期间不会每次重试都记录错误。
+    """
+    return export_to_excel(group_name, date, raise_errors=True)
+
+
+def extract_orders(msg, today=None, today_datetime=None, parsed=None):
+    """从单条消息中提取今天的订单，多行消息每行可以是一条订单
+
+    Args:
+        msg: 微信消息对象
+        today: 今天的日期字符串，批量处理时由调用方传入，避免重复计算
+        today_datetime: 今天的datetime对象
+        parsed: 调用方已用 parse_orders_batch 解析出的结果，为None时在这里解析
+
+    Returns:
+        list: 订单信息列表，不是今天的订餐消息时为空列表
+    """
+    if today_datetime is None:
+        today_datetime = clock.now()
+    if today is None:
+        today = today_datetime.strftime("%Y-%m-%d")
+    
+    # 检查消息是否有必要的属性
+    if not hasattr(msg, 'content'):
+        logger.warning("消息没有content属性")
         return []
     
-    # 获取当前聊天窗口消息
+    # 检查消息是否有time属性
+    if not hasattr(msg, 'time') or not msg.time:
+        # 如果没有time属性或time为空，默认视为当天消息
+        msg_time = today_datetime.strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        msg_time = msg.time
+    
+    # 检查消息是否是今天的
+    # 更灵活的日期检查，只要包含今天的日期就算
+    if today not in msg_time:
+        # 其它写法（没有年份、昨天、星期几、只有时分等）换算为时间戳再比较，无法识别或不是今天的跳过
+        timestamp = normalize_time(msg_time, today_datetime)
+        if timestamp is None or not is_today(timestamp, today_datetime):
+            return []
+    
+    # 获取发送人
+    sender = getattr(msg, 'sender', '未知用户')
+    
+    # 跳过机器人自己发送的消息
+    if sender == 'self':
+        logger.debug("跳过机器人自己发送的消息: %s...", msg.content[:30])
+        return []
+    
+    # 跳过包含"订餐汇总"的消息，这些是机器人发送的汇总信息
+    if "订餐汇总" in getattr(msg, 'content', ''):
+        logger.debug("跳过汇总消息: %s...", msg.content[:30])
+        return []
+    
+    # 解析订餐信息，是否人员名单沿用原来的判断（该行包含"人"字）
+    orders = []
+    if parsed is None:
+        parsed = parse_orders(msg.content)
+    for order_content, order_count, is_people_list in parsed:
+        if not (order_content and order_count):
+            continue
+        orders.append({
+            "发送人": sender,
+            "订餐内容": order_content,
+            "订餐份数": order_count,
+            "发送时间": msg_time,
+            "是否人员名单": is_people_list
+        })
+    return orders
+
+def today_tail(msgs, today_datetime=None):
+    """从最新的消息往前找，遇到第一条今天之前的消息就停止
+    
+    Returns:
+        tuple: (今天的消息在 msgs 中的起始位置, 是否已经看到今天之前的消息)；
+            窗口中没有一条能识别时间的消息时第二项为None，无法判断今天从哪里开始
+    """
+    if today_datetime is None:
+        today_datetime = clock.now()
+    start = day_start(today_datetime)
+    dated = False
+    for i in range(len(msgs) - 1, -1, -1):
+        timestamp = normalize_time(getattr(msgs[i], 'time', None), today_datetime)
+        if timestamp is None:
+            continue
+        if timestamp < start:
+            return i + 1, True
+        dated = True
+    return 0, (False if dated else None)
+
+def fetch_today(group_name, today_datetime=None, priority=PRIORITY_SCAN, until_id=None):
+    """读取群聊今天的消息，窗口中还没有看到今天开头时向上加载历史
+    
+    Args:
+        until_id: 给出时看到这条消息也停止加载
+    
+    Returns:
+        list: 聊天窗口中的全部消息（可能包含今天之前的），找不到群聊时返回None
+    """
+    if today_datetime is None:
+        today_datetime = clock.now()
+    
+    def is_complete(msgs):
+        if until_id is not None and any(getattr(msg, 'id', None) == until_id for msg in msgs):
+            return True
+        # 窗口中没有能识别时间的消息时无法判断，不加载
+        return today_tail(msgs, today_datetime)[1] is not False
+    
+    return app.automation.fetch_history(group_name, is_complete, HISTORY_MAX_LOADS, priority)
+
+def ensure_ledger_day(group_name, date=None):
+    """确保台账中有该群聊当天的数据，首次使用时从订单日志加载已保存的订单"""
+    today = date or get_today_date()
+    if ledger.has_day(group_name, today):
+        return
+    try:
+        import_excel_day(group_name, today)
+        ledger.add_orders(group_name, app.journal.get_orders(group_name, today), today)
+    except Exception as e:
+        logger.error("从订单日志加载 %s 的订单时出错: %s", group_name, e)
+
+def collect_orders(group_name, priority=PRIORITY_SCAN):
+    """收集订单信息
+    
+    完整读取当前聊天窗口并重建订单列表，结果同时写入订单台账。
+    只在启动、发送汇总等需要全量核对的场合调用，监控循环中使用 ingest_new_messages。
+    
+    Args:
+        group_name: 群聊名称
+        priority: 自动化命令优先级，界面刷新使用 PRIORITY_REFRESH
+    """
+    logger.info("开始收集 %s 的订餐信息...", group_name)
+    
+    # 今天的日期
+    today_datetime = clock.now()
+    today = today_datetime.strftime("%Y-%m-%d")
+    
+    # 切换到目标群聊并获取今天的消息，启动晚了今天开头不在窗口中时向上加载历史
     try:
-        msgs = wx.GetAllMessage()
+        msgs = fetch_today(group_name, today_datetime, priority)
+        if msgs is None:
+            logger.warning("找不到群聊: %s", group_name)
+            return []
         if not msgs:
-            print("没有获取到消息")
+            logger.warning("没有获取到消息")
             return []
     except Exception as e:
-        print(f"获取消息时出错: {e}")
+        logger.error("获取消息时出错: %s", e)
         return []
     
-    # 今天的日期
-    today = datetime.now().strftime("%Y-%m-%d")
-    today_datetime = datetime.now()
+    # 从最新的消息往前只取今天的部分，更早的消息不再解析
+    start, reached = today_tail(msgs, today_datetime)
+    if reached is False:
+        logger.debug("%s 没有看到今天之前的消息（聊天记录开头或达到加载上限）", group_name)
+    msgs = msgs[start:]
     
     # 收集今天的订餐信息
     orders = []
     # 用于去重的集合，存储 (发送人, 订餐内容) 元组
     unique_orders = set()
     
-    print(f"开始处理 {len(msgs)} 条消息，筛选今天({today})的订餐信息...")
+    logger.debug("开始处理 %s 条消息，筛选今天(%s)的订餐信息...", len(msgs), today)
+    
+    # 先一次性识别订餐格式，不是订餐的消息不再做日期判断
+    parsed_list = parse_orders_batch([getattr(msg, 'content', '') for msg in msgs])
     
-    for i, msg in enumerate(msgs):
+    for i, (msg, parsed) in enumerate(zip(msgs, parsed_list)):
+        if not parsed:
+            continue
         try:
-            # 检查消息是否有必要的属性
-            if not hasattr(msg, 'content'):
-                print(f"消息 {i} 没有content属性")
-                continue
-                
-            # 检查消息是否有time属性
-            if not hasattr(msg, 'time') or not msg.time:
-                # 如果没有time属性或time为空，默认视为当天消息
-                msg_time = today_datetime.strftime("%Y-%m-%d %H:%M:%S")
-                print(f"消息 {i} 没有有效的time属性，默认视为当天消息: {msg.content[:30]}...")
-            else:
-                msg_time = msg.time
-            
-            # 检查消息是否是今天的
-            # 更灵活的日期检查，只要包含今天的日期就算
-            if today not in msg_time:
-                # 尝试其他可能的日期格式
-                try:
-                    # 尝试解析消息时间
-                    msg_date = None
-                    # 尝试几种常见的日期格式
-                    date_formats = [
-                        "%Y-%m-%d %H:%M:%S",
-                        "%Y/%m/%d %H:%M:%S",
-                        "%Y年%m月%d日 %H:%M:%S",
-                        "%m-%d %H:%M:%S"  # 如果只有月日
-                    ]
-                    
-                    for fmt in date_formats:
-                        try:
-                            if len(msg_time) >= 10:  # 确保字符串长度足够
-                                parsed_date = datetime.strptime(msg_time, fmt)
-                                if parsed_date.day == today_datetime.day and parsed_date.month == today_datetime.month:
-                                    msg_date = parsed_date
-                                    break
-                        except ValueError:
-                            continue
-                    
-                    # 如果无法解析日期或不是今天，跳过
-                    if not msg_date:
-                        continue
-                except:
-                    # 如果解析失败，默认视为当天消息（因为微信通常显示的是最近的消息）
-                    print(f"无法解析消息时间，默认视为当天消息: {msg.content[:30]}...")
-            
-            # 获取发送人
-            sender = getattr(msg, 'sender', '未知用户')
-            
-            # 跳过机器人自己发送的消息
-            if sender == 'self':
-                print(f"跳过机器人自己发送的消息: {msg.content[:30]}...")
-                continue
-            
-            # 跳过包含"订餐汇总"的消息，这些是机器人发送的汇总信息
-            if "订餐汇总" in getattr(msg, 'content', ''):
-                print(f"跳过汇总消息: {msg.content[:30]}...")
-                continue
-            
-            # 解析订餐信息
-            order_content, order_count = parse_order_message(msg.content)
-            if order_content and order_count:
-                # 判断是否是人员名单格式（包含"人"字）
-                is_people_list = "人" in msg.content
-                
+            for order in extract_orders(msg, today, today_datetime, parsed):
                 # 创建唯一标识元组 - 只使用发送人和订餐内容，不使用时间
-                order_key = (sender, order_content)
+                order_key = make_order_key(order)
                 
                 # 检查是否已经存在相同的订单
                 if order_key in unique_orders:
-                    print(f"跳过重复订单: {sender} - {order_content}")
+                    duplicate_orders.inc(label="collect")
+                    logger.debug("跳过重复订单: %s - %s", order['发送人'], order['订餐内容'])
                     continue
                 
                 # 添加到去重集合
                 unique_orders.add(order_key)
                 
                 # 添加到订单列表
-                orders.append({
-                    "发送人": sender,
-                    "订餐内容": order_content,
-                    "订餐份数": order_count,
-                    "发送时间": msg_time,
-                    "是否人员名单": is_people_list
-                })
-                print(f"收集到订单: {sender} - {order_content} - {order_count}份")
+                orders.append(order)
+                logger.debug("收集到订单: %s - %s - %s份", order['发送人'], order['订餐内容'], order['订餐份数'])
         except Exception as e:
-            print(f"处理消息 {i} 时出错: {e}")
+            logger.error("处理消息 %s 时出错: %s", i, e)
             continue
     
-    print(f"收集到 {len(orders)} 条订餐信息")
+    messages_parsed.inc(len(msgs))
+    orders_parsed.inc(len(orders))
+    
+    # 同步到订单台账，后续监控只需增量追加
+    ensure_ledger_day(group_name, today)
+    new_orders = ledger.add_orders(group_name, orders, today)
+    # 台账中原来没有的订单同时写入订单日志，否则监控再读到这些消息时会被台账去重，订单不会保存
+    if new_orders:
+        record_orders(new_orders, group_name, today)
+    
+    logger.info("收集到 %s 条订餐信息", len(orders))
     return orders
 
+def parse_messages(msgs, group_name="", trace_ids=None, order_traces=None):
+    """从新消息中解析今天的订单（只解析，不入账）
+    
+    Args:
+        trace_ids: 与msgs一一对应的追踪ID，给出时记录每条消息的解析结果
+        order_traces: 字典，给出时记录每条订单（按去重键）来源消息的追踪ID
+    """
+    today_datetime = clock.now()
+    today = today_datetime.strftime("%Y-%m-%d")
+    
+    orders = []
+    start = tracer.now()
+    parsed_list = parse_orders_batch([getattr(msg, 'content', '') for msg in msgs])
+    for i, (msg, parsed) in enumerate(zip(msgs, parsed_list)):
+        msg_orders = []
+        if parsed:
+            try:
+                msg_orders = extract_orders(msg, today, today_datetime, parsed)
+                orders.extend(msg_orders)
+            except Exception as e:
+                logger.error("%s 解析新消息时出错: %s", group_name, e)
+        if trace_ids:
+            if order_traces is not None:
+                for order in msg_orders:
+                    order_traces[make_order_key(order)] = trace_ids[i]
+            end = tracer.now()
+            tracer.message_span(trace_ids[i], "解析", start, end, 订餐格式=bool(parsed), 订单数=len(msg_orders))
+            start = end
+    messages_parsed.inc(len(msgs))
+    orders_parsed.inc(len(orders))
+    return orders
+
+def ingest_orders(group_name, orders, order_traces=None):
+    """将解析出的订单增量加入订单台账
+    
+    Args:
+        order_traces: 订单去重键 -> 来源消息的追踪ID，给出时记录每条消息的去重结果
+    
+    Returns:
+        list: 台账中原来没有的新订单
+    """
+    today = get_today_date()
+    ensure_ledger_day(group_name, today)
+    
+    start = tracer.now()
+    new_orders = ledger.add_orders(group_name, orders, today)
+    duplicate_orders.inc(len(orders) - len(new_orders), "ledger")
+    _trace_dedupe("去重", orders, new_orders, order_traces, start)
+    for order in new_orders:
+        logger.info("%s 台账新增订单: %s - %s - %s份", group_name, order['发送人'], order['订餐内容'], order['订餐份数'])
+    return new_orders
+
+def ingest_new_messages(group_name, msgs, trace_ids=None, order_traces=None):
+    """将监控发现的新消息增量加入订单台账
+    
+    Args:
+        group_name: 群聊名称
+        msgs: 新消息列表（只包含上次检查之后的消息）
+        trace_ids: 与msgs一一对应的追踪ID
+        order_traces: 字典，给出时记录每条订单来源消息的追踪ID，供 record_orders 使用
+    
+    Returns:
+        list: 本次新增的订单
+    """
+    if trace_ids and order_traces is None:
+        order_traces = {}
+    orders = parse_messages(msgs, group_name, trace_ids, order_traces)
+    return ingest_orders(group_name, orders, order_traces)
+
 def generate_summary(orders, group_name, from_excel=False):
     """生成订餐统计信息
     
     Args:
         orders: 订单列表
         group_name: 群聊名称
-        from_excel: 是否从Excel读取数据
+        from_excel: 是否读取已保存的完整数据（从订单日志读取，Excel统计表由日志导出，内容一致）
     """
     if not orders:
         return "没有找到订餐信息"
     
+    today = get_today_date()
+    
     if from_excel:
-        # 从Excel读取今天的数据
-        excel_path = get_excel_path(group_name)
-        today = get_today_date()
-        
+        # 从订单日志读取今天的数据
         try:
-            if os.path.exists(excel_path):
-                # 读取Excel中当天的所有订单
-                excel_orders = pd.read_excel(excel_path, sheet_name=today, engine='openpyxl')
-                print(f"从Excel读取到 {len(excel_orders)} 条订单记录")
-                
-                # 检查是否有人员名单类型的订单
-                people_list_orders = excel_orders[excel_orders['是否人员名单'] == True]
-                
-                if not people_list_orders.empty:
-                    # 修改：不再只使用最新的一条人员名单订单，而是累加所有人员名单订单的人数
-                    total_people = 0
-                    
-                    # 遍历所有人员名单类型的订单
-                    for _, order in people_list_orders.iterrows():
-                        count = order['订餐份数']
-                        # 从人员名单中提取人名并计数
-                        names_text = order['订餐内容']
-                        # 按空格分割人名并过滤空字符串
-                        names_list = [name for name in names_text.split() if name.strip()]
-                        # 计算实际人数
-                        actual_count = len(names_list)
-                        # 使用订单中的人数或实际人数中的较大值
-                        final_count = count if count > actual_count else actual_count
-                        # 累加人数
-                        total_people += final_count
-                    
-                    return f"{today}{group_name}订餐汇总：共{total_people}人"
-                else:
-                    # 如果是普通订餐类型，统计所有订单
-                    # 检查是否有发送人为self的订单，如果有则排除
-                    filtered_orders = excel_orders[excel_orders['发送人'] != 'self']
-                    total_people = len(filtered_orders['发送人'].unique())
-                    total_portions = filtered_orders['订餐份数'].sum()
-                    
-                    return f"{today}{group_name}订餐汇总：共{total_people}人订餐，{total_portions}份"
-            else:
-                print(f"Excel文件不存在: {excel_path}")
+            import_excel_day(group_name, today)
+            saved_orders = app.journal.get_orders(group_name, today)
+            logger.debug("从订单日志读取到 %s 条订单记录", len(saved_orders))
+            if saved_orders:
+                orders = saved_orders
         except Exception as e:
-            print(f"从Excel读取订单时出错: {e}")
-            # 如果读取Excel失败，回退到使用当前收集的订单
-            print("回退到使用当前收集的订单")
-    
-    # 如果没有从Excel读取或读取失败，使用传入的orders
-    # 检查是否有人员名单类型的订单
-    people_list_orders = [order for order in orders if order.get("是否人员名单", False)]
-    
-    # 如果有人员名单类型的订单，累加所有人员名单的人数
-    if people_list_orders:
-        # 修改：不再只使用最新的一条人员名单订单，而是累加所有人员名单订单的人数
-        total_people = 0
-        
-        # 遍历所有人员名单类型的订单
-        for order in people_list_orders:
-            count = order['订餐份数']
-            # 从人员名单中提取人名并计数
-            names_text = order['订餐内容']
-            # 按空格分割人名并过滤空字符串
-            names_list = [name for name in names_text.split() if name.strip()]
-            # 计算实际人数
-            actual_count = len(names_list)
-            # 使用订单中的人数或实际人数中的较大值
-            final_count = count if count > actual_count else actual_count
-            # 累加人数
-            total_people += final_count
-        
-        return f"{today}{group_name}订餐汇总：共{total_people}人"
-    else:
-        # 如果是普通订餐类型
-        # 过滤掉发送人为self的订单
-        filtered_orders = [order for order in orders if order.get("发送人") != 'self']
-        total_people = len(set([order["发送人"] for order in filtered_orders]))
-        total_portions = sum([order["订餐份数"] for order in filtered_orders])
-        
-        return f"{today}{group_name}订餐汇总：共{total_people}人订餐，{total_portions}份"
+            logger.error("从订单日志读取订单时出错: %s", e)
+            # 如果读取失败，回退到使用当前收集的订单
+            logger.warning("回退到使用当前收集的订单")
+    
+    # 统计订单（已保存的完整数据或传入的orders）
+    totals = {"订单数": len(orders), "人数": 0, "份数": 0, "人员名单数": 0, "名单人数": 0}
+    senders = set()
+    for order in orders:
+        # 有人员名单类型的订单时，累加所有人员名单的人数
+        if order.get("是否人员名单", False):
+            totals["人员名单数"] += 1
+            totals["名单人数"] += count_people(order)
+        # 普通订餐类型过滤掉发送人为self的订单
+        if order.get("发送人") != 'self':
+            senders.add(order["发送人"])
+            totals["份数"] += order["订餐份数"]
+    totals["人数"] = len(senders)
+    
+    return format_summary(today, group_name, totals)
 
 def send_summary(group_name):
-    """发送每日汇总信息"""
-    print(f"开始生成并发送 {group_name} 的每日汇总...")
+    """发送每日汇总信息
+    
+    Returns:
+        bool: 是否已发送，找不到群聊时返回False
+    """
+    logger.info("开始生成并发送 %s 的每日汇总...", group_name)
     
     # 切换到目标群聊
-    if not wx.ChatWith(who=group_name):
-        print(f"找不到群聊: {group_name}")
-        return
+    if not app.automation.switch(group_name, PRIORITY_REPLY):
+        logger.warning("找不到群聊: %s", group_name)
+        return False
     
     # 获取今日订单
-    orders = collect_orders(group_name)
+    orders = collect_orders(group_name, PRIORITY_REPLY)
     
     # 生成汇总消息
     summary = generate_summary(orders, group_name)
@@ -460,284 +876,454 @@ def send_summary(group_name):
     summary_msg = f"@{at_person} {summary}"
     
     # 发送汇总消息
-    wx.SendMsg(msg=summary_msg, who=group_name)
-    print(f"已发送汇总消息: {summary_msg}")
+    app.automation.send(summary_msg, group_name, PRIORITY_REPLY)
+    logger.info("已发送汇总消息: %s", summary_msg)
     
-    # 保存到Excel
+    # 先导出等待中的订单，再保存到Excel
+    app.excel_writer.flush(group_name)
     save_to_excel(orders, group_name)
+    return True
 
-def handle_mention(msg, group_name):
-    """处理@机器人的消息"""
-    print(f"检测到@消息: {msg.content}")
+def warm_start():
+    """启动时准备当天的订单数据
     
-    # 获取今日订单
-    orders = collect_orders(group_name)
+    有当天的检查点时只从订单日志恢复台账，不再读取聊天记录；
+    没有检查点（或订单日志与检查点不一致）时完整收集一次各群聊的订单并保存。
+    """
+    if app.checkpoint.restored and app.journal.last_id() < app.checkpoint.journal_id:
+        logger.warning("订单日志比检查点记录的位置旧，重新收集订单")
+        app.checkpoint.reset()
+    if app.checkpoint.restored:
+        for group_name in GROUP_NAMES:
+            ensure_ledger_day(group_name)
+            logger.info("%s 从订单日志恢复了 %s 条订单", group_name, ledger.get_totals(group_name)["订单数"])
+        return
+    for group_name in GROUP_NAMES:
+        orders = collect_orders(group_name)
+        save_to_excel(orders, group_name)
+
+def handle_mention(msg, group_name, detected_at=None, trace_id=None):
+    """处理@机器人的消息
+    
+    直接使用订单台账中的累计数据生成回复，不再重新读取聊天记录和订单数据。
+    
+    Args:
+        msg: @机器人的消息
+        group_name: 群聊名称
+        detected_at: 检测到该消息的时间戳，用于统计回复延迟
+        trace_id: 该消息的追踪ID
+    """
+    if detected_at is None:
+        detected_at = clock.time()
+    trace_start = tracer.now()
+    result = "发送失败"
+    logger.info("检测到@消息: %s", msg.content)
     
-    # 生成汇总消息，从Excel中读取完整数据
-    summary = generate_summary(orders, group_name, from_excel=True)
+    # 由台账累计数据生成汇总消息
+    ensure_ledger_day(group_name)
+    summary = ledger.get_summary(group_name)
     
     # 回复@消息
     sender = getattr(msg, 'sender', '朋友')
     at_person = AT_PERSONS.get(group_name, "布鲁布鲁")  # 获取该群聊对应的@人
     reply_msg = f"@{sender} {summary}"
     
-    print(f"准备回复消息: {reply_msg}")
-    
-    # 确保在正确的聊天窗口
-    if not wx.ChatWith(who=group_name):
-        print(f"无法切换到群聊: {group_name}")
-        return
+    logger.debug("准备回复消息: %s", reply_msg)
     
-    # 发送回复消息
+    # 发送回复消息，切换群聊和发送作为一条命令执行，中间不会插入其它操作
     try:
         # 直接发送消息
-        wx.SendMsg(reply_msg)
-        print(f"已回复@消息: {reply_msg}")
+        app.automation.send(reply_msg, group_name, PRIORITY_REPLY)
+        logger.info("已回复@消息: %s", reply_msg)
+        mention_latency.observe(clock.time() - detected_at)
+        result = "成功"
     except Exception as e:
-        print(f"发送回复消息失败: {e}")
+        logger.warning("发送回复消息失败: %s", e)
         # 尝试使用另一种方式发送
         try:
-            # 重新切换到群聊并发送
-            wx.ChatWith(who=group_name)
-            time.sleep(1)  # 等待切换完成
-            wx.SendMsg(reply_msg)
-            print("使用替代方法发送回复成功")
+            # 等待片刻后重新切换到群聊并发送
+            clock.sleep(1)
+            app.automation.send(reply_msg, group_name, PRIORITY_REPLY)
+            logger.info("使用替代方法发送回复成功")
+            mention_latency.observe(clock.time() - detected_at)
+            result = "重试后成功"
         except Exception as e2:
-            print(f"替代发送方法也失败: {e2}")
+            logger.warning("替代发送方法也失败: %s", e2)
             # 最后尝试最简单的方式
             try:
-                wx.SendMsg(summary)
-                print("使用最简单方式发送成功")
+                app.automation.send(summary, group_name, PRIORITY_REPLY)
+                logger.info("使用最简单方式发送成功")
+                mention_latency.observe(clock.time() - detected_at)
+                result = "不带@发送成功"
             except Exception as e3:
-                print(f"所有发送方法都失败: {e3}")
+                logger.error("所有发送方法都失败: %s", e3)
+    tracer.message_span(trace_id, "回复", trace_start, 结果=result)
 
-def check_time_for_summary():
-    """检查是否到了发送汇总的时间"""
-    current_hour = datetime.now().hour
-    current_minute = datetime.now().minute
+def find_new_messages(group_name, current_msgs, last_msg_ids):
+    """与上次记录的最后消息ID比较，找出新消息
     
-    # 在16:00左右发送汇总
-    if current_hour == 16 and 0 <= current_minute <= 5:
-        return True
-    return False
+    Args:
+        group_name: 群聊名称
+        current_msgs: 本次获取到的全部消息
+        last_msg_ids: 各群聊上次的最后消息ID，会被更新
+    
+    Returns:
+        list: 上次最后一条消息之后的新消息
+    """
+    if not current_msgs:
+        logger.debug("%s 没有获取到消息，等待下一轮检查", group_name)
+        return []
+    
+    # 检查是否有新消息
+    if last_msg_ids.get(group_name) is None:
+        logger.info("%s 首次检测，视为有新消息", group_name)
+    elif hasattr(current_msgs[-1], 'id') and current_msgs[-1].id != last_msg_ids.get(group_name):
+        logger.debug("%s 检测到新消息: 最新ID=%s, 上次ID=%s", group_name, current_msgs[-1].id, last_msg_ids.get(group_name))
+    else:
+        return []
+    
+    # 有新消息，找出上次最后一条消息之后的消息
+    new_msgs = []
+    for msg in reversed(current_msgs):
+        if last_msg_ids.get(group_name) is not None and hasattr(msg, 'id') and msg.id == last_msg_ids.get(group_name):
+            logger.debug("%s 找到上次的最后消息ID: %s", group_name, last_msg_ids.get(group_name))
+            break
+        new_msgs.append(msg)
+    new_msgs.reverse()
+    
+    logger.debug("%s 共有 %s 条新消息", group_name, len(new_msgs))
+    
+    # 更新最后一条消息ID
+    if hasattr(current_msgs[-1], 'id'):
+        last_msg_ids[group_name] = current_msgs[-1].id
+        logger.debug("%s 更新最后消息ID为: %s", group_name, last_msg_ids[group_name])
+    
+    return new_msgs
+
+def classify_messages(group_name, new_msgs, processed_at_msg_ids, detected_at=None, trace_ids=None,
+                      order_traces=None):
+    """对新消息去重并分类，找出订单和@机器人的消息
+    
+    Args:
+        group_name: 群聊名称
+        new_msgs: 新消息列表
+        processed_at_msg_ids: 已处理过的消息ID（ProcessedMessageIds），会被更新
+        detected_at: 抓取到这批消息的时间戳，用于统计回复延迟
+        trace_ids: 与new_msgs一一对应的追踪ID
+        order_traces: 字典，给出时记录每条订单来源消息的追踪ID
+    
+    Returns:
+        tuple: (订单列表, [(@机器人的消息, 检测时间, 追踪ID)])
+    """
+    if detected_at is None:
+        detected_at = clock.time()
+    
+    order_msgs = []
+    order_trace_ids = []
+    mention_msgs = []
+    for i, msg in enumerate(new_msgs):
+        trace_id = trace_ids[i] if trace_ids else None
+        start = tracer.now()
+        try:
+            # 确保消息有content属性和id属性
+            if not hasattr(msg, 'content'):
+                logger.warning("%s 新消息 %s 没有content属性", group_name, i)
+                tracer.message_span(trace_id, "跳过", start, 原因="没有content属性")
+                continue
+            
+            # 检查消息是否有ID，如果没有则跳过
+            if not hasattr(msg, 'id') or not msg.id:
+                logger.warning("%s 新消息 %s 没有有效的ID", group_name, i)
+                tracer.message_span(trace_id, "跳过", start, 原因="没有有效的ID")
+                continue
+            
+            # 检查消息是否已处理过
+            # 检查消息是否已处理过，没有处理过的同时记录下来
+            if not processed_at_msg_ids.add(group_name, msg.id):
+                logger.debug("%s 新消息 %s (ID=%s)已处理过，跳过", group_name, i, msg.id)
+                tracer.message_span(trace_id, "跳过", start, 原因="已处理过")
+                continue
+            
+            msg_content = msg.content
+            msg_sender = getattr(msg, 'sender', '未知用户')
+            logger.debug("%s 处理新消息 %s: 发送者=%s, 内容=%s", group_name, i, msg_sender, msg_content)
+            
+            # 检查是否有人@机器人，订单入账后再回复
+            if is_bot_mentioned(msg_content):
+                logger.info("%s 检测到@机器人消息: %s", group_name, msg_content)
+                mention_msgs.append((msg, detected_at, trace_id))
+            
+            order_msgs.append(msg)
+            order_trace_ids.append(trace_id)
+        except Exception as e:
+            logger.error("%s 处理新消息 %s 时出错: %s", group_name, i, e)
+            tracer.message_span(trace_id, "跳过", start, 原因=f"处理出错: {e}")
+    
+    if not trace_ids:
+        order_trace_ids = None
+    return parse_messages(order_msgs, group_name, order_trace_ids, order_traces), mention_msgs
+
+def persist_orders(group_name, orders, order_traces=None):
+    """订单入账并写入订单日志，Excel由后台合并导出
+    
+    Args:
+        order_traces: 订单去重键 -> 来源消息的追踪ID
+    
+    Returns:
+        list: 新订单
+    """
+    new_orders = ingest_orders(group_name, orders, order_traces)
+    if new_orders:
+        logger.info("%s 检测到 %s 条新订餐", group_name, len(new_orders))
+        record_orders(new_orders, group_name, order_traces=order_traces)
+    return new_orders
+
+def commit_messages(group_name, msg_ids):
+    """一批消息处理完（订单已写入订单日志）后记录到检查点"""
+    msg_ids = [msg_id for msg_id in msg_ids if msg_id]
+    if msg_ids:
+        app.checkpoint.commit(group_name, msg_ids, msg_ids[-1], app.journal.last_id())
+
+def backfill_since_checkpoint(group_name, last_msgs, processed_at_msg_ids):
+    """从检查点恢复时补录停机期间的订单，只补录订单，不回复@消息
+    
+    检查点中的最后消息仍在窗口中时不补录，停机期间的新消息会在第一次轮询时处理；
+    不在窗口中时向上加载历史直到看到这条消息或今天开头，补录它之后的订单。
+    检查点中没有这个群聊（例如新加入监控的群聊）时和没有检查点一样，补录今天的全部订单。
+    
+    Args:
+        last_msgs: 初始化时读取到的消息
+        processed_at_msg_ids: 已处理过的消息ID
+    
+    Returns:
+        list: 补录时读取到的消息，不需要补录时返回None
+    """
+    restored_id = app.checkpoint.last_msg_ids.get(group_name)
+    if restored_id is not None:
+        if any(getattr(msg, 'id', None) == restored_id for msg in last_msgs):
+            logger.info("%s 从检查点继续，最后处理的消息ID: %s", group_name, restored_id)
+            return None
+        logger.warning("%s 检查点中的消息不在当前窗口中，加载历史补录停机期间的订单", group_name)
+    else:
+        logger.warning("%s 不在检查点中，加载今天的历史补录订单", group_name)
+    today_datetime = clock.now()
+    msgs = fetch_today(group_name, today_datetime, until_id=restored_id) or last_msgs
+    start = None
+    if restored_id is not None:
+        start = next((i + 1 for i, msg in enumerate(msgs) if getattr(msg, 'id', None) == restored_id), None)
+    if start is None:
+        start = today_tail(msgs, today_datetime)[0]
+    persist_orders(group_name, parse_messages(
+        [msg for msg in msgs[start:]
+         if not processed_at_msg_ids.contains(group_name, getattr(msg, 'id', None))], group_name))
+    return msgs
+
+def build_message_pipeline(processed_at_msg_ids):
+    """创建监控使用的消息处理流水线：解析分类 → 订单入账保存 → 发送回复
+    
+    抓取阶段由监控循环自身承担，只负责读取新消息并提交 MessageBatch。
+    三个阶段都只有一个工作线程，保证同一群聊的消息按顺序处理，
+    @消息在同一批订单入账之后才回复。
+    """
+    def parse_stage(batch):
+        order_traces = {}
+        orders, mentions = classify_messages(batch.group_name, batch.msgs, processed_at_msg_ids,
+                                             batch.fetched_at, batch.trace_ids, order_traces)
+        msg_ids = [getattr(msg, 'id', None) for msg in batch.msgs]
+        # 没有订单和@消息的批次也交给保存阶段记录检查点，保证检查点按顺序前进，
+        # 不会越过前面还在保存队列中、订单尚未写入订单日志的批次
+        return [ParsedBatch(batch.group_name, orders, mentions, batch.fetched_at, order_traces, msg_ids)]
+    
+    def persist_stage(parsed):
+        if parsed.orders:
+            persist_orders(parsed.group_name, parsed.orders, parsed.order_traces)
+        commit_messages(parsed.group_name, parsed.msg_ids)
+        # 订单入账后再把@消息交给发送阶段
+        return [(parsed.group_name, msg, detected_at, trace_id)
+                for msg, detected_at, trace_id in parsed.mentions]
+    
+    def send_stage(mention):
+        group_name, msg, detected_at, trace_id = mention
+        handle_mention(msg, group_name, detected_at, trace_id)
+        return []
+    
+    return Pipeline([
+        Stage("解析", parse_stage, maxsize=PIPELINE_QUEUE_SIZE),
+        Stage("保存", persist_stage, maxsize=PIPELINE_QUEUE_SIZE),
+        Stage("发送", send_stage, maxsize=PIPELINE_QUEUE_SIZE),
+    ])
 
 def monitor_group():
     """监控群聊并定时处理"""
-    print(f"开始监控群聊: {GROUP_NAMES}")
+    setup_logging()
+    logger.info("开始监控群聊: %s", GROUP_NAMES)
+    start_metrics_export()
     
     # 获取最后一条消息ID，用于后续检查新消息
     last_msg_ids = {}
-    # 添加一个集合来跟踪已处理过的@消息ID
-    processed_at_msg_ids = set()
+    # 已处理过的消息ID，流水线解析阶段和监控循环共用；有检查点时从检查点恢复
+    processed_at_msg_ids = ProcessedMessageIds(DEDUPE_KEEP_DAYS, DEDUPE_MAX_PER_GROUP, DEDUPE_COMPACT,
+                                               metric_label="processed")
+    if app.checkpoint.restored:
+        processed_at_msg_ids.load(app.checkpoint.processed_ids.export())
     
     try:
         for group_name in GROUP_NAMES:
-            # 切换到目标群聊
-            if not wx.ChatWith(who=group_name):
-                print(f"找不到群聊: {group_name}")
+            # 切换到目标群聊并获取初始消息
+            last_msgs = app.automation.fetch(group_name)
+            if last_msgs is None:
+                logger.warning("找不到群聊: %s", group_name)
                 continue
+            logger.info("初始化时获取到 %s 的 %s 条消息", group_name, len(last_msgs) if last_msgs else 0)
             
-            # 获取初始消息
-            last_msgs = wx.GetAllMessage()
-            print(f"初始化时获取到 {group_name} 的 {len(last_msgs) if last_msgs else 0} 条消息")
+            if app.checkpoint.restored:
+                backfilled = backfill_since_checkpoint(group_name, last_msgs, processed_at_msg_ids)
+                if backfilled is None:
+                    last_msg_ids[group_name] = app.checkpoint.last_msg_ids[group_name]
+                    continue
+                last_msgs = backfilled
             
-            # 打印所有初始消息的基本信息
+            # 打印所有初始消息的基本信息（只在DEBUG级别）
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
             for i, msg in enumerate(last_msgs):
                 try:
-                    msg_id = getattr(msg, 'id', '无ID')
-                    msg_content = getattr(msg, 'content', '无内容')
-                    msg_sender = getattr(msg, 'sender', '未知发送者')
-                    print(f"初始消息 {i}: ID={msg_id}, 发送者={msg_sender}, 内容={msg_content[:20]}...")
+                    if debug_enabled:
+                        msg_id = getattr(msg, 'id', '无ID')
+                        msg_content = getattr(msg, 'content', '无内容')
+                        msg_sender = getattr(msg, 'sender', '未知发送者')
+                        logger.debug("初始消息 %s: ID=%s, 发送者=%s, 内容=%s...", i, msg_id, msg_sender, msg_content[:20])
                     
                     # 将所有初始消息的ID添加到已处理集合中，避免重复处理
                     if hasattr(msg, 'id') and msg.id:
-                        processed_at_msg_ids.add(msg.id)
+                        processed_at_msg_ids.add(group_name, msg.id)
                 except Exception as e:
-                    print(f"打印初始消息 {i} 信息时出错: {e}")
+                    logger.error("打印初始消息 %s 信息时出错: %s", i, e)
             
             if last_msgs and len(last_msgs) > 0 and hasattr(last_msgs[-1], 'id'):
                 last_msg_ids[group_name] = last_msgs[-1].id
-                print(f"设置 {group_name} 初始最后消息ID: {last_msg_ids[group_name]}")
+                logger.debug("设置 %s 初始最后消息ID: %s", group_name, last_msg_ids[group_name])
+                commit_messages(group_name, [getattr(msg, 'id', None) for msg in last_msgs])
             else:
                 last_msg_ids[group_name] = None
-                print(f"初始化时没有获取到 {group_name} 的消息ID")
+                logger.info("初始化时没有获取到 %s 的消息ID", group_name)
+        app.checkpoint.save()
     except Exception as e:
-        print(f"获取初始消息时出错: {e}")
+        logger.error("获取初始消息时出错: %s", e)
+    
+    # 创建定时汇总的调度，之后按最近的汇总时刻休眠
+    summary_scheduler = app.summary_scheduler
     
-    # 用于跟踪上次发送汇总的日期
-    last_summary_dates = {group_name: None for group_name in GROUP_NAMES}
+    # 抓取之后的解析、保存、回复交给流水线的后台阶段处理
+    pipeline = build_message_pipeline(processed_at_msg_ids)
+    pipeline.start()
+    # 退出时先处理完流水线中剩余的消息，再导出Excel、保存检查点（atexit按注册的相反顺序执行）
+    app.excel_writer
+    atexit.register(pipeline.stop)
     
-    # 记录上次检查的时间
-    last_check_time = time.time()
+    # 记录上次打印心跳的时间
+    last_check_time = clock.time()
     
-    print("开始监控循环...")
+    logger.info("开始监控循环...")
     while True:
         try:
-            current_time = time.time()
+            current_time = clock.time()
             # 每隔一段时间打印一次心跳信息
             if current_time - last_check_time > 300:  # 每5分钟打印一次心跳
-                print(f"监控心跳 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                logger.info("监控心跳 - %s", clock.now().strftime('%Y-%m-%d %H:%M:%S'))
+                logger.info("当前轮询间隔: %s", poll_scheduler.interval_gauge.snapshot())
+                logger.info("会话列表无变化跳过的检查: %s次", session_detector.skipped)
+                logger.info("%s", app.excel_writer.flush_latency.summary())
+                logger.info("%s", mention_latency.summary())
+                logger.info("%s", app.automation.summary())
+                logger.info("%s", pipeline.summary())
+                logger.info("已处理消息去重记录: %s", processed_at_msg_ids.stats())
+                for due, name in summary_scheduler.pending()[:1]:
+                    logger.info("下一个定时汇总: %s %s", name, due.strftime("%m-%d %H:%M"))
                 last_check_time = current_time
             
-                # 检查是否有新消息
-                try:
-                    print("获取当前消息...")
-                    current_msgs_all = {}
-                    for group_name in GROUP_NAMES:
-                        try:
-                            # 切换到目标群聊
-                            if not wx.ChatWith(who=group_name):
-                                print(f"找不到群聊: {group_name}")
-                                continue
-                                
-                            current_msgs = wx.GetAllMessage()
-                            current_msgs_all[group_name] = current_msgs
-                            print(f"获取到 {group_name} 的 {len(current_msgs) if current_msgs else 0} 条消息")
-                        except Exception as e:
-                            print(f"获取 {group_name} 消息时出错: {e}")
-                            current_msgs_all[group_name] = []
-                except Exception as e:
-                    print(f"获取消息时出错: {e}")
-                    time.sleep(30)
+            # 读取一次会话列表，未读数或预览有变化的群聊立即检查
+            if app.automation.execute("sessions", session_detector.probe):
+                for group_name in session_detector.changed_groups(GROUP_NAMES):
+                    poll_scheduler.poll_soon(group_name)
+            
+            # 只检查到了轮询时间的群聊，间隔由各群的消息活跃度决定
+            for group_name in poll_scheduler.due_groups(GROUP_NAMES):
+                if not session_detector.has_changed(group_name):
+                    # 会话列表显示没有变化，不切换群聊
+                    session_detector.mark_skipped(group_name)
+                    poll_scheduler.record(group_name, 0)
                     continue
-                    
-                # 安全检查消息列表
-                for group_name, current_msgs in current_msgs_all.items():
-                    if not current_msgs:
-                        print(f"{group_name} 没有获取到消息，等待下一轮检查")
-                        continue
-                    
-                    # 打印最新几条消息的基本信息
-                    print(f"{group_name} 最新几条消息:")
-                    for i in range(min(3, len(current_msgs))):
-                        try:
-                            idx = len(current_msgs) - 1 - i
-                            if idx >= 0:
-                                msg = current_msgs[idx]
-                                msg_id = getattr(msg, 'id', '无ID')
-                                msg_content = getattr(msg, 'content', '无内容')
-                                msg_sender = getattr(msg, 'sender', '未知发送者')
-                                print(f"最新消息 {i}: ID={msg_id}, 发送者={msg_sender}, 内容={msg_content[:20]}...")
-                        except Exception as e:
-                            print(f"打印 {group_name} 最新消息信息时出错: {e}")
-                    
-                    # 检查是否有新消息
-                    try:
-                        has_new_message = False
-                        if current_msgs and len(current_msgs) > 0:
-                            if last_msg_ids.get(group_name) is None:
-                                has_new_message = True
-                                print(f"{group_name} 首次检测，视为有新消息")
-                            elif hasattr(current_msgs[-1], 'id') and current_msgs[-1].id != last_msg_ids.get(group_name):
-                                has_new_message = True
-                                print(f"{group_name} 检测到新消息: 最新ID={current_msgs[-1].id}, 上次ID={last_msg_ids.get(group_name)}")
-                            else:
-                                print(f"{group_name} 没有检测到新消息")
-                        
-                        if has_new_message:
-                            # 有新消息，更新last_msg_ids
-                            new_msgs = []
-                            
-                            # 安全地处理消息
-                            for msg in reversed(current_msgs):
-                                if last_msg_ids.get(group_name) is not None and hasattr(msg, 'id') and msg.id == last_msg_ids.get(group_name):
-                                    print(f"{group_name} 找到上次的最后消息ID: {last_msg_ids.get(group_name)}")
-                                    break
-                                new_msgs.insert(0, msg)
-                            
-                            print(f"{group_name} 共有 {len(new_msgs)} 条新消息")
-                            
-                            # 更新最后一条消息ID
-                            if current_msgs and len(current_msgs) > 0 and hasattr(current_msgs[-1], 'id'):
-                                last_msg_ids[group_name] = current_msgs[-1].id
-                                print(f"{group_name} 更新最后消息ID为: {last_msg_ids[group_name]}")
-                            
-                            # 处理新消息
-                            for i, msg in enumerate(new_msgs):
-                                try:
-                                    # 确保消息有content属性和id属性
-                                    if not hasattr(msg, 'content'):
-                                        print(f"{group_name} 新消息 {i} 没有content属性")
-                                        continue
-                                    
-                                    # 检查消息是否有ID，如果没有则跳过
-                                    if not hasattr(msg, 'id') or not msg.id:
-                                        print(f"{group_name} 新消息 {i} 没有有效的ID")
-                                        continue
-                                    
-                                    # 检查消息是否已处理过
-                                    if msg.id in processed_at_msg_ids:
-                                        print(f"{group_name} 新消息 {i} (ID={msg.id})已处理过，跳过")
-                                        continue
-                                    
-                                    # 将消息ID添加到已处理集合
-                                    processed_at_msg_ids.add(msg.id)
-                                    
-                                    msg_content = msg.content
-                                    msg_sender = getattr(msg, 'sender', '未知用户')
-                                    print(f"{group_name} 处理新消息 {i}: 发送者={msg_sender}, 内容={msg_content}")
-                                        
-                                    # 检查是否有人@机器人
-                                    try:
-                                        if is_bot_mentioned(msg_content):
-                                            print(f"{group_name} 检测到@机器人消息: {msg_content}")
-                                            handle_mention(msg, group_name)
-                                    except Exception as e:
-                                        print(f"{group_name} 处理@消息时出错: {e}")
-                                    
-                                    # 检查是否有新订餐
-                                    try:
-                                        order_content, order_count = parse_order_message(msg_content)
-                                        if order_content and order_count:
-                                            print(f"{group_name} 检测到订餐消息: {msg_content}")
-                                            print(f"{group_name} 检测到新订餐: {msg_sender} - {order_content}，共{order_count}份")
-                                            # 实时保存订单
-                                            orders = collect_orders(group_name)
-                                            save_to_excel(orders, group_name)
-                                    except Exception as e:
-                                        print(f"{group_name} 处理订餐消息时出错: {e}")
-                                except Exception as e:
-                                    print(f"{group_name} 处理新消息 {i} 时出错: {e}")
-                    except Exception as e:
-                        print(f"{group_name} 处理消息列表时出错: {e}")
                 
-                # 检查是否需要执行定时任务
+                new_count = 0
                 try:
-                    if HAS_SCHEDULE:
-                        schedule.run_pending()
+                    # 切换到目标群聊并获取消息
+                    fetch_start = tracer.now()
+                    with tracer.span("抓取", 群聊=group_name):
+                        current_msgs = app.automation.fetch(group_name)
+                    if current_msgs is None:
+                        logger.warning("找不到群聊: %s", group_name)
                     else:
-                        # 自定义定时逻辑
-                        today = datetime.now().date()
-                        for group_name in GROUP_NAMES:
-                            if check_time_for_summary() and last_summary_dates.get(group_name) != today:
-                                print(f"{group_name} 到达汇总时间，开始发送汇总")
-                                send_summary(group_name)
-                                last_summary_dates[group_name] = today
+                        session_detector.mark_fetched(group_name)
+                        new_msgs = find_new_messages(group_name, current_msgs, last_msg_ids)
+                        new_count = len(new_msgs)
+                        if new_msgs:
+                            # 每条新消息分配追踪ID，之后各阶段的处理都记录在这条消息下
+                            trace_ids = tracer.start_messages(group_name, new_msgs, fetch_start)
+                            # 队列满时在这里阻塞，抓取速度不会超过下游处理速度
+                            pipeline.submit(MessageBatch(group_name, new_msgs, trace_ids=trace_ids))
                 except Exception as e:
-                    print(f"执行定时任务时出错: {e}")
+                    logger.error("获取 %s 消息时出错: %s", group_name, e)
+                
+                interval = poll_scheduler.record(group_name, new_count)
+                if new_count:
+                    logger.debug("%s 下次轮询间隔: %.1f秒", group_name, interval)
+            
+            # 清理台账中往日的数据
+            ledger.prune()
+            # 有新进度时写入检查点
+            app.checkpoint.save_if_due()
             
-            # 休眠时间，设置为5分钟
-            time.sleep(300)  # 5分钟 = 300秒
+            # 发送到时间的定时汇总，群聊列表变化时先更新各群聊的汇总
+            sync_summary_jobs(summary_scheduler)
+            summary_scheduler.run_pending()
+            
+            # 休眠到下一个群聊需要轮询或下一个定时汇总的时间
+            # 支持读取会话列表时最长按 SESSION_PROBE_INTERVAL 检查会话列表的变化
+            sleep_time = poll_scheduler.sleep_time(GROUP_NAMES)
+            if session_detector.supported:
+                sleep_time = min(sleep_time, SESSION_PROBE_INTERVAL)
+            next_summary = summary_scheduler.next_delay()
+            if next_summary is not None:
+                sleep_time = min(sleep_time, next_summary)
+            clock.sleep(sleep_time)
             
         except Exception as e:
-            print(f"监控过程中出错: {e}")
-            time.sleep(300)  # 出错后等待5分钟再重试
+            logger.error("监控过程中出错: %s", e)
+            clock.sleep(30)  # 出错后等待30秒再重试
 
-# 如果有schedule模块，设置每天16:00发送汇总
-if HAS_SCHEDULE:
-    schedule.every().day.at("16:00").do(lambda: [send_summary(group_name) for group_name in GROUP_NAMES])
 
 if __name__ == "__main__":
+    import argparse
+    import profiling
+    
+    parser = argparse.ArgumentParser(description="订餐统计机器人")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="启动后立即做一次指定时长的性能分析，结果写入 wxauto_logs/")
+    args = parser.parse_args()
+    setup_logging()
+    # 运行中发送 SIGUSR1（Windows下按Ctrl+Break）开始或结束性能分析
+    profiling.install_signal_handler()
+    if args.profile:
+        profiling.start_profiling(args.profile)
+    
     try:
-        print("订餐统计机器人已启动...")
-        print(f"机器人名称: {BOT_NAME}")
+        logger.info("订餐统计机器人已启动...")
+        logger.info("机器人名称: %s", BOT_NAME)
         
-        # 首次运行时收集并保存当前订单
-        for group_name in GROUP_NAMES:
-            orders = collect_orders(group_name)
-            save_to_excel(orders, group_name)
+        # 首次运行时收集并保存当前订单，有当天的检查点时直接从订单日志恢复
+        warm_start()
         
         # 开始监控
         monitor_group()
     except Exception as e:
-        print(f"程序运行出错: {e}")
+        logger.error("程序运行出错: %s", e)
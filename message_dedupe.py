@@ -0,0 +1,184 @@
+"""已处理消息的去重记录
+
+按群聊、按天分代保存已处理过的消息ID：每天一代，跨天时自动轮换，只保留最近 keep_days 天；
+每个群聊每天最多保留 max_per_group 条，超过时淘汰最早的记录。查找只检查保留的几代，
+仍然是O(1)，长时间运行时内存有上限。
+
+开启 compact 后只保存消息ID的64位哈希，每条记录占用的内存更少，误判的概率可以忽略。
+"""
+import collections
+import hashlib
+import threading
+
+from metrics import registry
+from order_ledger import get_date_key
+
+# 保留的天数：今天和昨天，午夜前后的消息第二天仍可能出现在聊天窗口中
+DEFAULT_KEEP_DAYS = 2
+# 每个群聊每天最多保留的消息ID数
+DEFAULT_MAX_PER_GROUP = 20000
+
+
+def compact_id(msg_id):
+    """消息ID的64位哈希"""
+    digest = hashlib.blake2b(str(msg_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class ProcessedMessageIds:
+    """按群聊、按天分代的已处理消息ID集合，多线程共用
+
+    Args:
+        keep_days: 保留的天数
+        max_per_group: 每个群聊每天最多保留的消息ID数
+        compact: 是否只保存消息ID的哈希
+        metric_label: 注册到运行指标时使用的标签，为None时不注册
+    """
+
+    def __init__(self, keep_days=DEFAULT_KEEP_DAYS, max_per_group=DEFAULT_MAX_PER_GROUP, compact=False,
+                 metric_label=None):
+        self.keep_days = max(keep_days, 1)
+        self.max_per_group = max_per_group
+        self.compact = compact
+        self._lock = threading.Lock()
+        # 日期 -> {群聊: {消息ID: None}}，字典按插入顺序保存，便于淘汰最早的记录
+        self._generations = collections.OrderedDict()
+        self._size = 0
+        # 超过每天上限被淘汰的条数
+        self.evicted = 0
+        # 跨天轮换时过期的条数
+        self.expired = 0
+        self.metric_label = metric_label
+        if metric_label is not None:
+            self._size_gauge = registry.gauge("wxbot_dedupe_entries", "去重记录中的消息ID数", "set")
+            self._evictions = registry.counter("wxbot_dedupe_evictions_total", "去重记录淘汰的消息ID数", "reason")
+
+    def _key(self, msg_id):
+        return compact_id(msg_id) if self.compact else msg_id
+
+    def _rotate(self, date_key):
+        """切换到 date_key 这一代，丢弃超出保留天数的旧代，需要持有锁"""
+        if date_key in self._generations:
+            return self._generations[date_key]
+        generation = self._generations[date_key] = {}
+        # 时钟被调回时新的一代可能比已有的早，按日期排序后再淘汰
+        if next(reversed(self._generations)) != max(self._generations):
+            self._generations = collections.OrderedDict(sorted(self._generations.items()))
+        expired = 0
+        while len(self._generations) > self.keep_days:
+            _, old = self._generations.popitem(last=False)
+            expired += sum(len(ids) for ids in old.values())
+        if expired:
+            self._size -= expired
+            self.expired += expired
+            if self.metric_label is not None:
+                self._evictions.inc(expired, "expired")
+            self._report()
+        return generation
+
+    def _contains(self, group_name, key):
+        for generation in self._generations.values():
+            ids = generation.get(group_name)
+            if ids is not None and key in ids:
+                return True
+        return False
+
+    def _add(self, generation, group_name, key):
+        ids = generation.get(group_name)
+        if ids is None:
+            ids = generation[group_name] = {}
+        ids[key] = None
+        self._size += 1
+        if len(ids) > self.max_per_group:
+            del ids[next(iter(ids))]
+            self._size -= 1
+            self.evicted += 1
+            if self.metric_label is not None:
+                self._evictions.inc(1, "capacity")
+
+    def _report(self):
+        if self.metric_label is not None:
+            self._size_gauge.set(self._size, self.metric_label)
+
+    def contains(self, group_name, msg_id, date=None):
+        """消息是否已处理过"""
+        key = self._key(msg_id)
+        with self._lock:
+            self._rotate(get_date_key(date))
+            return self._contains(group_name, key)
+
+    def add(self, group_name, msg_id, date=None):
+        """记录一条已处理的消息
+
+        Returns:
+            bool: 是否是新记录（之前没有处理过）
+        """
+        key = self._key(msg_id)
+        with self._lock:
+            generation = self._rotate(get_date_key(date))
+            if self._contains(group_name, key):
+                return False
+            self._add(generation, group_name, key)
+            self._report()
+            return True
+
+    def update(self, group_name, msg_ids, date=None):
+        """批量记录已处理的消息"""
+        keys = [self._key(msg_id) for msg_id in msg_ids if msg_id]
+        with self._lock:
+            generation = self._rotate(get_date_key(date))
+            for key in keys:
+                if not self._contains(group_name, key):
+                    self._add(generation, group_name, key)
+            self._report()
+
+    def __len__(self):
+        with self._lock:
+            return self._size
+
+    def stats(self):
+        """条目数、保留的天数、淘汰和过期的条数"""
+        with self._lock:
+            return {
+                "条目数": self._size,
+                "天数": len(self._generations),
+                "淘汰数": self.evicted,
+                "过期数": self.expired,
+                "哈希存储": self.compact,
+            }
+
+    def export(self):
+        """导出为可以写入JSON的数据，用于检查点"""
+        with self._lock:
+            return {
+                "compact": self.compact,
+                "days": {date_key: {group_name: list(ids) for group_name, ids in generation.items()}
+                         for date_key, generation in self._generations.items()},
+            }
+
+    def load(self, data):
+        """合并 export() 导出的数据，超出保留天数的记录会被丢弃
+
+        Returns:
+            int: 载入的条数
+        """
+        if not data:
+            return 0
+        source_compact = bool(data.get("compact"))
+        if source_compact and not self.compact:
+            # 哈希无法还原为消息ID
+            return 0
+        loaded = 0
+        with self._lock:
+            for date_key in sorted(data.get("days") or {}):
+                generation = self._rotate(date_key)
+                if date_key not in self._generations:
+                    continue  # 已超出保留天数
+                for group_name, ids in data["days"][date_key].items():
+                    for msg_id in ids:
+                        key = compact_id(msg_id) if self.compact and not source_compact else msg_id
+                        if not self._contains(group_name, key):
+                            self._add(generation, group_name, key)
+                            loaded += 1
+            self._report()
+        return loaded
@@ -0,0 +1,155 @@
+"""消息时间解析
+
+把微信消息的时间字符串换算为时间戳（整数秒），判断是不是今天只需要和当天零点的时间戳比大小。
+
+支持的写法：
+    2024-05-01 12:03:05、2024/05/01 12:03、2024年5月1日 12:03
+    05-01 12:03:05、5月1日 12:03        没有年份的按今年，晚于今天时按去年
+    12:03                               今天
+    昨天 12:03、前天 12:03
+    星期三 12:03、周三 12:03            最近一周内的那一天
+时分前面可以有"上午""下午""晚上"等。
+
+每种写法（数字都换成0之后的形状）第一次出现时找出对应的规则并记住，之后同样形状的字符串直接用这条规则；
+同一个时间字符串（微信的时间标题会在很多条消息上重复）的结果直接从缓存中取。
+相对日期的结果与当天有关，缓存按日期区分。
+"""
+import functools
+import re
+from datetime import date, datetime, timedelta
+
+import clock
+
+# 缓存的时间字符串数
+CACHE_SIZE = 4096
+
+_TIME = r'(?P<ampm>上午|下午|中午|晚上|凌晨)?\s*(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?'
+
+# (规则名称, 正则)，按顺序尝试
+_RULES = [
+    ("date", re.compile(r'(?P<year>\d{4})[-/](?P<month>\d{1,2})[-/](?P<day>\d{1,2})\s+' + _TIME)),
+    ("date", re.compile(r'(?P<year>\d{4})年(?P<month>\d{1,2})月(?P<day>\d{1,2})日\s*' + _TIME)),
+    ("month_day", re.compile(r'(?P<month>\d{1,2})[-/](?P<day>\d{1,2})\s+' + _TIME)),
+    ("month_day", re.compile(r'(?P<month>\d{1,2})月(?P<day>\d{1,2})日\s*' + _TIME)),
+    ("relative", re.compile(r'(?P<relative>今天|昨天|前天)\s*' + _TIME)),
+    ("weekday", re.compile(r'(?:星期|周)(?P<weekday>[一二三四五六日天])\s*' + _TIME)),
+    ("time", re.compile(_TIME)),
+]
+
+_RELATIVE_DAYS = {"今天": 0, "昨天": 1, "前天": 2}
+_WEEKDAYS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+
+_DIGITS = str.maketrans("0123456789", "0000000000")
+
+# 形状 -> _RULES 中的下标，没有匹配的规则时为None
+_shapes = {}
+
+
+def _rule_for(text):
+    shape = text.translate(_DIGITS)
+    try:
+        return _shapes[shape]
+    except KeyError:
+        pass
+    rule = None
+    for i, (_, pattern) in enumerate(_RULES):
+        if pattern.fullmatch(text):
+            rule = i
+            break
+    if len(_shapes) >= CACHE_SIZE:
+        # 正常只有十几种形状，异常输入太多时整个清空
+        _shapes.clear()
+    _shapes[shape] = rule
+    return rule
+
+
+def _hour(match):
+    hour = int(match.group('hour'))
+    ampm = match.group('ampm')
+    if ampm in ("下午", "晚上") and hour < 12:
+        hour += 12
+    elif ampm == "中午" and hour < 11:
+        hour += 12
+    elif ampm == "凌晨" and hour == 12:
+        hour = 0
+    return hour
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _normalize(text, today_ordinal):
+    rule = _rule_for(text)
+    if rule is None:
+        return None
+    kind, pattern = _RULES[rule]
+    match = pattern.fullmatch(text)
+    if match is None:
+        return None
+    today = date.fromordinal(today_ordinal)
+    try:
+        if kind == "date":
+            day = date(int(match.group('year')), int(match.group('month')), int(match.group('day')))
+        elif kind == "month_day":
+            month, day_of_month = int(match.group('month')), int(match.group('day'))
+            try:
+                day = date(today.year, month, day_of_month)
+            except ValueError:
+                day = None
+            if day is None or day > today:
+                day = date(today.year - 1, month, day_of_month)
+        elif kind == "relative":
+            day = today - timedelta(days=_RELATIVE_DAYS[match.group('relative')])
+        elif kind == "weekday":
+            # 今天和昨天微信不显示星期，和今天相同的星期几是一周前
+            days_back = (today.weekday() - _WEEKDAYS[match.group('weekday')]) % 7 or 7
+            day = today - timedelta(days=days_back)
+        else:
+            day = today
+        moment = datetime(day.year, day.month, day.day, _hour(match), int(match.group('minute')),
+                          int(match.group('second') or 0))
+    except ValueError:
+        return None
+    return int(moment.timestamp())
+
+
+def normalize_time(text, now=None):
+    """把消息时间字符串换算为时间戳（整数秒）
+
+    Args:
+        text: 消息时间，例如 "2024-05-01 12:03:05"、"昨天 12:03"
+        now: 当前时间（datetime），相对日期以它为准，为None时取当前时间
+
+    Returns:
+        int: 时间戳，无法识别时返回None
+    """
+    if not text:
+        return None
+    if now is None:
+        now = clock.now()
+    return _normalize(str(text).strip(), now.toordinal())
+
+
+@functools.lru_cache(maxsize=16)
+def _day_start(ordinal):
+    day = date.fromordinal(ordinal)
+    return int(datetime(day.year, day.month, day.day).timestamp())
+
+
+def day_start(now=None):
+    """当天零点的时间戳"""
+    if now is None:
+        now = clock.now()
+    return _day_start(now.toordinal())
+
+
+def is_today(timestamp, now=None):
+    """时间戳是否在今天"""
+    if now is None:
+        now = clock.now()
+    ordinal = now.toordinal()
+    return _day_start(ordinal) <= timestamp < _day_start(ordinal + 1)
+
+
+def clear_cache():
+    """清空解析缓存，用于基准测试"""
+    _normalize.cache_clear()
+    _shapes.clear()
@@ -0,0 +1,377 @@
+"""运行指标
+
+提供轻量的计数器、当前值和延迟直方图，用于统计微信操作、Excel读写、回复等的耗时和次数。
+指标注册到 registry 后可以导出为 Prometheus 文本格式：
+写入文件（write_prometheus_file）或通过本机HTTP端口提供（start_http_server）。
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def log_linear_buckets(min_ms=0.1, max_ms=300000, steps=(1, 1.5, 2, 3, 5, 7)):
+    """生成对数-线性分桶（类似HDR直方图）：每个数量级内再按 steps 细分，相对误差大致固定"""
+    buckets = []
+    decade = min_ms
+    while decade <= max_ms:
+        for step in steps:
+            bound = round(decade * step, 6)
+            if min_ms <= bound <= max_ms:
+                buckets.append(bound)
+        decade *= 10
+    return tuple(buckets)
+
+
+# 延迟分桶上界（毫秒），0.1ms到5分钟，每个数量级6个桶
+LATENCY_BUCKETS_MS = log_linear_buckets()
+
+
+class LatencyHistogram:
+    """分桶延迟直方图，记录次数、总和、最大值并估算分位数"""
+
+    def __init__(self, name, buckets=LATENCY_BUCKETS_MS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds):
+        """记录一次耗时（秒）"""
+        ms = seconds * 1000.0
+        index = bisect.bisect_left(self.buckets, ms)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total_ms += ms
+            if ms > self.max_ms:
+                self.max_ms = ms
+
+    def percentile(self, p):
+        """估算分位数（毫秒），返回所在分桶的上界"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            target = self.count * p / 100.0
+            seen = 0
+            for i, bucket_count in enumerate(self._counts):
+                seen += bucket_count
+                if seen >= target and bucket_count:
+                    if i < len(self.buckets):
+                        return round(min(self.buckets[i], self.max_ms), 2)
+                    return round(self.max_ms, 2)
+            return round(self.max_ms, 2)
+
+    def cumulative(self):
+        """各分桶的累计次数 [(上界毫秒, 累计次数)]，最后一项上界为None（+Inf）"""
+        with self._lock:
+            counts = list(self._counts)
+        result = []
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (None,), counts):
+            seen += bucket_count
+            result.append((bound, seen))
+        return result
+
+    def snapshot(self):
+        """获取统计快照"""
+        with self._lock:
+            count = self.count
+            avg = self.total_ms / count if count else 0.0
+            max_ms = self.max_ms
+        return {
+            "count": count,
+            "avg_ms": round(avg, 2),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(max_ms, 2),
+        }
+
+    def summary(self):
+        """生成一行可读的统计信息"""
+        snap = self.snapshot()
+        return (f"{self.name}: 共{snap['count']}次, 平均{snap['avg_ms']}ms, "
+                f"P50≤{snap['p50_ms']}ms, P95≤{snap['p95_ms']}ms, 最大{snap['max_ms']}ms")
+
+
+class Gauge:
+    """记录当前值的指标，例如轮询间隔、队列长度"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def set(self, value, label=None):
+        with self._lock:
+            self._values[label] = value
+
+    def get(self, label=None, default=0):
+        with self._lock:
+            return self._values.get(label, default)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Counter:
+    """只增不减的计数，例如解析的消息数、去重命中次数"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, label=None):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def get(self, label=None, default=0):
+        with self._lock:
+            return self._values.get(label, default)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class _Family:
+    def __init__(self, kind, help, label_name):
+        self.kind = kind
+        self.help = help
+        self.label_name = label_name
+        # 计数器和当前值为单个对象；直方图为 {标签值: LatencyHistogram}
+        self.metric = None
+        self.histograms = {}
+
+
+class _Timer:
+    """计时上下文管理器，也可以作为装饰器使用"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(label_name, label, extra=None):
+    pairs = []
+    if label_name and label is not None:
+        pairs.append(f'{label_name}="{_escape(label)}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """指标注册表
+
+    指标名称使用Prometheus的命名规则（英文、下划线），说明可以用中文。
+    每个指标最多一个标签，例如按群聊或按操作类型区分。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}
+
+    def _family(self, metric_name, kind, help, label_name):
+        with self._lock:
+            family = self._families.get(metric_name)
+            if family is None:
+                family = self._families[metric_name] = _Family(kind, help, label_name)
+            elif family.kind != kind:
+                raise ValueError(f"指标 {metric_name} 已注册为 {family.kind}")
+            return family
+
+    def counter(self, metric_name, help="", label_name=None):
+        """获取或创建计数器"""
+        family = self._family(metric_name, "counter", help, label_name)
+        with self._lock:
+            if family.metric is None:
+                family.metric = Counter(help or metric_name)
+            return family.metric
+
+    def gauge(self, metric_name, help="", label_name=None, gauge=None):
+        """获取或创建当前值指标，传入 gauge 时注册已有的对象"""
+        family = self._family(metric_name, "gauge", help, label_name)
+        with self._lock:
+            if gauge is not None:
+                family.metric = gauge
+            elif family.metric is None:
+                family.metric = Gauge(help or metric_name)
+            return family.metric
+
+    def histogram(self, metric_name, help="", label_name=None, label=None, histogram=None):
+        """获取或创建延迟直方图，传入 histogram 时注册已有的对象"""
+        family = self._family(metric_name, "histogram", help, label_name)
+        with self._lock:
+            if histogram is not None:
+                family.histograms[label] = histogram
+            elif label not in family.histograms:
+                name = f"{help or metric_name}[{label}]" if label is not None else (help or metric_name)
+                family.histograms[label] = LatencyHistogram(name)
+            return family.histograms[label]
+
+    def timer(self, metric_name, help="", label_name=None, label=None):
+        """返回计时器：with registry.timer(...): ... 或作为装饰器"""
+        return _Timer(self.histogram(metric_name, help, label_name, label))
+
+    def render_prometheus(self):
+        """导出为Prometheus文本格式"""
+        with self._lock:
+            families = sorted(self._families.items())
+            families = [(name, family, family.metric, dict(family.histograms)) for name, family in families]
+        lines = []
+        for name, family, metric, histograms in families:
+            if family.help:
+                lines.append(f"# HELP {name} {_escape(family.help)}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            if family.kind in ("counter", "gauge"):
+                for label, value in sorted((metric.snapshot() if metric else {}).items(), key=lambda item: str(item[0])):
+                    if isinstance(value, (int, float)):
+                        lines.append(f"{name}{_labels(family.label_name, label)} {_number(value)}")
+                continue
+            for label, histogram in sorted(histograms.items(), key=lambda item: str(item[0])):
+                for bound, seen in histogram.cumulative():
+                    le = "+Inf" if bound is None else repr(bound / 1000.0)
+                    bucket_labels = _labels(family.label_name, label, 'le="%s"' % le)
+                    lines.append(f"{name}_bucket{bucket_labels} {seen}")
+                snap_labels = _labels(family.label_name, label)
+                lines.append(f"{name}_sum{snap_labels} {_number(histogram.total_ms / 1000.0)}")
+                lines.append(f"{name}_count{snap_labels} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """生成可读的统计信息，每个指标一行"""
+        with self._lock:
+            families = sorted(self._families.items())
+            families = [(name, family, family.metric, dict(family.histograms)) for name, family in families]
+        lines = []
+        for name, family, metric, histograms in families:
+            if family.kind == "histogram":
+                for label, histogram in sorted(histograms.items(), key=lambda item: str(item[0])):
+                    lines.append(histogram.summary())
+            elif metric is not None:
+                values = metric.snapshot()
+                if list(values) == [None]:
+                    lines.append(f"{family.help or name}: {values[None]}")
+                elif values:
+                    lines.append(f"{family.help or name}: {values}")
+        return "\n".join(lines)
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+
+
+def timed(metric_name, help="", label_name=None, label=None):
+    """在全局注册表中计时，用法同 MetricsRegistry.timer"""
+    return registry.timer(metric_name, help, label_name, label)
+
+
+def write_prometheus_file(path, metrics_registry=None):
+    """把指标写入Prometheus文本文件（先写临时文件再替换，读取方不会看到写了一半的文件）"""
+    text = (metrics_registry or registry).render_prometheus()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def start_http_server(port, host="127.0.0.1", metrics_registry=None):
+    """在后台线程提供 http://host:port/metrics，返回服务器对象（调用 shutdown() 停止）"""
+    source = metrics_registry or registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = source.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # 不输出访问日志
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="MetricsHTTP")
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class MetricsFileExporter:
+    """定时把指标写入Prometheus文本文件，供 node_exporter 的 textfile 收集器读取
+
+    Args:
+        path: 输出文件路径
+        interval: 写入间隔（秒）
+    """
+
+    def __init__(self, path, interval=15.0, metrics_registry=None):
+        self.path = path
+        self.interval = interval
+        self.registry = metrics_registry or registry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="MetricsFileExporter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._write()
+
+    def _write(self):
+        try:
+            write_prometheus_file(self.path, self.registry)
+        except OSError:
+            pass  # 下一轮再写
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write()
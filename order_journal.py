@@ -0,0 +1,126 @@
+"""订单日志
+
+本地只追加的SQLite订单日志（WAL模式），是订单数据的唯一来源。
+每月的Excel统计表只是从日志导出的报表，读取订单时不再解析Excel。
+"""
+import sqlite3
+import threading
+import time
+
+from order_ledger import get_date_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_name TEXT NOT NULL,
+    order_date TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    portions INTEGER NOT NULL,
+    sent_time TEXT,
+    is_people_list INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_key
+    ON orders (group_name, order_date, sender, content);
+CREATE TABLE IF NOT EXISTS imported_days (
+    group_name TEXT NOT NULL,
+    order_date TEXT NOT NULL,
+    imported_at REAL NOT NULL,
+    PRIMARY KEY (group_name, order_date)
+);
+"""
+
+
+def _row_to_order(row):
+    sender, content, portions, sent_time, is_people_list = row
+    return {
+        "发送人": sender,
+        "订餐内容": content,
+        "订餐份数": portions,
+        "发送时间": sent_time,
+        "是否人员名单": bool(is_people_list),
+    }
+
+
+class OrderJournal:
+    """SQLite订单日志
+
+    (群聊, 日期, 发送人, 订餐内容) 上有唯一索引，重复订单在写入时直接忽略，
+    只插入不修改，写入一条订单的开销与已有数据量无关。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def append(self, group_name, orders, date=None):
+        """追加订单，已存在的订单会被忽略
+
+        Returns:
+            list: 实际新写入的订单
+        """
+        if not orders:
+            return []
+        date_key = get_date_key(date)
+        now = time.time()
+        inserted = []
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN")
+            try:
+                for order in orders:
+                    cursor.execute(
+                        "INSERT OR IGNORE INTO orders (group_name, order_date, sender, content, portions,"
+                        " sent_time, is_people_list, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (group_name, date_key, str(order['发送人']), str(order['订餐内容']),
+                         int(order['订餐份数']), str(order.get('发送时间', '')),
+                         1 if order.get('是否人员名单') else 0, now),
+                    )
+                    if cursor.rowcount:
+                        inserted.append(order)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return inserted
+
+    def get_orders(self, group_name, date=None):
+        """按写入顺序获取某个群聊某一天的订单"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sender, content, portions, sent_time, is_people_list FROM orders"
+                " WHERE group_name = ? AND order_date = ? ORDER BY id",
+                (group_name, get_date_key(date)),
+            ).fetchall()
+        return [_row_to_order(row) for row in rows]
+
+    def last_id(self):
+        """日志中最新一条订单的ID"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0]
+
+    def is_imported(self, group_name, date=None):
+        """是否已从旧的Excel统计表导入过该群聊该日的数据"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM imported_days WHERE group_name = ? AND order_date = ?",
+                (group_name, get_date_key(date)),
+            ).fetchone()
+        return row is not None
+
+    def mark_imported(self, group_name, date=None):
+        """标记该群聊该日的旧数据已导入"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO imported_days (group_name, order_date, imported_at) VALUES (?, ?, ?)",
+                (group_name, get_date_key(date), time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,177 @@
+"""订单台账
+
+按群聊、按日期在内存中维护当天的订单，只接收监控循环新发现的消息，
+避免每检测到一条订餐就重新读取、解析整个聊天记录。
+"""
+import threading
+
+import clock
+from bot_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_date_key(date=None):
+    """获取台账使用的日期键（YYYY-MM-DD）"""
+    if date is None:
+        return clock.now().strftime("%Y-%m-%d")
+    if isinstance(date, str):
+        return date
+    return date.strftime("%Y-%m-%d")
+
+
+def count_people(order):
+    """人员名单订单的人数：使用订单中的人数或名单实际人数中的较大值"""
+    count = order['订餐份数']
+    # 按空格分割人名并过滤空字符串
+    names_list = [name for name in str(order['订餐内容']).split() if name.strip()]
+    actual_count = len(names_list)
+    return count if count > actual_count else actual_count
+
+
+def format_summary(date_key, group_name, totals):
+    """根据累计数据生成汇总文本，规则与 generate_summary 一致
+
+    有人员名单订单时累加所有名单的人数，否则统计订餐人数和总份数。
+    """
+    if not totals["订单数"]:
+        return "没有找到订餐信息"
+    if totals["人员名单数"]:
+        return f"{date_key}{group_name}订餐汇总：共{totals['名单人数']}人"
+    return f"{date_key}{group_name}订餐汇总：共{totals['人数']}人订餐，{totals['份数']}份"
+
+
+def make_order_key(order):
+    """订单去重键：只使用发送人和订餐内容，不使用时间"""
+    return (order['发送人'], order['订餐内容'])
+
+
+class DayOrders:
+    """某个群聊某一天的订单、去重键和累计数据"""
+
+    def __init__(self):
+        self.orders = []
+        self.keys = set()
+        # 普通订餐统计（不含机器人自己）
+        self.senders = set()
+        self.total_portions = 0
+        # 人员名单统计
+        self.people_list_orders = 0
+        self.people_total = 0
+
+    def add(self, order):
+        """添加一条订单，重复订单返回False"""
+        key = make_order_key(order)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        self.orders.append(dict(order))
+        if order.get('是否人员名单', False):
+            self.people_list_orders += 1
+            self.people_total += count_people(order)
+        if order['发送人'] != 'self':
+            self.senders.add(order['发送人'])
+            self.total_portions += order['订餐份数']
+        return True
+
+    def totals(self):
+        return {
+            "订单数": len(self.orders),
+            "人数": len(self.senders),
+            "份数": self.total_portions,
+            "人员名单数": self.people_list_orders,
+            "名单人数": self.people_total,
+        }
+
+
+class OrderLedger:
+    """按 (群聊, 日期) 维护的内存订单台账，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = {}
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """订阅台账变化
+
+        每次有新订单入账后调用 listener(群聊, 日期, 累计数据)，调用发生在添加订单的线程中，
+        界面等需要在特定线程更新的订阅者应自行转交。
+
+        Returns:
+            function: 调用后取消订阅
+        """
+        with self._lock:
+            self._listeners = self._listeners + [listener]
+
+        def unsubscribe():
+            with self._lock:
+                self._listeners = [item for item in self._listeners if item is not listener]
+        return unsubscribe
+
+    def _notify(self, listeners, group_name, date_key, totals):
+        for listener in listeners:
+            try:
+                listener(group_name, date_key, totals)
+            except Exception as e:
+                # 订阅者出错不能影响订单入账
+                logger.error("台账订阅者处理出错: %s", e)
+
+    def _get_day(self, group_name, date_key):
+        day = self._days.get((group_name, date_key))
+        if day is None:
+            day = DayOrders()
+            self._days[(group_name, date_key)] = day
+        return day
+
+    def add_orders(self, group_name, orders, date=None):
+        """批量添加订单
+
+        Returns:
+            list: 实际新增（未重复）的订单
+        """
+        date_key = get_date_key(date)
+        added = []
+        with self._lock:
+            day = self._get_day(group_name, date_key)
+            for order in orders:
+                if day.add(order):
+                    added.append(dict(order))
+            totals = day.totals() if added else None
+            listeners = self._listeners
+        if added:
+            self._notify(listeners, group_name, date_key, totals)
+        return added
+
+    def has_day(self, group_name, date=None):
+        """台账中是否已有该群聊当天的数据"""
+        with self._lock:
+            return (group_name, get_date_key(date)) in self._days
+
+    def get_orders(self, group_name, date=None):
+        """获取订单列表，格式与 collect_orders 返回的一致"""
+        with self._lock:
+            day = self._days.get((group_name, get_date_key(date)))
+            if day is None:
+                return []
+            return [dict(order) for order in day.orders]
+
+    def get_totals(self, group_name, date=None):
+        """获取累计数据：订单数、订餐人数、总份数、人员名单数和名单人数"""
+        with self._lock:
+            day = self._days.get((group_name, get_date_key(date)))
+            if day is None:
+                day = DayOrders()
+            return day.totals()
+
+    def get_summary(self, group_name, date=None):
+        """直接由累计数据生成汇总文本，不需要遍历订单"""
+        date_key = get_date_key(date)
+        return format_summary(date_key, group_name, self.get_totals(group_name, date_key))
+
+    def prune(self, keep_date=None):
+        """清理早于指定日期的数据，避免长时间运行时台账无限增长"""
+        keep_key = get_date_key(keep_date)
+        with self._lock:
+            for key in [key for key in self._days if key[1] < keep_key]:
+                del self._days[key]
@@ -0,0 +1,88 @@
+"""订餐消息解析
+
+一个预编译的组合正则同时识别两种格式，每条消息只扫描一遍：
+    xxx，共N份              按份数订餐
+    张三 李四， 共N人        人员名单（中英文逗号，逗号后可以有空格）
+不含"共"或者既不含"份"也不含"人"的消息（大部分闲聊）直接跳过，不进入正则。
+一条消息有多行时，每行可以是一条订单。
+
+同一行同时出现两种格式时以份数格式为准，与原来先匹配份数格式、再匹配人员名单的顺序一致。
+"""
+import re
+
+# 份数格式的分隔符只支持中文逗号，人员名单格式支持中英文逗号
+ORDER_RE = re.compile(
+    r'(?P<content>.+?)(?:，共(?P<portions>\d+)份|[,，]\s*共(?P<people>\d+)人)'
+)
+# 同一行两种格式都出现时，用它找出份数格式的订单
+PORTION_RE = re.compile(r'(.+?)，共(\d+)份')
+
+
+def _might_be_order(content):
+    return '共' in content and ('份' in content or '人' in content)
+
+
+def _parse_line(line):
+    """解析一行，返回 (订餐内容, 份数, 是否人员名单) 或None"""
+    match = ORDER_RE.search(line)
+    if match is None:
+        return None
+    if match.group('portions') is not None:
+        return match.group('content'), int(match.group('portions')), '人' in line
+    if '份' in line:
+        portion_match = PORTION_RE.search(line)
+        if portion_match is not None:
+            return portion_match.group(1), int(portion_match.group(2)), True
+    return match.group('content').strip(), int(match.group('people')), True
+
+
+def parse_orders(content):
+    """解析一条消息中的所有订单
+
+    Returns:
+        list: [(订餐内容, 份数, 是否人员名单)]，不是订餐消息时为空列表。
+        是否人员名单沿用原来的判断：该行包含"人"字。
+    """
+    if not content or not _might_be_order(content):
+        return []
+    if '\n' not in content:
+        order = _parse_line(content)
+        return [order] if order else []
+    orders = []
+    for line in content.splitlines():
+        if _might_be_order(line):
+            order = _parse_line(line)
+            if order:
+                orders.append(order)
+    return orders
+
+
+def parse_order(content):
+    """解析单条订单，返回 (订餐内容, 份数)，不是订餐消息时返回 (None, None)
+
+    多行消息只返回第一条订单。
+    """
+    orders = parse_orders(content)
+    if not orders:
+        return None, None
+    order_content, count, _ = orders[0]
+    return order_content, count
+
+
+def parse_orders_batch(contents):
+    """批量解析消息内容，不输出日志
+
+    Args:
+        contents: 消息内容列表
+
+    Returns:
+        list: 与 contents 一一对应，每项为该消息的订单列表（格式同 parse_orders）
+    """
+    results = []
+    append = results.append
+    for content in contents:
+        if content and _might_be_order(content):
+            append(parse_orders(content))
+        else:
+            append([])
+    return results
@@ -0,0 +1,159 @@
+"""消息处理流水线
+
+把监控循环拆成多个阶段，阶段之间用有界队列连接：
+抓取（只负责从界面读取新消息）→ 解析分类 → 订单入账保存 → 发送回复。
+每个阶段有自己的工作线程，下游处理慢时上游在放入队列时阻塞（背压），
+写Excel慢不会再拖慢下一次轮询和下一条回复。
+"""
+import queue
+import threading
+import time
+
+import clock
+from bot_logging import get_logger
+
+logger = get_logger(__name__)
+
+# 阶段队列默认容量
+DEFAULT_QUEUE_SIZE = 100
+
+_STOP = object()
+
+
+class MessageBatch:
+    """抓取阶段输出：某个群聊一次轮询发现的新消息"""
+
+    def __init__(self, group_name, msgs, fetched_at=None, trace_ids=None):
+        self.group_name = group_name
+        self.msgs = msgs
+        self.fetched_at = fetched_at if fetched_at is not None else clock.time()
+        # 与 msgs 一一对应的追踪ID，没有开启追踪时为空列表
+        self.trace_ids = trace_ids or []
+
+
+class ParsedBatch:
+    """解析阶段输出：识别出的订单和@机器人的消息"""
+
+    def __init__(self, group_name, orders, mentions, fetched_at, order_traces=None, msg_ids=None):
+        self.group_name = group_name
+        self.orders = orders
+        # [(消息, 检测到的时间戳, 追踪ID)]
+        self.mentions = mentions
+        self.fetched_at = fetched_at
+        # 订单去重键 -> 来源消息的追踪ID
+        self.order_traces = order_traces or {}
+        # 这批消息的ID，处理完后记录到检查点
+        self.msg_ids = msg_ids or []
+
+
+class Stage:
+    """流水线中的一个阶段
+
+    Args:
+        name: 阶段名称
+        handler: 处理函数，接收一个输入，返回交给下一阶段的输出列表（可以为空）
+        maxsize: 输入队列容量，队列满时上游阻塞
+        workers: 工作线程数，需要保持处理顺序的阶段只能使用1个
+    """
+
+    def __init__(self, name, handler, maxsize=DEFAULT_QUEUE_SIZE, workers=1):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue.Queue(maxsize)
+        self.downstream = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.time()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"Pipeline-{self.name}-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item, timeout=None):
+        """放入一个待处理项，队列满时阻塞"""
+        self.queue.put(item, timeout=timeout)
+
+    def stop(self):
+        """处理完队列中已有的项目后停止"""
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                self.queue.task_done()
+                return
+            start = time.time()
+            try:
+                outputs = self.handler(item) or []
+                for output in outputs:
+                    if self.downstream is not None:
+                        self.downstream.put(output)
+                with self._lock:
+                    self.items_out += len(outputs)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logger.error("流水线阶段[%s]处理出错: %s", self.name, e)
+            finally:
+                with self._lock:
+                    self.items_in += 1
+                    self.busy_seconds += time.time() - start
+                self.queue.task_done()
+
+    def stats(self):
+        """阶段统计：处理数量、吞吐量、队列长度、忙碌比例"""
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-6) if self.started_at else 0
+            return {
+                "处理数": self.items_in,
+                "输出数": self.items_out,
+                "错误数": self.errors,
+                "队列长度": self.queue.qsize(),
+                "吞吐量": round(self.items_in / elapsed, 3) if elapsed else 0.0,
+                "忙碌比例": round(self.busy_seconds / elapsed, 3) if elapsed else 0.0,
+            }
+
+
+class Pipeline:
+    """按顺序连接的多个阶段"""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        for upstream, downstream in zip(self.stages, self.stages[1:]):
+            upstream.downstream = downstream
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, item, timeout=None):
+        """提交给第一个阶段，队列满时阻塞"""
+        self.stages[0].put(item, timeout=timeout)
+
+    def join(self):
+        """等待所有已提交的项目处理完"""
+        for stage in self.stages:
+            stage.queue.join()
+
+    def stop(self):
+        """按顺序处理完剩余项目并停止所有阶段"""
+        for stage in self.stages:
+            stage.stop()
+
+    def summary(self):
+        """生成可读的统计信息"""
+        return "\n".join(f"流水线阶段[{stage.name}]: {stage.stats()}" for stage in self.stages)
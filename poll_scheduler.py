@@ -0,0 +1,145 @@
+"""自适应轮询调度
+
+按群聊统计消息到达速率（指数加权移动平均），有消息时缩短轮询间隔，
+空闲时按指数退避延长间隔；订餐时段内间隔不超过一个较小的上限，
+避免午饭高峰的订单要等好几分钟才被发现。
+"""
+import threading
+from datetime import datetime
+
+import clock
+from metrics import Gauge, registry
+
+# 订餐时段（开始, 结束），时段内轮询间隔不超过 MEAL_MAX_INTERVAL
+MEAL_WINDOWS = (("10:00", "12:30"), ("15:00", "17:30"))
+
+# 默认轮询间隔参数（秒）
+MIN_INTERVAL = 5
+MAX_INTERVAL = 300
+MEAL_MAX_INTERVAL = 30
+
+
+def _to_minutes(hhmm):
+    hour, minute = hhmm.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+class _GroupState:
+    def __init__(self, interval):
+        self.rate = 0.0
+        self.interval = interval
+        self.last_poll = None
+        self.next_due = 0.0
+
+
+class AdaptivePollScheduler:
+    """按群聊自适应调整轮询间隔
+
+    Args:
+        min_interval: 最短轮询间隔（秒）
+        max_interval: 空闲时最长轮询间隔（秒）
+        meal_max_interval: 订餐时段内的最长轮询间隔（秒）
+        meal_windows: 订餐时段列表，格式为 (("10:00", "12:30"), ...)
+        backoff: 空闲时间隔的增长倍数
+        alpha: 消息速率EWMA的平滑系数，越大越看重最近一次
+        target_msgs: 活跃时希望每次轮询平均拿到的消息条数
+    """
+
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 meal_max_interval=MEAL_MAX_INTERVAL, meal_windows=MEAL_WINDOWS,
+                 backoff=2.0, alpha=0.3, target_msgs=1.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.meal_max_interval = meal_max_interval
+        self.meal_windows = [(_to_minutes(start), _to_minutes(end)) for start, end in meal_windows]
+        self.backoff = backoff
+        self.alpha = alpha
+        self.target_msgs = target_msgs
+        self._lock = threading.Lock()
+        self._groups = {}
+        # 每个群聊当前的轮询间隔
+        self.interval_gauge = registry.gauge("wxbot_poll_interval_seconds", "群聊轮询间隔", "group",
+                                             gauge=Gauge("轮询间隔"))
+
+    def _state(self, group_name):
+        state = self._groups.get(group_name)
+        if state is None:
+            state = _GroupState(self.min_interval)
+            self._groups[group_name] = state
+        return state
+
+    def _due_at(self, state, now):
+        # 进入订餐时段后，之前退避得很长的间隔也要按时段上限收紧
+        if state.last_poll is None:
+            return state.next_due
+        return min(state.next_due, state.last_poll + self.upper_bound(now))
+
+    def in_meal_window(self, now=None):
+        """当前是否处于订餐时段"""
+        moment = datetime.fromtimestamp(now if now is not None else clock.time())
+        minutes = moment.hour * 60 + moment.minute
+        return any(start <= minutes < end for start, end in self.meal_windows)
+
+    def upper_bound(self, now=None):
+        """当前时刻允许的最长轮询间隔"""
+        if self.in_meal_window(now):
+            return min(self.max_interval, self.meal_max_interval)
+        return self.max_interval
+
+    def record(self, group_name, new_count, now=None):
+        """记录一次轮询的结果，并计算下一次轮询时间
+
+        Args:
+            group_name: 群聊名称
+            new_count: 本次轮询发现的新消息数量
+        """
+        now = now if now is not None else clock.time()
+        with self._lock:
+            state = self._state(group_name)
+            elapsed = now - state.last_poll if state.last_poll is not None else state.interval
+            elapsed = max(elapsed, 1e-3)
+            state.rate = self.alpha * (new_count / elapsed) + (1 - self.alpha) * state.rate
+
+            if new_count > 0 and state.rate > 0:
+                # 有消息到达：按速率缩短间隔，使每次轮询大约拿到 target_msgs 条消息
+                interval = self.target_msgs / state.rate
+            else:
+                # 空闲：指数退避
+                interval = state.interval * self.backoff
+
+            state.interval = max(self.min_interval, min(interval, self.upper_bound(now)))
+            state.last_poll = now
+            state.next_due = now + state.interval
+            interval = state.interval
+        self.interval_gauge.set(round(interval, 2), group_name)
+        return interval
+
+    def is_due(self, group_name, now=None):
+        """群聊是否到了轮询时间"""
+        now = now if now is not None else clock.time()
+        with self._lock:
+            return self._due_at(self._state(group_name), now) <= now
+
+    def due_groups(self, group_names, now=None):
+        """返回到了轮询时间的群聊"""
+        return [group_name for group_name in group_names if self.is_due(group_name, now)]
+
+    def poll_soon(self, group_name):
+        """让群聊在下一轮立即被轮询，例如检测到未读消息时"""
+        with self._lock:
+            state = self._state(group_name)
+            state.next_due = 0.0
+
+    def sleep_time(self, group_names, now=None):
+        """距离最近一个群聊需要轮询还有多久（秒）"""
+        now = now if now is not None else clock.time()
+        with self._lock:
+            if not group_names:
+                return self.min_interval
+            next_due = min(self._due_at(self._state(group_name), now) for group_name in group_names)
+        return max(0.0, next_due - now)
+
+    def current_interval(self, group_name):
+        """群聊当前的轮询间隔（秒）"""
+        with self._lock:
+            return self._state(group_name).interval
@@ -0,0 +1,298 @@
+"""运行时性能分析
+
+在不重启机器人的情况下，对运行中的进程做一段固定时长的分析：
+- 采样分析：后台线程定时读取所有线程的调用栈（监控循环、流水线各阶段、Excel写入线程等），
+  结果保存为pstats文件（可用 python -m pstats 或 snakeviz 查看）和折叠调用栈文本
+  （可用 flamegraph.pl 或 https://www.speedscope.app 生成火焰图）
+- 内存分析：用tracemalloc对比开始和结束时的内存分配，输出占用最多和增长最多的代码行
+
+cProfile只能分析调用 enable() 的那个线程，而机器人的工作都在后台线程中完成，所以这里使用采样。
+结果写入 wxauto_logs/，文件名带开始时间。
+
+触发方式：GUI中的"性能分析"按钮；命令行 python index.py --profile 秒数；
+运行中向进程发送 SIGUSR1（Windows下在控制台按 Ctrl+Break）。
+"""
+import collections
+import marshal
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+from bot_logging import LOG_DIR, get_logger
+
+logger = get_logger(__name__)
+
+# 默认分析时长（秒）
+DEFAULT_DURATION = 60
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+# 内存报告中列出的代码行数
+TOP_ALLOCATIONS = 30
+# 采样结束时在日志中列出的函数数
+TOP_FUNCTIONS = 10
+# tracemalloc 记录的调用栈深度
+MEMORY_FRAMES = 5
+
+# 线程在这些函数中时视为空闲等待，不计入采样
+IDLE_FUNCTIONS = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+    ("clock.py", "sleep"),
+    ("handlers.py", "dequeue"),
+    ("__init__.py", "mainloop"),
+}
+
+_lock = threading.Lock()
+_session = None
+
+
+def _func_key(code):
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class SamplingProfiler:
+    """定时采样所有线程的调用栈
+
+    Args:
+        interval: 采样间隔（秒）
+        include_idle: 是否计入处于空闲等待中的线程
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, include_idle=False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        # 函数 -> 在栈顶的采样数
+        self._self_counts = collections.Counter()
+        # 函数 -> 在栈中的采样数（递归只计一次）
+        self._total_counts = collections.Counter()
+        # (调用方, 被调用方) -> 采样数
+        self._edges = collections.Counter()
+        # 折叠调用栈 "线程;函数;函数" -> 采样数
+        self._stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.stopped_at = time.time()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._sample(names.get(thread_id, str(thread_id)), frame)
+
+    def _sample(self, thread_name, frame):
+        code = frame.f_code
+        if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FUNCTIONS:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(_func_key(frame.f_code))
+            frame = frame.f_back
+        self.samples += 1
+        self._self_counts[stack[0]] += 1
+        for key in set(stack):
+            self._total_counts[key] += 1
+        for callee, caller in zip(stack, stack[1:]):
+            self._edges[(caller, callee)] += 1
+        names = [f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in reversed(stack)]
+        self._stacks[";".join([thread_name] + names)] += 1
+
+    def pstats_dict(self):
+        """转换为pstats的数据格式，次数为采样数，时间为采样数乘以采样间隔"""
+        callers = collections.defaultdict(dict)
+        for (caller, callee), count in self._edges.items():
+            callers[callee][caller] = (count, count, 0.0, count * self.interval)
+        stats = {}
+        for key, total in self._total_counts.items():
+            own = self._self_counts.get(key, 0)
+            stats[key] = (total, total, own * self.interval, total * self.interval, callers.get(key, {}))
+        return stats
+
+    def write_pstats(self, path):
+        with open(path, "wb") as f:
+            marshal.dump(self.pstats_dict(), f)
+
+    def write_stacks(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit=TOP_FUNCTIONS):
+        """栈顶采样最多的函数：[(函数描述, 采样数)]"""
+        return [(f"{name} ({os.path.basename(filename)}:{line})", count)
+                for (filename, line, name), count in self._self_counts.most_common(limit)]
+
+
+def _write_memory_report(path, start_snapshot, end_snapshot, limit=TOP_ALLOCATIONS):
+    # 去掉tracemalloc和采样分析自身的分配
+    end_snapshot = end_snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                               tracemalloc.Filter(False, __file__)])
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"当前占用最多的 {limit} 处代码\n")
+        for stat in end_snapshot.statistics("lineno")[:limit]:
+            f.write(f"{stat}\n")
+        if start_snapshot is not None:
+            f.write(f"\n分析期间增长最多的 {limit} 处代码\n")
+            for stat in end_snapshot.compare_to(start_snapshot, "lineno")[:limit]:
+                f.write(f"{stat}\n")
+        f.write(f"\n占用最多的 {min(limit, 10)} 处调用栈\n")
+        for stat in end_snapshot.statistics("traceback")[:min(limit, 10)]:
+            f.write(f"\n{stat.count}个内存块, {stat.size / 1024:.1f} KiB\n")
+            for line in stat.traceback.format():
+                f.write(f"{line}\n")
+
+
+class ProfileSession:
+    """一次固定时长的分析，结束后写入结果文件
+
+    Args:
+        duration: 分析时长（秒），到时自动结束
+        memory: 是否同时做内存分析
+        out_dir: 结果目录
+    """
+
+    def __init__(self, duration=DEFAULT_DURATION, memory=True, out_dir=LOG_DIR, interval=SAMPLE_INTERVAL):
+        self.duration = duration
+        self.memory = memory
+        self.out_dir = out_dir
+        self.profiler = SamplingProfiler(interval)
+        self.prefix = os.path.join(out_dir, time.strftime("profile-%Y%m%d-%H%M%S"))
+        self.files = []
+        self._started_tracemalloc = False
+        self._start_snapshot = None
+        self._done = threading.Event()
+        self._finished = threading.Event()
+        self._timer = None
+
+    @property
+    def running(self):
+        """分析还在进行或结果还没写完"""
+        return not self._finished.is_set()
+
+    def start(self):
+        if self.memory:
+            # 分析开始时才启动tracemalloc的话，只能看到分析期间分配且仍未释放的内存
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(MEMORY_FRAMES)
+                self._started_tracemalloc = True
+            self._start_snapshot = tracemalloc.take_snapshot()
+        self.profiler.start()
+        self._timer = threading.Timer(self.duration, self.stop)
+        self._timer.daemon = True
+        self._timer.start()
+        logger.info("开始性能分析，时长%s秒，结果将写入 %s*", self.duration, self.prefix)
+
+    def stop(self):
+        """结束分析并写入结果，重复调用无效
+
+        Returns:
+            list: 结果文件路径
+        """
+        global _session
+        with _lock:
+            if self._done.is_set():
+                return self.files
+            self._done.set()
+            if _session is self:
+                _session = None
+        if self._timer is not None:
+            self._timer.cancel()
+        self.profiler.stop()
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            self._write_results()
+        except Exception as e:
+            logger.error("写入性能分析结果时出错: %s", e)
+        finally:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self._finished.set()
+        return self.files
+
+    def _write_results(self):
+        profiler = self.profiler
+        if profiler.samples:
+            pstats_path = self.prefix + ".pstats"
+            profiler.write_pstats(pstats_path)
+            stacks_path = self.prefix + "-stacks.txt"
+            profiler.write_stacks(stacks_path)
+            self.files += [pstats_path, stacks_path]
+        if self.memory and tracemalloc.is_tracing():
+            memory_path = self.prefix + "-memory.txt"
+            _write_memory_report(memory_path, self._start_snapshot, tracemalloc.take_snapshot())
+            self.files.append(memory_path)
+
+        elapsed = (profiler.stopped_at or time.time()) - (profiler.started_at or time.time())
+        logger.info("性能分析结束，用时%.0f秒，有效采样%s次，结果: %s",
+                    elapsed, profiler.samples, ", ".join(self.files) or "无")
+        for name, count in profiler.top_functions():
+            logger.info("  %5.1f%% %s", count * 100.0 / profiler.samples, name)
+
+
+def start_profiling(duration=DEFAULT_DURATION, memory=True, out_dir=LOG_DIR):
+    """开始一次性能分析，已有分析在进行时返回None"""
+    global _session
+    with _lock:
+        if _session is not None:
+            logger.warning("性能分析已在进行中")
+            return None
+        _session = ProfileSession(duration, memory, out_dir)
+    _session.start()
+    return _session
+
+
+def stop_profiling():
+    """提前结束正在进行的分析，返回结果文件路径"""
+    session = _session
+    return session.stop() if session is not None else []
+
+
+def is_profiling():
+    return _session is not None
+
+
+def toggle_profiling(duration=DEFAULT_DURATION):
+    """没有分析在进行时开始一次，否则提前结束"""
+    if is_profiling():
+        stop_profiling()
+    else:
+        start_profiling(duration)
+
+
+def install_signal_handler(duration=DEFAULT_DURATION):
+    """收到 SIGUSR1（Windows下为Ctrl+Break的SIGBREAK）时开始或结束分析，只能在主线程调用
+
+    Returns:
+        bool: 当前平台是否支持
+    """
+    signum = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+    if signum is None:
+        return False
+
+    def handler(signum, frame):
+        # 信号处理函数中不做文件写入，交给新线程
+        threading.Thread(target=toggle_profiling, args=(duration,), name="ProfileToggle", daemon=True).start()
+
+    signal.signal(signum, handler)
+    logger.info("发送信号 %s 可开始或结束性能分析", signal.Signals(signum).name)
+    return True
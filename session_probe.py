@@ -0,0 +1,122 @@
+"""会话列表变化检测
+
+每轮只读取一次微信的会话列表（未读数、最后一条消息预览），
+只有未读数或预览发生变化的群聊才需要切换进去读取消息，
+避免对没有新消息的群聊做 ChatWith + GetAllMessage。
+"""
+import clock
+from bot_logging import get_logger
+
+logger = get_logger(__name__)
+
+# 即使会话列表没有变化，超过这个时间（秒）也要真正读取一次消息，防止漏检
+DEFAULT_MAX_STALENESS = 300
+
+
+class SessionSnapshot:
+    """某个会话在会话列表中的状态"""
+
+    __slots__ = ("unread", "preview", "time")
+
+    def __init__(self, unread=0, preview=None, time=None):
+        self.unread = unread or 0
+        self.preview = preview
+        self.time = time
+
+    def same_as(self, other):
+        return (other is not None and self.unread == other.unread
+                and self.preview == other.preview and self.time == other.time)
+
+    def __repr__(self):
+        return f"SessionSnapshot(unread={self.unread}, preview={self.preview!r}, time={self.time!r})"
+
+
+def read_sessions(wx):
+    """读取会话列表
+
+    兼容wxauto的两种接口：GetSession() 返回会话元素列表，
+    GetSessionList() 返回 {名称: 未读数}。
+
+    Returns:
+        dict: {会话名称: SessionSnapshot}，当前wxauto版本不支持时返回None
+    """
+    if hasattr(wx, 'GetSession'):
+        sessions = {}
+        for session in wx.GetSession() or []:
+            name = getattr(session, 'name', None)
+            if not name:
+                continue
+            sessions[name] = SessionSnapshot(
+                unread=getattr(session, 'new_count', 0) or (1 if getattr(session, 'isnew', False) else 0),
+                preview=getattr(session, 'content', None),
+                time=getattr(session, 'time', None),
+            )
+        return sessions
+    if hasattr(wx, 'GetSessionList'):
+        return {name: SessionSnapshot(unread=count) for name, count in (wx.GetSessionList() or {}).items()}
+    return None
+
+
+class SessionChangeDetector:
+    """根据会话列表判断哪些群聊需要读取消息
+
+    Args:
+        max_staleness: 群聊最长多久（秒）必须真正读取一次消息
+    """
+
+    def __init__(self, max_staleness=DEFAULT_MAX_STALENESS):
+        self.max_staleness = max_staleness
+        # 最近一次读取会话列表的结果
+        self._latest = {}
+        # 最近一次真正读取消息时的会话状态
+        self._seen = {}
+        self._last_fetch = {}
+        # 当前wxauto版本是否支持读取会话列表
+        self.supported = True
+        self.skipped = 0
+
+    def probe(self, wx):
+        """读取一次会话列表，失败或不支持时返回False"""
+        if not self.supported:
+            return False
+        try:
+            sessions = read_sessions(wx)
+        except Exception as e:
+            logger.warning("读取会话列表时出错: %s", e)
+            self._latest = {}
+            return False
+        if sessions is None:
+            logger.warning("当前wxauto版本不支持读取会话列表，将逐个检查群聊")
+            self.supported = False
+            return False
+        self._latest = sessions
+        return True
+
+    def has_changed(self, group_name, now=None):
+        """群聊自上次读取消息后是否可能有新消息"""
+        now = now if now is not None else clock.time()
+        if not self.supported:
+            return True
+        if now - self._last_fetch.get(group_name, 0) >= self.max_staleness:
+            return True
+        current = self._latest.get(group_name)
+        if current is None:
+            # 群聊不在会话列表可见范围内，无法判断，等到超时再检查
+            return False
+        return current.unread > 0 or not current.same_as(self._seen.get(group_name))
+
+    def changed_groups(self, group_names, now=None):
+        """返回需要读取消息的群聊"""
+        return [group_name for group_name in group_names if self.has_changed(group_name, now)]
+
+    def mark_fetched(self, group_name, now=None):
+        """读取完群聊消息后调用，记录当前的会话状态"""
+        self._last_fetch[group_name] = now if now is not None else clock.time()
+        current = self._latest.get(group_name)
+        if current is not None:
+            # 切换进群聊后未读数会被清零
+            self._seen[group_name] = SessionSnapshot(0, current.preview, current.time)
+
+    def mark_skipped(self, group_name):
+        """记录一次因会话列表没有变化而跳过的检查"""
+        self.skipped += 1
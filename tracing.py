@@ -0,0 +1,237 @@
+"""消息追踪
+
+监控抓取到的每条消息分配一个追踪ID，记录它经过的各个阶段：
+抓取 → 解析 → 去重 → 写入订单日志 → Excel写入 → 回复，每个阶段一段带开始/结束时间的记录。
+可以导出为Chrome trace-event JSON，用 chrome://tracing 或 https://ui.perfetto.dev 打开，
+每条消息一条时间轴，能直观看到消息在哪个阶段变慢、在哪个阶段被判定为重复或跳过。
+
+用法：
+    trace_ids = tracer.start_messages(group_name, msgs, fetch_start, fetch_end)
+    start = tracer.now()
+    ...
+    tracer.message_span(trace_id, "解析", start, 订单数=2)
+    tracer.export_chrome_trace("trace.json", tracer.find("张三"))
+
+记录放在有界的环形缓冲区中，超过 MAX_EVENTS 条（环境变量 WXBOT_TRACE_EVENTS，默认5000）时丢弃最早的记录，
+只保留最近一段时间的消息，需要导出时在界面中点击"导出追踪"或调用 index.export_trace()。
+设置环境变量 WXBOT_TRACE=0 关闭追踪。
+"""
+import collections
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+
+# 缓冲区保留的最多记录条数
+DEFAULT_MAX_EVENTS = 5000
+
+# 记录消息内容时截取的长度
+CONTENT_PREVIEW = 50
+
+MESSAGE_CATEGORY = "message"
+
+
+def _max_events_from_env():
+    try:
+        return max(int(os.environ.get("WXBOT_TRACE_EVENTS", "") or DEFAULT_MAX_EVENTS), 1)
+    except ValueError:
+        return DEFAULT_MAX_EVENTS
+
+
+MAX_EVENTS = _max_events_from_env()
+
+
+def _enabled_from_env():
+    return os.environ.get("WXBOT_TRACE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class Tracer:
+    """记录消息处理过程的追踪器
+
+    Args:
+        max_events: 缓冲区保留的最多记录条数
+        enabled: 是否记录，关闭时各方法只做一次判断
+    """
+
+    def __init__(self, max_events=MAX_EVENTS, enabled=True):
+        self.enabled = enabled
+        self._events = collections.deque(maxlen=max_events)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._thread_names = {}
+        # 记录时间用单调时钟，导出时换算为相对 _origin 的微秒数
+        self._origin = time.perf_counter()
+        self._origin_wall = time.time()
+        # 追踪ID -> 消息信息，用于按发送人/内容查找
+        self._messages = collections.OrderedDict()
+        self._max_messages = max(max_events // 4, 1)
+
+    def now(self):
+        """当前时间，作为各方法的 start/end 参数"""
+        return time.perf_counter()
+
+    def _ts(self, t):
+        return round((t - self._origin) * 1e6, 1)
+
+    def _tid(self):
+        thread = threading.current_thread()
+        tid = thread.ident
+        if tid not in self._thread_names:
+            self._thread_names[tid] = thread.name
+        return tid
+
+    def _append(self, *events):
+        with self._lock:
+            self._events.extend(events)
+
+    def start_messages(self, group_name, msgs, fetch_start, fetch_end=None):
+        """给一次轮询抓取到的新消息分配追踪ID，并记录抓取阶段
+
+        Args:
+            group_name: 群聊名称
+            msgs: 新消息列表
+            fetch_start: 开始抓取的时间（now() 的返回值）
+            fetch_end: 抓取完成的时间，为None时取当前时间
+
+        Returns:
+            list: 与 msgs 一一对应的追踪ID，关闭追踪时为空列表
+        """
+        if not self.enabled or not msgs:
+            return []
+        if fetch_end is None:
+            fetch_end = self.now()
+        trace_ids = []
+        events = []
+        infos = []
+        for msg in msgs:
+            trace_id = next(self._ids)
+            trace_ids.append(trace_id)
+            info = {
+                "群聊": group_name,
+                "消息ID": str(getattr(msg, 'id', '')),
+                "发送人": str(getattr(msg, 'sender', '')),
+                "内容": str(getattr(msg, 'content', ''))[:CONTENT_PREVIEW],
+                "消息时间": str(getattr(msg, 'time', '') or ''),
+            }
+            infos.append((trace_id, info))
+            events.extend(self._async_pair(trace_id, "抓取", fetch_start, fetch_end, info))
+        self._append(*events)
+        with self._lock:
+            for trace_id, info in infos:
+                self._messages[trace_id] = info
+            while len(self._messages) > self._max_messages:
+                self._messages.popitem(last=False)
+        return trace_ids
+
+    def _async_pair(self, trace_id, name, start, end, args):
+        tid = self._tid()
+        begin = {"name": name, "cat": MESSAGE_CATEGORY, "ph": "b", "id": trace_id,
+                 "ts": self._ts(start), "pid": self._pid, "tid": tid, "args": args}
+        finish = {"name": name, "cat": MESSAGE_CATEGORY, "ph": "e", "id": trace_id,
+                  "ts": self._ts(max(end, start)), "pid": self._pid, "tid": tid}
+        return begin, finish
+
+    def message_span(self, trace_id, name, start, end=None, **args):
+        """记录一条消息经过的一个阶段
+
+        Args:
+            trace_id: start_messages 分配的追踪ID，为None时不记录
+            name: 阶段名称
+            start: 阶段开始时间（now() 的返回值）
+            end: 阶段结束时间，为None时取当前时间
+            **args: 阶段结果，例如是否重复、订单数
+        """
+        if not self.enabled or trace_id is None:
+            return
+        if end is None:
+            end = self.now()
+        self._append(*self._async_pair(trace_id, name, start, end, args))
+
+    def message_spans(self, trace_ids, name, start, end=None, **args):
+        """给一批消息记录同一个阶段（例如合并写入Excel）"""
+        if not self.enabled or not trace_ids:
+            return
+        if end is None:
+            end = self.now()
+        events = []
+        for trace_id in trace_ids:
+            if trace_id is not None:
+                events.extend(self._async_pair(trace_id, name, start, end, args))
+        self._append(*events)
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """记录当前线程执行一段代码的耗时，在时间线中显示在对应线程下"""
+        if not self.enabled:
+            yield
+            return
+        start = self.now()
+        try:
+            yield
+        finally:
+            end = self.now()
+            self._append({"name": name, "cat": "thread", "ph": "X", "ts": self._ts(start),
+                          "dur": round((end - start) * 1e6, 1), "pid": self._pid,
+                          "tid": self._tid(), "args": args})
+
+    def find(self, text):
+        """按发送人、内容、消息时间或消息ID查找追踪ID"""
+        with self._lock:
+            return [trace_id for trace_id, info in self._messages.items()
+                    if any(text in value for value in info.values())]
+
+    def events(self, trace_ids=None):
+        """缓冲区中的记录，给出 trace_ids 时只返回这些消息的记录"""
+        with self._lock:
+            events = list(self._events)
+        if trace_ids is None:
+            return events
+        wanted = set(trace_ids)
+        return [event for event in events if event.get("id") in wanted]
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._messages.clear()
+
+    def to_chrome_trace(self, trace_ids=None):
+        """生成Chrome trace-event格式的字典"""
+        events = self.events(trace_ids)
+        metadata = [{"name": "process_name", "ph": "M", "pid": self._pid, "args": {"name": "订餐机器人"}}]
+        for tid, name in list(self._thread_names.items()):
+            metadata.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                             "args": {"name": name}})
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "开始时间": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._origin_wall)),
+            },
+        }
+
+    def export_chrome_trace(self, path, trace_ids=None):
+        """写入Chrome trace-event JSON文件（先写临时文件再替换）
+
+        Args:
+            path: 输出文件路径
+            trace_ids: 只导出这些消息，为None时导出全部记录
+
+        Returns:
+            int: 导出的记录条数
+        """
+        trace = self.to_chrome_trace(trace_ids)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return len(trace["traceEvents"])
+
+
+# 全局追踪器
+tracer = Tracer(enabled=_enabled_from_env())
@@ -0,0 +1,97 @@
+"""微信后端选择
+
+默认使用wxauto操作真实的微信窗口；设置环境变量 WXBOT_BACKEND=fake 时
+改用 fake_wechat 中的模拟微信，按时间线文件回放群聊消息，
+可以在Linux上不依赖微信客户端运行监控循环、收集订单和发送汇总。
+
+环境变量:
+    WXBOT_BACKEND: wxauto（默认）或 fake
+    WXBOT_TIMELINE: 模拟微信回放的时间线文件（JSONL），不设置时没有任何消息
+    WXBOT_SPEED: 时钟倍速，大于1时使用加速时钟
+"""
+import os
+import time
+
+import clock
+from bot_logging import get_logger
+from metrics import registry
+
+logger = get_logger(__name__)
+
+BACKEND_WXAUTO = "wxauto"
+BACKEND_FAKE = "fake"
+
+
+# 需要计时的界面操作
+TIMED_METHODS = ("ChatWith", "CurrentChat", "GetAllMessage", "SendMsg", "GetSession", "GetSessionList",
+                 "GetWeChatTitle", "LoadMoreMessage")
+
+
+class InstrumentedWeChat:
+    """给WeChat的界面操作计时的代理，其它属性原样转发
+
+    耗时记录在 wxbot_wechat_call_seconds{method=...}，抛出异常的调用记录在
+    wxbot_wechat_call_errors_total{method=...}。
+    """
+
+    def __init__(self, wx):
+        self._wx = wx
+        self._wrappers = {}
+
+    @property
+    def wrapped(self):
+        """被代理的WeChat实例"""
+        return self._wx
+
+    def __getattr__(self, name):
+        attr = getattr(self._wx, name)
+        if name not in TIMED_METHODS or not callable(attr):
+            return attr
+        wrapper = self._wrappers.get(name)
+        if wrapper is None:
+            wrapper = self._wrappers[name] = self._timed(name)
+        return wrapper
+
+    def _timed(self, name):
+        histogram = registry.histogram("wxbot_wechat_call_seconds", "微信界面操作耗时", "method", name)
+        errors = registry.counter("wxbot_wechat_call_errors_total", "微信界面操作出错次数", "method")
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return getattr(self._wx, name)(*args, **kwargs)
+            except Exception:
+                errors.inc(label=name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return call
+
+
+def get_backend():
+    """当前选择的后端名称"""
+    return os.environ.get("WXBOT_BACKEND", BACKEND_WXAUTO).strip().lower() or BACKEND_WXAUTO
+
+
+def create_wechat(backend=None):
+    """创建WeChat实例，界面操作的耗时会记录到指标中
+
+    Args:
+        backend: 后端名称，为None时读取环境变量 WXBOT_BACKEND
+    """
+    backend = backend or get_backend()
+    if backend == BACKEND_FAKE:
+        from fake_wechat import FakeWeChat, load_timeline
+
+        speed = float(os.environ.get("WXBOT_SPEED", "1") or 1)
+        if speed != 1 and isinstance(clock.get_clock(), clock.SystemClock):
+            clock.set_clock(clock.AcceleratedClock(speed))
+        timeline_path = os.environ.get("WXBOT_TIMELINE")
+        timeline = load_timeline(timeline_path) if timeline_path else []
+        logger.info("使用模拟微信后端，时间线: %s，共%s条消息", timeline_path or '无', len(timeline))
+        return InstrumentedWeChat(FakeWeChat(timeline))
+    if backend != BACKEND_WXAUTO:
+        raise ValueError(f"未知的微信后端: {backend}")
+    # wxauto只能在Windows上导入，选择模拟后端时不需要它
+    from wxauto import WeChat
+    return InstrumentedWeChat(WeChat())
@@ -0,0 +1,275 @@
+"""微信自动化执行线程
+
+WeChat 句柄只由一个线程使用，监控线程、界面线程发起的切换群聊、读取消息、
+发送消息都作为命令放入优先队列，依次执行，避免 ChatWith/SendMsg 交错。
+回复优先于扫描，扫描优先于界面刷新。
+
+每次读取或发送前先读取界面上的当前聊天（CurrentChat），已经是目标聊天时不再调用 ChatWith；
+同一优先级中，针对当前聊天的命令先执行，一个群聊的操作尽量在一次切换内做完。
+"""
+import itertools
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import Gauge, LatencyHistogram, registry
+
+# 命令优先级，数值越小越先执行
+PRIORITY_REPLY = 0
+PRIORITY_SCAN = 1
+PRIORITY_REFRESH = 2
+
+# 针对当前聊天的命令最多连续插队的条数，避免其它群聊的命令一直等待
+MAX_VISIT_COMMANDS = 20
+# 读取历史消息时最多向上加载的次数
+MAX_HISTORY_LOADS = 10
+
+
+def _is_chat(name, who):
+    """界面上的聊天名称是否就是 who，群聊名称后面可能带有成员数，例如 订餐群 (25)"""
+    if not name:
+        return False
+    return name == who or re.fullmatch(re.escape(who) + r'\s*[(（]\d+[)）]', name) is not None
+
+
+class WeChatCommand:
+    """一条自动化命令
+
+    Args:
+        kind: 命令类型，例如 "switch"、"fetch"、"send"
+        func: 实际执行的函数，参数为 WeChat 句柄
+        priority: 优先级
+        chat: 命令要操作的聊天，与聊天无关时为None
+    """
+
+    def __init__(self, kind, func, priority, chat=None):
+        self.kind = kind
+        self.func = func
+        self.priority = priority
+        self.chat = chat
+        self.seq = 0
+        self.future = Future()
+        self.enqueued_at = time.time()
+
+
+class WeChatActor:
+    """唯一持有 WeChat 句柄的自动化线程
+
+    Args:
+        wx: WeChat 实例
+    """
+
+    def __init__(self, wx):
+        self.wx = wx
+        # 等待执行的命令，取出时按 (优先级, 是否不是当前聊天, 提交顺序) 选择
+        self._pending = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._thread = None
+        self._running = False
+        # 最后一次确认打开的聊天，用于按聊天合并命令，只在执行线程中读写
+        self.current_chat = None
+        # 连续插队执行的当前聊天命令数
+        self._visit_commands = 0
+        # 切换聊天的统计：switched 实际切换，verified 读取当前聊天确认无需切换
+        self.chat_switches = registry.counter("wxbot_chat_switches_total", "切换聊天的次数", "result")
+        # 为了在同一次切换内做完而提前执行的命令数
+        self.regrouped = registry.counter("wxbot_automation_regrouped_total", "按聊天合并提前执行的命令数")
+        # 向上加载历史消息的次数
+        self.history_loads = registry.counter("wxbot_history_loads_total", "向上加载历史消息的次数")
+        # 队列中等待执行的命令数量
+        self.queue_depth = registry.gauge("wxbot_automation_queue_depth", "自动化队列长度",
+                                          gauge=Gauge("自动化队列长度"))
+        # 命令从提交到开始执行的等待时间
+        self.wait_latency = registry.histogram("wxbot_automation_wait_seconds", "自动化命令排队等待时间",
+                                               histogram=LatencyHistogram("自动化排队等待"))
+        # 各类命令的执行耗时
+        self.exec_latency = {}
+
+    def start(self):
+        """启动执行线程"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="WeChatActor")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """停止执行线程，已提交的命令会先执行完"""
+        with self._lock:
+            if not self._thread:
+                return
+            self._running = False
+            self._not_empty.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+
+    def in_actor_thread(self):
+        """当前是否在执行线程中"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, kind, func, priority=PRIORITY_SCAN, chat=None):
+        """提交命令，返回 Future"""
+        command = WeChatCommand(kind, func, priority, chat)
+        if self.in_actor_thread():
+            # 执行线程内部嵌套调用时直接执行，避免自己等待自己
+            self._execute(command)
+            return command.future
+        if not self._running:
+            self.start()
+        with self._lock:
+            command.seq = next(self._seq)
+            self._pending.append(command)
+            self.queue_depth.set(len(self._pending))
+            self._not_empty.notify()
+        return command.future
+
+    def call(self, kind, func, priority=PRIORITY_SCAN, timeout=None, chat=None):
+        """提交命令并等待结果"""
+        return self.submit(kind, func, priority, chat).result(timeout)
+
+    # 当前聊天
+
+    def ensure_chat(self, wx, who):
+        """确保当前打开的是 who，只能在执行线程中调用
+
+        每次都读取界面上的当前聊天确认，有人手动切换了聊天也不会读错、发错群聊；
+        读取当前聊天比 ChatWith 便宜得多。后端不支持读取当前聊天时每次都调用 ChatWith。
+
+        Returns:
+            bool: 是否已经打开，找不到聊天时返回False
+        """
+        current_chat = getattr(wx, 'CurrentChat', None)
+        if current_chat is not None:
+            try:
+                if _is_chat(current_chat(), who):
+                    self.current_chat = who
+                    self.chat_switches.inc(1, "verified")
+                    return True
+            except Exception:
+                pass
+        self.current_chat = None
+        if not wx.ChatWith(who=who):
+            return False
+        self.current_chat = who
+        self.chat_switches.inc(1, "switched")
+        return True
+
+    def invalidate_chat(self):
+        """忘记当前聊天，下一次操作会重新切换，例如界面操作出错后状态不确定时"""
+        self.current_chat = None
+
+    # 常用命令
+
+    def switch(self, who, priority=PRIORITY_SCAN):
+        """切换到指定聊天"""
+        return self.call("switch", lambda wx: self.ensure_chat(wx, who), priority, chat=who)
+
+    def fetch(self, who, priority=PRIORITY_SCAN):
+        """切换到指定聊天并读取全部消息，找不到聊天时返回None"""
+        def fetch_messages(wx):
+            if not self.ensure_chat(wx, who):
+                return None
+            return wx.GetAllMessage()
+        return self.call("fetch", fetch_messages, priority, chat=who)
+
+    def fetch_history(self, who, is_complete, max_loads=MAX_HISTORY_LOADS, priority=PRIORITY_SCAN):
+        """切换到指定聊天并读取消息，is_complete(msgs) 返回False时向上加载更多历史再读取
+        
+        直到 is_complete 返回True、没有更多历史或加载了 max_loads 次，不支持加载历史的后端只读取一次。
+        找不到聊天时返回None。
+        """
+        def fetch_messages(wx):
+            if not self.ensure_chat(wx, who):
+                return None
+            msgs = wx.GetAllMessage()
+            load_more = getattr(wx, 'LoadMoreMessage', None)
+            loads = 0
+            while load_more is not None and loads < max_loads and not is_complete(msgs):
+                if not load_more():
+                    break
+                loads += 1
+                self.history_loads.inc()
+                msgs = wx.GetAllMessage()
+            return msgs
+        return self.call("fetch_history", fetch_messages, priority, chat=who)
+
+    def send(self, msg, who, priority=PRIORITY_REPLY):
+        """切换到指定聊天并发送消息"""
+        def send_message(wx):
+            if not self.ensure_chat(wx, who):
+                raise RuntimeError(f"无法切换到聊天: {who}")
+            # 同时指定接收人，发送前微信再确认一次当前聊天
+            return wx.SendMsg(msg, who=who)
+        return self.call("send", send_message, priority, chat=who)
+
+    def execute(self, kind, func, priority=PRIORITY_SCAN, chat=None):
+        """执行任意需要 WeChat 句柄的操作，例如读取会话列表
+        
+        func 中如果切换了聊天，需要用 ensure_chat 切换或调用 invalidate_chat。
+        """
+        return self.call(kind, func, priority, chat=chat)
+
+    def _execute(self, command):
+        if not command.future.set_running_or_notify_cancel():
+            return
+        start = time.time()
+        self.wait_latency.observe(start - command.enqueued_at)
+        try:
+            result = command.func(self.wx)
+        except Exception as e:
+            # 界面操作出错后不确定停在哪个聊天
+            self.invalidate_chat()
+            command.future.set_exception(e)
+        else:
+            command.future.set_result(result)
+        histogram = self.exec_latency.get(command.kind)
+        if histogram is None:
+            histogram = self.exec_latency.setdefault(command.kind, registry.histogram(
+                "wxbot_automation_exec_seconds", "自动化命令执行耗时", "kind", command.kind,
+                histogram=LatencyHistogram(f"微信操作[{command.kind}]")))
+        histogram.observe(time.time() - start)
+
+    def _take(self):
+        """取出下一条命令，需要持有锁
+        
+        优先级最高的命令中，针对当前聊天的先执行；连续插队超过 MAX_VISIT_COMMANDS 条后按提交顺序。
+        """
+        prefer_current = self.current_chat is not None and self._visit_commands < MAX_VISIT_COMMANDS
+        best = min(self._pending, key=lambda command: (
+            command.priority, not (prefer_current and command.chat == self.current_chat), command.seq))
+        first = min(self._pending, key=lambda command: (command.priority, command.seq))
+        if best is not first:
+            self._visit_commands += 1
+            self.regrouped.inc()
+        else:
+            self._visit_commands = 0
+        self._pending.remove(best)
+        self.queue_depth.set(len(self._pending))
+        return best
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    if not self._running:
+                        return
+                    self._not_empty.wait()
+                command = self._take()
+            self._execute(command)
+
+    def switch_summary(self):
+        """切换聊天的统计"""
+        switched = self.chat_switches.get("switched")
+        saved = self.chat_switches.get("verified")
+        return f"切换聊天: 实际切换{switched:g}次，省去{saved:g}次，按聊天合并提前执行{self.regrouped.get():g}条命令"
+
+    def summary(self):
+        """生成可读的统计信息"""
+        lines = [f"自动化队列长度: {self.queue_depth.get()}", self.wait_latency.summary(), self.switch_summary()]
+        lines.extend(histogram.summary() for histogram in list(self.exec_latency.values()))
+        return "\n".join(lines)